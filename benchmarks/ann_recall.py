@@ -0,0 +1,104 @@
+"""Recall@k vs. latency of the approximate "ivf_vdb" backend against the exact scan.
+
+Builds an IVF index over synthetic clustered vectors in a temporary directory and
+sweeps `nprobe`, so an operating point for `ivf_nprobe` can be chosen.
+
+Usage:
+    python -m benchmarks.ann_recall --vectors 200000 --embedding-dim 768
+"""
+
+import argparse
+import tempfile
+import time
+import numpy
+from rag_pipeline.db.base import AbstractDB
+from rag_pipeline.db.ivf_vdb import IVFDB
+from rag_pipeline.db.mmap_vdb import MmapDB
+
+
+def synthetic_vectors(
+    n: int, dim: int, n_topics: int, rng: numpy.random.Generator
+) -> numpy.ndarray:
+    """Generates vectors clustered around random topic centers, like real embeddings.
+
+    Args:
+        n (int): Number of vectors.
+        dim (int): Vector dimension.
+        n_topics (int): Number of topic centers.
+        rng (numpy.random.Generator): The random generator.
+
+    Returns:
+        numpy.ndarray: (n, dim) float32 vectors.
+    """
+    centers = rng.standard_normal((n_topics, dim)).astype(numpy.float32)
+    topics = rng.integers(0, n_topics, n)
+    noise = rng.standard_normal((n, dim)).astype(numpy.float32)
+    return centers[topics] + noise
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--embedding-dim", type=int, default=768)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = numpy.random.default_rng(0)
+    vectors = synthetic_vectors(args.vectors, args.embedding_dim, 1000, rng)
+    queries = synthetic_vectors(args.queries, args.embedding_dim, 1000, rng)
+
+    with tempfile.TemporaryDirectory() as dir_vector_db:
+        config = {
+            "embedding_dim": args.embedding_dim,
+            "dir_vector_db": dir_vector_db,
+            "ivf_nlist": args.nlist,
+        }
+        db = AbstractDB.create("ivf_vdb", config)
+
+        for start in range(0, len(vectors), 10000):
+            db.upsert(
+                [
+                    {"__id__": f"chunk-{start + i}", "__vector__": vector}
+                    for i, vector in enumerate(vectors[start : start + 10000])
+                ]
+            )
+
+        start = time.perf_counter()
+        db.save()
+        print(
+            f"{args.vectors} vectors, {len(db.centroids)} lists, "
+            f"built in {time.perf_counter() - start:.2f}s"
+        )
+
+        start = time.perf_counter()
+        exact = [
+            {r["__id__"] for r in MmapDB.query_db(db, query, args.top_k)}
+            for query in queries
+        ]
+        exact_latency = (time.perf_counter() - start) / len(queries)
+        print(
+            f"exact   recall@{args.top_k}=1.000  {exact_latency * 1000:8.3f} ms/query"
+        )
+
+        for nprobe in args.nprobe:
+            db.nprobe = nprobe
+            start = time.perf_counter()
+            approx = [
+                {r["__id__"] for r in db.query_db(query, args.top_k)}
+                for query in queries
+            ]
+            latency = (time.perf_counter() - start) / len(queries)
+            recall = numpy.mean(
+                [len(a & e) / args.top_k for a, e in zip(approx, exact)]
+            )
+            print(
+                f"nprobe={nprobe:<3} recall@{args.top_k}={recall:.3f}  "
+                f"{latency * 1000:8.3f} ms/query"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Concurrent `NaiveRAG.aquery` calls against the "fake" API with injected latency.
+
+With the async path, the total time of N concurrent queries stays close to one
+query's latency instead of growing with N.
+
+Usage:
+    python -m benchmarks.async_concurrency --queries 500 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+import numpy
+from rag_pipeline.naiverag import NaiveRAG
+
+
+def build_config(dir_root: str, embedding_dim: int, latency: float) -> dict:
+    """Returns the config of a NaiveRAG on the "fake" API.
+
+    Args:
+        dir_root (str): Directory for the DBs.
+        embedding_dim (int): Vector dimension.
+        latency (float): Injected latency per API call in seconds.
+
+    Returns:
+        dict: The config.
+    """
+    return {
+        "api_implementation_name": "fake",
+        "api_key": None,
+        "llm_model_name": "fake",
+        "embedding_model_name": "fake",
+        "fake_latency": latency,
+        "chunking_implementation_name": "token_size",
+        "overlap_token_size": 50,
+        "max_token_size": 1000,
+        "tokenizer": "cl100k_base",
+        "db_implementation_name": "mmap_vdb",
+        "embedding_dim": embedding_dim,
+        "dir_text_chunks": dir_root,
+        "dir_vector_db": dir_root,
+    }
+
+
+def build_rag(dir_root: str, chunks: int, embedding_dim: int, latency: float):
+    """Creates a NaiveRAG on the "fake" API with a synthetic index.
+
+    Args:
+        dir_root (str): Directory for the DBs.
+        chunks (int): Number of synthetic chunks.
+        embedding_dim (int): Vector dimension.
+        latency (float): Injected latency per API call in seconds.
+
+    Returns:
+        NaiveRAG: The RAG.
+    """
+    config = build_config(dir_root, embedding_dim, latency)
+    naiverag = NaiveRAG(config)
+
+    vectors = numpy.random.default_rng(0).standard_normal((chunks, embedding_dim))
+    naiverag.vdb.update(
+        [{"__id__": f"chunk-{i}", "__vector__": v} for i, v in enumerate(vectors)]
+    )
+    naiverag.text_chunks_db.upsert(
+        {
+            f"chunk-{i}": {
+                "content": f"synthetic chunk {i}",
+                "tokens": 3,
+                "chunk_order_index": i % 100,
+                "full_doc_id": f"doc-{i // 100}.txt",
+            }
+            for i in range(chunks)
+        }
+    )
+    naiverag.text_chunks_db.save()
+    return naiverag
+
+
+async def run_concurrently(naiverag: NaiveRAG, queries: list) -> list:
+    return await asyncio.gather(*(naiverag.aquery(query) for query in queries))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--chunks", type=int, default=10000)
+    parser.add_argument("--embedding-dim", type=int, default=768)
+    args = parser.parse_args()
+
+    queries = [f"question {i}" for i in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as dir_root:
+        naiverag = build_rag(dir_root, args.chunks, args.embedding_dim, args.latency)
+
+        start = time.perf_counter()
+        naiverag.query(queries[0])
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        asyncio.run(run_concurrently(naiverag, queries))
+        concurrent = time.perf_counter() - start
+
+    print(f"single query:                 {single:.2f}s")
+    print(
+        f"{args.queries} concurrent aquery: {concurrent:.2f}s "
+        f"({args.queries / concurrent:,.0f} queries/s; sequential estimate "
+        f"{single * args.queries:.0f}s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Offline chunking throughput benchmark.
+
+Compares the "token_size" chunker, which decodes every token window, with the
+"token_size_fast" chunker, which slices windows out of the source text and encodes
+many documents at once.
+
+Usage:
+    python -m benchmarks.chunking_throughput --documents 200 --words 5000
+"""
+
+import argparse
+import random
+import time
+from rag_pipeline.chunking.base import AbstractChunking
+from rag_pipeline.chunking.token_size import ChunkingByTokenSize
+from rag_pipeline.chunking.fast_token_size import FastChunkingByTokenSize
+
+WORDS = (
+    "the of retrieval vector embedding chunk query index document über naïve".split()
+)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--words", type=int, default=5000)
+    parser.add_argument("--max-token-size", type=int, default=1200)
+    parser.add_argument("--overlap-token-size", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    contents = [
+        " ".join(rng.choice(WORDS) for _ in range(args.words))
+        for _ in range(args.documents)
+    ]
+
+    config = {
+        "tokenizer": "cl100k_base",
+        "max_token_size": args.max_token_size,
+        "overlap_token_size": args.overlap_token_size,
+        "chunking_num_threads": args.threads,
+    }
+
+    for name in ["token_size", "token_size_fast"]:
+        chunking = AbstractChunking.create(name, config)
+        chunking.chunk_batch(contents[:1])  # warm up the encoding
+
+        start = time.perf_counter()
+        count = sum(len(chunks) for chunks in chunking.chunk_batch(contents))
+        duration = time.perf_counter() - start
+
+        print(
+            f"{name:<16} {count} chunks in {duration:.2f}s "
+            f"({count / duration:,.0f} chunks/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
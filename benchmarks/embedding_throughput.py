@@ -0,0 +1,49 @@
+"""Offline embedding throughput benchmark.
+
+Compares a single `embed` call over the whole corpus with the batched, concurrent
+`embed_in_batches` pipeline, using the "fake" embedding with injected latency.
+
+Usage:
+    python -m benchmarks.embedding_throughput --chunks 10000 --latency 0.2
+"""
+
+import argparse
+import time
+from rag_pipeline.api.base import AbstractEmbedding
+from rag_pipeline.api.fake import FakeEmbedding
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=10000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--embedding-dim", type=int, default=768)
+    args = parser.parse_args()
+
+    texts = [f"synthetic chunk {i}" for i in range(args.chunks)]
+
+    for concurrency in args.concurrency:
+        config = {
+            "embedding_model_name": "fake",
+            "api_key": None,
+            "embedding_dim": args.embedding_dim,
+            "fake_latency": args.latency,
+            "embedding_batch_size": args.batch_size,
+            "embedding_max_concurrency": concurrency,
+        }
+        embedding = AbstractEmbedding.create("fake", config)
+
+        start = time.perf_counter()
+        count = sum(len(vectors) for _, vectors in embedding.embed_in_batches(texts))
+        duration = time.perf_counter() - start
+
+        print(
+            f"batch_size={args.batch_size:<5} concurrency={concurrency:<3} "
+            f"{count} chunks in {duration:.2f}s ({count / duration:,.0f} chunks/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
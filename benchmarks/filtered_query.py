@@ -0,0 +1,68 @@
+"""Offline filtered query latency benchmark.
+
+Tags synthetic vectors with documents of different sizes and measures `query_db`
+latency of a vector DB with filters of decreasing selectivity.
+
+Usage:
+    python -m benchmarks.filtered_query --vectors 200000 --backend mmap_vdb
+"""
+
+import argparse
+import tempfile
+import time
+import numpy
+from rag_pipeline.db.base import AbstractDB
+from rag_pipeline.naiverag import NaiveRAG  # registers the DB implementations
+from benchmarks.ann_recall import synthetic_vectors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--embedding-dim", type=int, default=768)
+    parser.add_argument("--backend", default="mmap_vdb")
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = numpy.random.default_rng(0)
+    vectors = synthetic_vectors(args.vectors, args.embedding_dim, 100, rng)
+    queries = synthetic_vectors(args.queries, args.embedding_dim, 100, rng)
+
+    # "part-<n>" is attached to every n-th vector
+    fractions = [1, 10, 100, 1000]
+
+    with tempfile.TemporaryDirectory() as dir_vector_db:
+        config = {"embedding_dim": args.embedding_dim, "dir_vector_db": dir_vector_db}
+        db = AbstractDB.create(args.backend, config)
+        db.upsert(
+            [
+                {
+                    "__id__": f"chunk-{i}",
+                    "__vector__": vector,
+                    "__metadata__": {
+                        "tags": [f"part-{n}" for n in fractions if i % n == 0]
+                    },
+                }
+                for i, vector in enumerate(vectors)
+            ]
+        )
+        db.save()
+
+        for n in fractions:
+            filters = {"tags": f"part-{n}"}
+            db.query_db(queries[0], args.top_k, filters=filters)  # warm up
+
+            start = time.perf_counter()
+            for query in queries:
+                db.query_db(query, args.top_k, filters=filters)
+            duration = (time.perf_counter() - start) / len(queries)
+
+            print(
+                f"{args.backend} filter passing 1/{n:<5} of vectors: "
+                f"{duration * 1000:.2f}ms per query"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Offline BM25 query latency benchmark.
+
+Indexes a synthetic corpus with a Zipf-distributed vocabulary (a few very common
+words, many rare ones such as identifiers) and measures the latency of queries made
+of distinct words of random indexed chunks.
+
+Usage:
+    python -m benchmarks.lexical_latency --chunks 1000000 --queries 1000
+"""
+
+import argparse
+import tempfile
+import time
+import numpy
+from rag_pipeline.bm25 import BM25Index
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--words", type=int, default=150)
+    parser.add_argument("--vocabulary", type=int, default=500000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = numpy.random.default_rng(0)
+
+    def text(words: int) -> str:
+        ranks = numpy.minimum(rng.zipf(1.2, words), args.vocabulary)
+        return " ".join(f"w{rank}" for rank in ranks)
+
+    with tempfile.TemporaryDirectory() as dir_index:
+        index = BM25Index(dir_index, {})
+
+        queries = []
+        start = time.perf_counter()
+        for offset in range(0, args.chunks, 10000):
+            count = min(10000, args.chunks - offset)
+            chunks = {f"chunk-{offset + i}": text(args.words) for i in range(count)}
+            index.upsert(chunks)
+            index.save()
+
+            # queries ask about distinct words of indexed chunks
+            for content in list(chunks.values())[: args.queries // 10 + 1]:
+                queries.append(" ".join(rng.choice(sorted(set(content.split())), 4)))
+        duration = time.perf_counter() - start
+        print(
+            f"indexed {args.chunks} chunks in {duration:.1f}s "
+            f"({args.chunks / duration:,.0f} chunks/s), "
+            f"{len(index.segments)} segments"
+        )
+
+        index = BM25Index(dir_index, {})
+
+        latencies = []
+        for query in rng.choice(queries, args.queries):
+            start = time.perf_counter()
+            index.query(query, top_k=args.top_k)
+            latencies.append(time.perf_counter() - start)
+
+        latencies = numpy.array(latencies) * 1000
+        print(
+            f"{args.queries} queries: p50 {numpy.percentile(latencies, 50):.3f}ms, "
+            f"p95 {numpy.percentile(latencies, 95):.3f}ms, "
+            f"p99 {numpy.percentile(latencies, 99):.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Memory footprint and recall@k of the "quantized_vdb" backend against the exact
+float32 scan, for int8 and product quantization with and without re-ranking.
+
+Usage:
+    python -m benchmarks.quantization_recall --vectors 100000 --embedding-dim 768
+"""
+
+import argparse
+import tempfile
+import time
+import numpy
+from rag_pipeline.db.base import AbstractDB
+from rag_pipeline.db.mmap_vdb import MmapDB
+from rag_pipeline.db.quantized_vdb import QuantizedDB
+from benchmarks.ann_recall import synthetic_vectors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--embedding-dim", type=int, default=768)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--pq-subvectors", type=int, default=96)
+    parser.add_argument("--rerank-factor", type=int, nargs="+", default=[0, 4, 16])
+    args = parser.parse_args()
+
+    rng = numpy.random.default_rng(0)
+    vectors = synthetic_vectors(args.vectors, args.embedding_dim, 1000, rng)
+    queries = synthetic_vectors(args.queries, args.embedding_dim, 1000, rng)
+
+    for quantization in ("int8", "pq"):
+        with tempfile.TemporaryDirectory() as dir_vector_db:
+            config = {
+                "embedding_dim": args.embedding_dim,
+                "dir_vector_db": dir_vector_db,
+                "vdb_quantization": quantization,
+                "pq_subvectors": args.pq_subvectors,
+            }
+            db = AbstractDB.create("quantized_vdb", config)
+
+            for start in range(0, len(vectors), 10000):
+                db.upsert(
+                    [
+                        {"__id__": f"chunk-{start + i}", "__vector__": vector}
+                        for i, vector in enumerate(vectors[start : start + 10000])
+                    ]
+                )
+
+            start = time.perf_counter()
+            db.save()
+            build_time = time.perf_counter() - start
+
+            footprint = db.memory_footprint()
+            print(
+                f"{quantization}: trained and encoded in {build_time:.2f}s, "
+                f"{footprint['quantized_bytes'] / 2**20:.1f} MiB vs. "
+                f"{footprint['float32_bytes'] / 2**20:.1f} MiB float32 "
+                f"({footprint['compression']:.1f}x smaller)"
+            )
+
+            exact = [
+                {r["__id__"] for r in MmapDB.query_db(db, query, args.top_k)}
+                for query in queries
+            ]
+
+            for rerank_factor in args.rerank_factor:
+                db.rerank_factor = rerank_factor
+                start = time.perf_counter()
+                approx = [
+                    {r["__id__"] for r in db.query_db(query, args.top_k)}
+                    for query in queries
+                ]
+                latency = (time.perf_counter() - start) / len(queries)
+                recall = numpy.mean(
+                    [len(a & e) / args.top_k for a, e in zip(approx, exact)]
+                )
+                print(
+                    f"  rerank_factor={rerank_factor:<3} recall@{args.top_k}="
+                    f"{recall:.3f}  {latency * 1000:8.3f} ms/query"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Sustained QPS of `server.py` against one-shot processes, on the "fake" API.
+
+Starts the server in-process on a synthetic index and lets `--clients` threads
+send queries over keep-alive connections. A share of `--repeat` of the queries is
+the same popular question, which the server answers once while it is in flight.
+For comparison, `--one-shot` processes each construct a NaiveRAG, load the DB and
+answer one query, like `run.py`.
+
+Usage:
+    python -m benchmarks.server_qps --queries 2000 --clients 32 --latency 0.05
+"""
+
+import argparse
+import http.client
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from benchmarks.async_concurrency import build_rag
+from server import RAGServer
+
+
+def run_clients(port: int, queries: list, clients: int) -> float:
+    """Sends the queries from `clients` threads and returns the elapsed seconds."""
+    per_client = [queries[i::clients] for i in range(clients)]
+
+    def client(batch: list) -> None:
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        for query in batch:
+            connection.request(
+                "POST",
+                "/query",
+                body=json.dumps({"query": query}),
+                headers={"Content-Type": "application/json"},
+            )
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                raise RuntimeError(f"Query failed with status {response.status}")
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(b,)) for b in per_client]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def run_one_shot(dir_root: str, args: argparse.Namespace) -> float:
+    """Runs `--one-shot` processes that each load the DB and answer one query, and
+    returns the elapsed seconds."""
+    code = (
+        "import sys\n"
+        "from benchmarks.async_concurrency import build_config\n"
+        "from rag_pipeline.naiverag import NaiveRAG\n"
+        "config = build_config(sys.argv[1], int(sys.argv[2]), float(sys.argv[3]))\n"
+        "naiverag = NaiveRAG(config)\n"
+        "naiverag.load_db()\n"
+        "naiverag.query('question')\n"
+    )
+    start = time.perf_counter()
+    for _ in range(args.one_shot):
+        subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                code,
+                dir_root,
+                str(args.embedding_dim),
+                str(args.latency),
+            ],
+            check=True,
+        )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--repeat", type=float, default=0.5)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--chunks", type=int, default=10000)
+    parser.add_argument("--embedding-dim", type=int, default=768)
+    parser.add_argument("--one-shot", type=int, default=5)
+    args = parser.parse_args()
+
+    queries = [
+        "popular question" if i % 100 < args.repeat * 100 else f"question {i}"
+        for i in range(args.queries)
+    ]
+
+    with tempfile.TemporaryDirectory() as dir_root:
+        naiverag = build_rag(dir_root, args.chunks, args.embedding_dim, args.latency)
+        naiverag.vdb.save()
+
+        server = RAGServer(("127.0.0.1", 0), naiverag, naiverag.config)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            duration = run_clients(server.server_address[1], queries, args.clients)
+        finally:
+            server.shutdown()
+            server.server_close()
+        print(
+            f"server:   {len(queries) / duration:,.1f} QPS "
+            f"({len(queries)} queries, {args.clients} clients, "
+            f"{server.coalescer.coalesced} coalesced)"
+        )
+
+        if args.one_shot:
+            duration = run_one_shot(dir_root, args)
+            print(
+                f"one-shot: {args.one_shot / duration:,.1f} QPS "
+                f"({args.one_shot} processes)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Offline sharded query latency benchmark.
+
+Measures `query_db` latency of a single memory-mapped DB and of `sharded_vdb` with
+an increasing number of shards, each searched by its own worker process. On a
+machine with enough cores the latency drops with the number of shards.
+
+Usage:
+    python -m benchmarks.sharded_query --vectors 1000000 --shards 1 2 4 8
+"""
+
+import argparse
+import tempfile
+import time
+import numpy
+from rag_pipeline.db.base import AbstractDB
+from rag_pipeline.naiverag import NaiveRAG  # registers the DB implementations
+from benchmarks.ann_recall import synthetic_vectors
+
+
+def measure(db: AbstractDB, queries: numpy.ndarray, top_k: int) -> float:
+    db.query_db(queries[0], top_k)  # warm up, starts the workers
+    start = time.perf_counter()
+    for query in queries:
+        db.query_db(query, top_k)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=500000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--embedding-dim", type=int, default=768)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = numpy.random.default_rng(0)
+    vectors = synthetic_vectors(args.vectors, args.embedding_dim, 100, rng)
+    queries = synthetic_vectors(args.queries, args.embedding_dim, 100, rng)
+    data = [{"__id__": f"chunk-{i}", "__vector__": v} for i, v in enumerate(vectors)]
+
+    with tempfile.TemporaryDirectory() as dir_vector_db:
+        config = {"embedding_dim": args.embedding_dim, "dir_vector_db": dir_vector_db}
+        db = AbstractDB.create("mmap_vdb", config)
+        db.update(data)
+        duration = measure(db, queries, args.top_k)
+        print(f"mmap_vdb: {duration * 1000:.2f}ms per query")
+
+    for shards in args.shards:
+        with tempfile.TemporaryDirectory() as dir_vector_db:
+            config = {
+                "embedding_dim": args.embedding_dim,
+                "dir_vector_db": dir_vector_db,
+                "vdb_shards": shards,
+            }
+            db = AbstractDB.create("sharded_vdb", config)
+            db.update(data)
+            duration = measure(db, queries, args.top_k)
+            db.close()
+            print(f"sharded_vdb, {shards} shards: {duration * 1000:.2f}ms per query")
+
+
+if __name__ == "__main__":
+    main()
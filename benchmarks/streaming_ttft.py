@@ -0,0 +1,55 @@
+"""Time-to-first-token of `NaiveRAG.query_stream` vs. full-response latency of
+`NaiveRAG.query`, against the "fake" API with per-token latency.
+
+Usage:
+    python -m benchmarks.streaming_ttft --latency 0.3 --token-latency 0.02
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from benchmarks.async_concurrency import build_rag
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--chunks", type=int, default=10000)
+    parser.add_argument("--embedding-dim", type=int, default=768)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dir_root:
+        naiverag = build_rag(dir_root, args.chunks, args.embedding_dim, 0.0)
+        naiverag.llm.latency = args.latency
+        naiverag.llm.token_latency = args.token_latency
+
+        full, sources, first_token = [], [], []
+        for i in range(args.queries):
+            query = f"question {i}"
+
+            start = time.perf_counter()
+            naiverag.query(query)
+            full.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            stream = naiverag.query_stream(query)
+            next(stream)
+            sources.append(time.perf_counter() - start)
+            next(stream)
+            first_token.append(time.perf_counter() - start)
+            for _ in stream:
+                pass
+
+    for label, values in (
+        ("sources", sources),
+        ("first token", first_token),
+        ("full response", full),
+    ):
+        print(f"{label:<14} median {statistics.median(values) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
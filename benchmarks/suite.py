@@ -0,0 +1,415 @@
+"""Reproducible offline benchmark suite for indexing and querying.
+
+Generates a synthetic corpus of about `--scales` chunks with a Zipf-distributed
+vocabulary and indexes it with the deterministic "fake" LLM and embedding
+implementations, so no API is called and every run sees the same data. Documents
+are generated one at a time and streamed through `update_db`, so the corpus is
+never held in memory. Measured per scale:
+    - chunking throughput (chunks/s, tokens/s)
+and per scale and vector DB backend, building and serving each in a fresh process
+so every peak RSS is its own:
+    - update_db time, with the time spent in the vector DB, and peak RSS of the build
+    - load_db time of a new instance (the OS page cache stays warm)
+    - query_db latency percentiles and QPS, and query_db_batch QPS
+    - peak RSS of loading and querying
+
+Results are written as JSON to `--output` and compared with the baseline
+(`--baseline`): metrics more than `--tolerance` worse are flagged as regressions
+and make the suite exit with status 1. `--save-baseline` stores the results as the
+new baseline instead. Baselines depend on the machine, so none is committed: a
+missing baseline is an error before anything runs, unless `--baseline ""` asks
+for measurements only.
+
+Usage:
+    python -m benchmarks.suite --scales 10000 100000 --backends mmap_vdb ivf_vdb
+    python -m benchmarks.suite --scales 10000 --save-baseline
+    python -m benchmarks.suite --scales 10000 --baseline ""
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Iterable, Iterator
+from itertools import islice
+import numpy
+from rag_pipeline.db.base import AbstractDB
+from rag_pipeline.naiverag import NaiveRAG
+from util.instrumentation import metrics
+
+# whether higher values of a metric are better
+METRICS = {
+    "chunks_per_second": True,
+    "tokens_per_second": True,
+    "update_db_seconds": False,
+    "vdb_write_seconds": False,
+    "load_db_seconds": False,
+    "query_p50_ms": False,
+    "query_p95_ms": False,
+    "query_p99_ms": False,
+    "qps": True,
+    "batch_qps": True,
+    "build_peak_rss_mb": False,
+    "peak_rss_mb": False,
+}
+
+
+def synthetic_documents(
+    num_chunks: int,
+    max_token_size: int,
+    vocabulary: int,
+    seed: int,
+    overlap_token_size: int = 0,
+) -> Iterator[dict]:
+    """Generates documents of random words with a Zipf-distributed vocabulary, one
+    at a time. Every document is long enough for about 50 chunks.
+
+    Args:
+        num_chunks (int): Approximate number of chunks of the corpus.
+        max_token_size (int): Tokens per chunk.
+        vocabulary (int): Number of distinct words.
+        seed (int): Seed of the random generator.
+        overlap_token_size (int, optional): Tokens shared by consecutive chunks.
+            Defaults to 0.
+
+    Yields:
+        dict: The next document with "page_content" and "metadata".
+    """
+    rng = numpy.random.default_rng(seed)
+    words = numpy.array([f"w{rank}" for rank in range(vocabulary + 1)])
+
+    # "wN " takes about two tokens
+    words_per_document = 50 * (max_token_size - overlap_token_size) // 2
+    for i in range(num_chunks // 50 + 1):
+        ranks = numpy.minimum(rng.zipf(1.2, words_per_document), vocabulary)
+        yield {
+            "page_content": " ".join(words[ranks]),
+            "metadata": {"source": f"document-{i}.txt"},
+        }
+
+
+def make_config(args: argparse.Namespace, backend: str, tmp_dir: str) -> dict:
+    config = {
+        "rag_implementation_name": "naiverag",
+        "api_implementation_name": "fake",
+        "api_key": None,
+        "llm_model_name": "fake",
+        "embedding_model_name": "fake",
+        "embedding_dim": args.embedding_dim,
+        "chunking_implementation_name": "token_size_fast",
+        "tokenizer": "cl100k_base",
+        "max_token_size": args.max_token_size,
+        "overlap_token_size": args.overlap_token_size,
+        "db_implementation_name": backend,
+        "text_db_implementation_name": "blob",
+        "lexical_search_enabled": args.lexical,
+        "metrics_enabled": True,
+        "top_k": args.top_k,
+        "dir_doc_store": os.path.join(tmp_dir, "doc_store"),
+        "dir_text_chunks": os.path.join(tmp_dir, "text_chunks"),
+        "dir_vector_db": os.path.join(tmp_dir, "vector_db"),
+    }
+    for key in ("dir_doc_store", "dir_text_chunks", "dir_vector_db"):
+        os.makedirs(config[key], exist_ok=True)
+    return config
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def iter_chunks(rag: NaiveRAG, documents: Iterable[dict]) -> Iterator[dict]:
+    """Chunks documents in batches of `chunking_batch_size`, like `update_db`."""
+    documents = iter(documents)
+    batch_size = rag.config.get("chunking_batch_size", 16)
+    while batch := list(islice(documents, batch_size)):
+        yield from rag.chunk(batch)
+
+
+def corpus(args: argparse.Namespace, scale: int) -> Iterator[dict]:
+    return synthetic_documents(
+        scale,
+        args.max_token_size,
+        args.vocabulary,
+        args.seed,
+        args.overlap_token_size,
+    )
+
+
+def run_chunking(args: argparse.Namespace, scale: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rag = NaiveRAG(make_config(args, "mmap_vdb", tmp_dir))
+        next(iter_chunks(rag, corpus(args, 1)))  # warm up the encoding
+
+        chunks = tokens = 0
+        start = time.perf_counter()
+        for chunk in iter_chunks(rag, corpus(args, scale)):
+            chunks += 1
+            tokens += chunk["tokens"]
+        duration = time.perf_counter() - start
+    return {
+        "chunks": chunks,
+        "chunks_per_second": chunks / duration,
+        "tokens_per_second": tokens / duration,
+    }
+
+
+def run_build(args: argparse.Namespace, scale: int, backend: str, tmp_dir: str) -> dict:
+    """Streams the corpus of a scale through `update_db` into `tmp_dir`."""
+    rag = NaiveRAG(make_config(args, backend, tmp_dir))
+
+    metrics.reset()
+    start = time.perf_counter()
+    rag.update_db(corpus(args, scale), [])
+    update_db_seconds = time.perf_counter() - start
+    spans = metrics.snapshot()["spans"]
+    vdb_write_seconds = sum(
+        spans[name]["sum"] for name in ("vector_upsert", "vector_save") if name in spans
+    )
+    if hasattr(rag.vdb, "close"):
+        rag.vdb.close()
+
+    return {
+        "chunks": len(rag.text_chunks_db),
+        "update_db_seconds": update_db_seconds,
+        "vdb_write_seconds": vdb_write_seconds,
+        "build_peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_serve(args: argparse.Namespace, backend: str, tmp_dir: str) -> dict:
+    """Loads the DBs built by `run_build` and queries them."""
+    start = time.perf_counter()
+    rag = NaiveRAG(make_config(args, backend, tmp_dir))
+    rag.load_db()
+    load_db_seconds = time.perf_counter() - start
+
+    # queries are embeddings of random chunks, like questions about them
+    rng = numpy.random.default_rng(args.seed)
+    chunk_ids = list(rag.text_chunks_db)
+    sample = [chunk_ids[i] for i in rng.choice(len(chunk_ids), args.queries)]
+    queries = numpy.array(
+        rag.embedding.embed(
+            [chunk["content"] for chunk in rag.text_chunks_db.get_many(sample)]
+        ),
+        dtype=numpy.float32,
+    )
+    del chunk_ids
+    rag.vdb.query_db(queries[0], args.top_k)  # warm up
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        rag.vdb.query_db(query, args.top_k)
+        latencies.append(time.perf_counter() - start)
+    latencies = numpy.array(latencies) * 1000
+
+    start = time.perf_counter()
+    for offset in range(0, len(queries), args.batch_size):
+        rag.vdb.query_db_batch(queries[offset : offset + args.batch_size], args.top_k)
+    batch_duration = time.perf_counter() - start
+
+    if hasattr(rag.vdb, "close"):
+        rag.vdb.close()
+
+    return {
+        "load_db_seconds": load_db_seconds,
+        "query_p50_ms": float(numpy.percentile(latencies, 50)),
+        "query_p95_ms": float(numpy.percentile(latencies, 95)),
+        "query_p99_ms": float(numpy.percentile(latencies, 99)),
+        "qps": len(latencies) / (latencies.sum() / 1000),
+        "batch_qps": len(queries) / batch_duration,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_in_process(
+    args: argparse.Namespace,
+    scale: int,
+    backend: str | None = None,
+    phase: str | None = None,
+    tmp_dir: str | None = None,
+) -> dict:
+    """Runs one benchmark in a fresh Python process.
+
+    Args:
+        args (argparse.Namespace): The arguments of the suite.
+        scale (int): Number of chunks.
+        backend (str | None, optional): The vector DB. Defaults to None (the
+            chunking benchmark).
+        phase (str | None, optional): "build" or "serve" the DBs in `tmp_dir`.
+            Defaults to None.
+        tmp_dir (str | None, optional): Directory of the DBs. Defaults to None.
+
+    Returns:
+        dict: The measured metrics.
+    """
+    command = [sys.executable, "-m", "benchmarks.suite", *sys.argv[1:]]
+    command += ["--worker-scale", str(scale)]
+    if backend is not None:
+        command += ["--worker-backend", backend, "--worker-phase", phase]
+        command += ["--worker-dir", tmp_dir]
+    output = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True)
+    return json.loads(output.stdout.splitlines()[-1])
+
+
+def run_backend(args: argparse.Namespace, scale: int, backend: str) -> dict:
+    """Builds and serves the DBs of a backend, each in a fresh process, so the
+    peak RSS of serving doesn't include building."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        build = run_in_process(args, scale, backend, "build", tmp_dir)
+        serve = run_in_process(args, scale, backend, "serve", tmp_dir)
+    return {**build, **serve}
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """Compares results with a baseline.
+
+    Args:
+        results (list): The results of this run.
+        baseline (list): The results of the baseline run.
+        tolerance (float): Relative change that is tolerated, e.g. 0.2.
+
+    Returns:
+        list: Regressions as dicts with "scale", "backend", "metric", "baseline",
+            "value" and the relative "change".
+    """
+    baseline = {(r["scale"], r["backend"]): r["metrics"] for r in baseline}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["scale"], result["backend"]), {})
+        for metric, value in result["metrics"].items():
+            if metric not in METRICS or not previous.get(metric):
+                continue
+            change = (value - previous[metric]) / previous[metric]
+            worse = -change if METRICS[metric] else change
+            if worse > tolerance:
+                regressions.append(
+                    {
+                        "scale": result["scale"],
+                        "backend": result["backend"],
+                        "metric": metric,
+                        "baseline": previous[metric],
+                        "value": value,
+                        "change": change,
+                    }
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=int, nargs="+", default=[10000])
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=[name for name in AbstractDB._implementations if name != "nano_vdb"],
+        help="nano_vdb (JSON) is left out by default, as it is slow beyond 100k chunks",
+    )
+    parser.add_argument("--embedding-dim", type=int, default=768)
+    parser.add_argument("--max-token-size", type=int, default=1000)
+    parser.add_argument("--overlap-token-size", type=int, default=50)
+    parser.add_argument("--vocabulary", type=int, default=100000)
+    parser.add_argument("--lexical", action="store_true", help="build the BM25 index")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmarks/results.json")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--worker-scale", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-backend", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-phase", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker_scale is not None:
+        if args.worker_backend is None:
+            result = run_chunking(args, args.worker_scale)
+        elif args.worker_phase == "build":
+            result = run_build(
+                args, args.worker_scale, args.worker_backend, args.worker_dir
+            )
+        else:
+            result = run_serve(args, args.worker_backend, args.worker_dir)
+        print(json.dumps(result))
+        return
+
+    if args.save_baseline and not args.baseline:
+        parser.error("--save-baseline needs a --baseline file")
+    if args.baseline and not args.save_baseline and not os.path.exists(args.baseline):
+        parser.error(
+            f"no baseline at {args.baseline}; store one with --save-baseline first "
+            'or pass --baseline "" to skip the regression check'
+        )
+
+    results = []
+    for scale in args.scales:
+        for backend in [None, *args.backends]:
+            result = {
+                "scale": scale,
+                "backend": backend or "chunking",
+                "metrics": (
+                    run_backend(args, scale, backend)
+                    if backend
+                    else run_in_process(args, scale)
+                ),
+            }
+            results.append(result)
+            print(
+                f"{scale:>9} {result['backend']:<14} "
+                + ", ".join(f"{k} {v:,.3f}" for k, v in result["metrics"].items())
+            )
+
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": numpy.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "arguments": {
+            key: value
+            for key, value in vars(args).items()
+            if not key.startswith("worker")
+        },
+        "results": results,
+    }
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        report["regressions"] = compare(results, baseline["results"], args.tolerance)
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Saved results to {args.output}")
+
+    for regression in report.get("regressions", []):
+        print(
+            f"REGRESSION {regression['scale']} {regression['backend']} "
+            f"{regression['metric']}: {regression['baseline']:,.3f} -> "
+            f"{regression['value']:,.3f} ({regression['change']:+.0%})"
+        )
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
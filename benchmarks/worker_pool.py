@@ -0,0 +1,114 @@
+"""QPS and memory of `server.py --workers N` for several N, on the "fake" API.
+
+Indexes a synthetic corpus into the mmap vector DB and the blob text DB, starts
+the server with each worker count and lets `--clients` threads send distinct
+queries. Reports the QPS and the private memory of each worker, i.e. the memory an
+added worker costs; the index itself is shared with the parent.
+
+Usage:
+    python -m benchmarks.worker_pool --workers 1 2 4 --chunks 20000
+"""
+
+import argparse
+import http.client
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import yaml
+from benchmarks.async_concurrency import build_config
+from benchmarks.server_qps import run_clients
+from benchmarks.suite import synthetic_documents
+from rag_pipeline.naiverag import NaiveRAG
+
+
+def private_mb(pid: int) -> float:
+    """Returns the memory only the process uses, from /proc/<pid>/smaps_rollup."""
+    private = 0
+    with open(f"/proc/{pid}/smaps_rollup", "r", encoding="utf-8") as file:
+        for line in file:
+            if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                private += int(line.split()[1])
+    return private / 1024
+
+
+def wait_until_serving(port: int, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port)
+            connection.request("GET", "/health")
+            connection.getresponse().read()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--embedding-dim", type=int, default=768)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    queries = [f"question {i}" for i in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as dir_root:
+        config = build_config(dir_root, args.embedding_dim, args.latency)
+        config["text_db_implementation_name"] = "blob"
+        config["max_token_size"] = 200
+        naiverag = NaiveRAG(config)
+        naiverag.update_db(synthetic_documents(args.chunks, 200, 10000, 0), [])
+        print(f"Indexed {len(naiverag.text_chunks_db)} chunks")
+        del naiverag
+
+        config_file = os.path.join(dir_root, "config.yaml")
+        with open(config_file, "w", encoding="utf-8") as file:
+            yaml.safe_dump(config, file)
+
+        for workers in args.workers:
+            server = subprocess.Popen(
+                [
+                    sys.executable,
+                    "server.py",
+                    "--config",
+                    config_file,
+                    "--port",
+                    str(args.port),
+                    "--workers",
+                    str(workers),
+                ],
+                stdout=subprocess.DEVNULL,
+            )
+            try:
+                wait_until_serving(args.port)
+                duration = run_clients(args.port, queries, args.clients)
+                children = subprocess.run(
+                    ["pgrep", "-P", str(server.pid)],
+                    stdout=subprocess.PIPE,
+                    text=True,
+                ).stdout.split()
+                # a single worker is the server process itself
+                memory = [private_mb(int(pid)) for pid in children or [server.pid]]
+                parent_memory = private_mb(server.pid) if children else 0.0
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait()
+
+            print(
+                f"{workers} workers: {len(queries) / duration:,.1f} QPS, "
+                f"{sum(memory) / len(memory):,.1f} MB private per worker "
+                f"({parent_memory:,.1f} MB in the parent)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from util.instrumentation import metrics
+
+
+class AnswerCache:
+    """In-memory cache of generated answers for repeated and near-duplicate queries.
+
+    A lookup first tries an exact match on the normalized query text, which costs
+    no embedding call. It then tries a semantic match: the cosine similarity of the
+    query embedding to the embeddings of previously answered queries must reach
+    `answer_cache_similarity_threshold`. Entries expire after `answer_cache_ttl`
+    seconds. Beyond `answer_cache_max_entries`, the least recently used entry is
+    evicted; with 0, nothing is cached.
+    """
+
+    def __init__(self, config: dict) -> None:
+        self.max_entries = config.get("answer_cache_max_entries", 10000)
+        if self.max_entries < 0:
+            raise ValueError(
+                f"answer_cache_max_entries must be >= 0, got {self.max_entries}"
+            )
+        self.ttl = config.get("answer_cache_ttl", 3600)
+        self.similarity_threshold = config.get(
+            "answer_cache_similarity_threshold", 0.95
+        )
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._free_slots = list(range(self.max_entries))[::-1]
+        self._slot_keys = [None] * self.max_entries
+        self._matrix = None
+        self._valid = np.zeros(self.max_entries, dtype=bool)
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _normalize(query: str) -> str:
+        return " ".join(query.casefold().split())
+
+    def _is_expired(self, entry: dict) -> bool:
+        return time.monotonic() - entry["created"] > self.ttl
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._valid[entry["slot"]] = False
+        self._slot_keys[entry["slot"]] = None
+        self._free_slots.append(entry["slot"])
+
+    def _hit(self, key: str) -> dict:
+        self._entries.move_to_end(key)
+        entry = self._entries[key]
+        self.saved_seconds += entry["latency"]
+        return entry
+
+    def get_exact(self, query: str) -> dict | None:
+        """Looks up an answer to exactly the same (normalized) query.
+
+        Args:
+            query (str): The User Query.
+
+        Returns:
+            dict | None: The cached entry ("answer", "sources") or None.
+        """
+        key = self._normalize(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._is_expired(entry):
+                self._remove(key)
+                return None
+            self.exact_hits += 1
+            metrics.count("answer_cache_hits")
+            return self._hit(key)
+
+    def get_semantic(self, embedding: np.ndarray) -> dict | None:
+        """Looks up the answer to the most similar previous query. A miss is
+        counted, as this is the last lookup before generating an answer.
+
+        Args:
+            embedding (np.ndarray): The embedded User Query.
+
+        Returns:
+            dict | None: The cached entry ("answer", "sources") or None.
+        """
+        with self._lock:
+            if self._matrix is None or not self._valid.any():
+                self.misses += 1
+                metrics.count("answer_cache_misses")
+                return None
+
+            query = embedding / max(np.linalg.norm(embedding), 1e-12)
+            scores = self._matrix @ query
+            scores[~self._valid] = -np.inf
+            slot = int(np.argmax(scores))
+
+            key = self._slot_keys[slot]
+            if scores[slot] < self.similarity_threshold:
+                self.misses += 1
+                metrics.count("answer_cache_misses")
+                return None
+            if self._is_expired(self._entries[key]):
+                self._remove(key)
+                self.misses += 1
+                metrics.count("answer_cache_misses")
+                return None
+
+            self.semantic_hits += 1
+            metrics.count("answer_cache_hits")
+            return self._hit(key)
+
+    def put(
+        self,
+        query: str,
+        embedding: np.ndarray,
+        answer: str,
+        sources: list,
+        latency: float,
+    ) -> None:
+        """Caches a generated answer.
+
+        Args:
+            query (str): The User Query.
+            embedding (np.ndarray): The embedded User Query.
+            answer (str): The generated answer.
+            sources (list): The retrieved sources.
+            latency (float): Seconds it took to answer; saved by every later hit.
+        """
+        if not self.max_entries:
+            return
+
+        key = self._normalize(query)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if not self._free_slots:
+                self._remove(next(iter(self._entries)))
+
+            if self._matrix is None:
+                self._matrix = np.zeros(
+                    (self.max_entries, len(embedding)), dtype=np.float32
+                )
+
+            slot = self._free_slots.pop()
+            self._matrix[slot] = embedding / max(np.linalg.norm(embedding), 1e-12)
+            self._valid[slot] = True
+            self._slot_keys[slot] = key
+            self._entries[key] = {
+                "answer": answer,
+                "sources": sources,
+                "latency": latency,
+                "created": time.monotonic(),
+                "slot": slot,
+            }
+
+    def clear(self) -> None:
+        """Drops all entries, e.g. after the index changed."""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self) -> dict:
+        """Returns hit counts, hit rate and the latency saved by hits."""
+        hits = self.exact_hits + self.semantic_hits
+        total = hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "saved_seconds": self.saved_seconds,
+        }
@@ -1,4 +1,11 @@
 from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+import asyncio
+import contextvars
+import time
+from util.instrumentation import instrument_methods
 
 
 class AbstractLLM(ABC):
@@ -8,6 +15,14 @@ class AbstractLLM(ABC):
         super().__init_subclass__(**kwargs)
         if hasattr(cls, "name"):
             AbstractLLM._implementations[cls.name] = cls
+        instrument_methods(
+            cls,
+            {
+                "generate": "generate",
+                "generate_stream": "generate",
+                "agenerate": "generate",
+            },
+        )
 
     @classmethod
     def create(cls, implementation_name: str, config: dict, **kwargs) -> "AbstractLLM":
@@ -41,6 +56,11 @@ class AbstractLLM(ABC):
         """Initializes the LLM client."""
         pass
 
+    def close(self) -> None:
+        """Closes the client, if it can be closed."""
+        if hasattr(self.client, "close"):
+            self.client.close()
+
     @abstractmethod
     def generate(self, query: str) -> str:
         """Generates an answer to a given query.
@@ -52,6 +72,29 @@ class AbstractLLM(ABC):
         """
         pass
 
+    def generate_stream(self, query: str) -> Iterator[str]:
+        """Generates an answer to a given query, yielding text deltas as they arrive.
+        Defaults to yielding the full answer of `generate` at once; clients with
+        native streaming support override it.
+
+        Args:
+            query (str): The query for the LLM.
+        Yields:
+            str: The next part of the answer.
+        """
+        yield self.generate(query)
+
+    async def agenerate(self, query: str) -> str:
+        """Asynchronously generates an answer to a given query. Defaults to running
+        `generate` in a worker thread; clients with native async support override it.
+
+        Args:
+            query (str): The query for the LLM.
+        Returns:
+            str: The answer.
+        """
+        return await asyncio.to_thread(self.generate, query)
+
 
 class AbstractEmbedding(ABC):
     _implementations: dict[str, type["AbstractEmbedding"]] = {}
@@ -60,6 +103,7 @@ class AbstractEmbedding(ABC):
         super().__init_subclass__(**kwargs)
         if hasattr(cls, "name"):
             AbstractEmbedding._implementations[cls.name] = cls
+        instrument_methods(cls, {"embed": "embed", "aembed": "embed"})
 
     @classmethod
     def create(
@@ -88,6 +132,10 @@ class AbstractEmbedding(ABC):
     def __init__(self, config: dict) -> None:
         self.embedding_model_name = config["embedding_model_name"]
         self.api_key = config["api_key"]
+        self.batch_size = config.get("embedding_batch_size", 100)
+        self.max_concurrency = config.get("embedding_max_concurrency", 4)
+        self.max_retries = config.get("embedding_max_retries", 3)
+        self.retry_backoff = config.get("embedding_retry_backoff", 1.0)
         self.client = self._init_client()
 
     @abstractmethod
@@ -95,6 +143,11 @@ class AbstractEmbedding(ABC):
         """Initializes a client."""
         pass
 
+    def close(self) -> None:
+        """Closes the client, if it can be closed."""
+        if hasattr(self.client, "close"):
+            self.client.close()
+
     @abstractmethod
     def embed(self, texts: list) -> list:
         """Embeds given texts.
@@ -105,3 +158,73 @@ class AbstractEmbedding(ABC):
             list: A list of embeddings.
         """
         pass
+
+    async def aembed(self, texts: list) -> list:
+        """Asynchronously embeds given texts. Defaults to running `embed` in a worker
+        thread; clients with native async support override it.
+
+        Args:
+            texts (list): List containing the texts.
+        Returns:
+            list: A list of embeddings.
+        """
+        return await asyncio.to_thread(self.embed, texts)
+
+    def _embed_with_retry(self, texts: list) -> list:
+        """Embeds a single batch, retrying with exponential backoff on failure.
+
+        Args:
+            texts (list): The texts of one batch.
+
+        Raises:
+            Exception: The last error once all retries are exhausted.
+
+        Returns:
+            list: A list of embeddings.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embed(texts)
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.retry_backoff * 2**attempt)
+
+    def embed_in_batches(self, texts: Iterable[str]) -> Iterator[tuple[int, list]]:
+        """Embeds texts in batches of `batch_size`, keeping up to `max_concurrency`
+        batches in flight. Batches are yielded as soon as they finish, so they may
+        arrive out of order; the offset identifies their position in `texts`.
+
+        Texts are consumed lazily, so at most `max_concurrency` batches are held
+        in memory at any time.
+
+        Args:
+            texts (Iterable[str]): The texts to embed.
+
+        Yields:
+            tuple[int, list]: Offset of the batch's first text and its embeddings.
+        """
+        texts = iter(texts)
+        offset = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            in_flight = {}
+
+            while True:
+                while len(in_flight) < self.max_concurrency:
+                    batch = list(islice(texts, self.batch_size))
+                    if not batch:
+                        break
+                    # the context carries the span the batch is embedded for
+                    future = executor.submit(
+                        contextvars.copy_context().run, self._embed_with_retry, batch
+                    )
+                    in_flight[future] = offset
+                    offset += len(batch)
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield in_flight.pop(future), future.result()
@@ -0,0 +1,45 @@
+import asyncio
+from util.batching import MicroBatcher
+from .base import AbstractEmbedding
+
+
+class BatchedEmbedding(AbstractEmbedding):
+    """Embeds single texts that many threads submit concurrently, e.g. the queries
+    of a server's request threads, in shared requests to the wrapped embedding.
+
+    Texts wait up to `server_batch_window_ms` for others to join their batch of at
+    most `embedding_batch_size` texts. Calls with several texts (e.g. while
+    indexing) are already batched and go to the wrapped embedding directly.
+    """
+
+    def __init__(self, embedding: AbstractEmbedding, config: dict) -> None:
+        self.embedding = embedding
+        self.batcher = MicroBatcher(
+            self.embedding.embed,
+            window=config.get("server_batch_window_ms", 2) / 1000,
+            max_batch_size=config.get("embedding_batch_size", 100),
+        )
+        super().__init__(config)
+        self.embedding_model_name = embedding.embedding_model_name
+
+    def _init_client(self):
+        return self.embedding.client
+
+    def close(self) -> None:
+        """Stops the batching thread and closes the wrapped embedding."""
+        self.batcher.close()
+        self.embedding.close()
+
+    def embed(self, texts: list) -> list:
+        if isinstance(texts, str):
+            texts = [texts]
+        if len(texts) == 1:
+            return [self.batcher(texts[0])]
+        return self.embedding.embed(texts)
+
+    async def aembed(self, texts: list) -> list:
+        if isinstance(texts, str):
+            texts = [texts]
+        if len(texts) == 1:
+            return [await asyncio.wrap_future(self.batcher.submit(texts[0]))]
+        return await self.embedding.aembed(texts)
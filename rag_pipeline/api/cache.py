@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import numpy as np
+from util.instrumentation import metrics
+from .base import AbstractEmbedding
+
+
+class CachedEmbedding(AbstractEmbedding):
+    """Persistent, content-addressed cache in front of any embedding implementation.
+
+    Embeddings are stored in a SQLite file keyed by (embedding_model_name, sha256 of
+    the text), so only texts that have never been embedded with the current model
+    reach the wrapped API. Once the cache holds more than `max_entries` embeddings,
+    the least recently used ones are evicted.
+
+    The cache file is opened on first use in every process, so a process that
+    forks workers (see `PreforkPool`) never shares its connection with them.
+    """
+
+    def __init__(self, embedding: AbstractEmbedding, config: dict) -> None:
+        self.embedding = embedding
+        self.cache_file = config["embedding_cache_file"]
+        self.max_entries = config.get("embedding_cache_max_entries", 1_000_000)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._clock = 0
+        # number of cached embeddings, kept up to date by `_store`
+        self._size = 0
+        super().__init__(config)
+        self.embedding_model_name = embedding.embedding_model_name
+        # connection of the process with id `_pid`, see `_conn`
+        self._connection = None
+        self._pid = None
+
+    def _init_client(self):
+        return self.embedding.client
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """The connection of this process, opened on first use. Must hold
+        `_lock`."""
+        if self._pid != os.getpid():
+            # a connection inherited from the parent process must not be used
+            self._connection = self._connect()
+            self._pid = os.getpid()
+        return self._connection
+
+    def close(self) -> None:
+        """Closes the cache file and the wrapped embedding."""
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+            self._pid = None
+        self.embedding.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Opens the cache file and creates the table if necessary.
+
+        Returns:
+            sqlite3.Connection: The connection.
+        """
+        cache_dir = os.path.dirname(self.cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        conn = sqlite3.connect(self.cache_file, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "last_access INTEGER NOT NULL, PRIMARY KEY (model, hash))"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings (last_access)"
+        )
+        self._clock = conn.execute(
+            "SELECT COALESCE(MAX(last_access), 0) FROM embeddings"
+        ).fetchone()[0]
+        self._size = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return conn
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, hashes: list) -> dict:
+        """Fetches cached embeddings and marks them as recently used.
+
+        Args:
+            hashes (list): Text hashes to look up.
+
+        Returns:
+            dict: Mapping of hash to embedding for all cached hashes.
+        """
+        found = {}
+        with self._lock:
+            conn = self._conn  # opening it reads the clock
+            self._clock += 1
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start : start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT hash, vector FROM embeddings "
+                    f"WHERE model = ? AND hash IN ({placeholders})",
+                    [self.embedding_model_name, *batch],
+                ).fetchall()
+                for h, vector in rows:
+                    found[h] = np.frombuffer(vector, dtype=np.float32).tolist()
+
+                conn.execute(
+                    f"UPDATE embeddings SET last_access = ? "
+                    f"WHERE model = ? AND hash IN ({placeholders})",
+                    [self._clock, self.embedding_model_name, *batch],
+                )
+            conn.commit()
+        return found
+
+    def _store(self, entries: dict) -> None:
+        """Writes new embeddings and evicts the least recently used ones.
+
+        Args:
+            entries (dict): Mapping of hash to embedding.
+        """
+        with self._lock:
+            conn = self._conn  # opening it reads the clock
+            self._clock += 1
+            # texts embedded concurrently by another process are already cached
+            # with the same vector; rowcount counts the new rows only
+            inserted = conn.executemany(
+                "INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        self.embedding_model_name,
+                        h,
+                        np.asarray(vector, dtype=np.float32).tobytes(),
+                        self._clock,
+                    )
+                    for h, vector in entries.items()
+                ],
+            ).rowcount
+            self._size += max(inserted, 0)
+
+            overflow = self._size - self.max_entries
+            if overflow > 0:
+                self._size -= conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (overflow,),
+                ).rowcount
+            conn.commit()
+
+    def size(self) -> int:
+        """Returns the number of cached embeddings. Counted once on opening and
+        then kept up to date, so rows added by other processes sharing the cache
+        file are only seen after reopening it."""
+        with self._lock:
+            self._conn  # counts the cached embeddings on opening
+        return self._size
+
+    def stats(self) -> dict:
+        """Returns hit/miss counts since this instance was created."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _split_cached(self, texts: list) -> tuple[list, dict, dict]:
+        """Hashes the texts and looks them up.
+
+        Args:
+            texts (list): The texts.
+
+        Returns:
+            tuple[list, dict, dict]: The hash of every text, the cached embeddings
+                by hash and the texts missing from the cache by hash.
+        """
+        hashes = [self._hash(text) for text in texts]
+        cached = self._lookup(list(set(hashes)))
+        missing = {h: text for h, text in zip(hashes, texts) if h not in cached}
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        metrics.count("embedding_cache_hits", len(texts) - len(missing))
+        metrics.count("embedding_cache_misses", len(missing))
+
+        return hashes, cached, missing
+
+    def embed(self, texts: list) -> list:
+        if isinstance(texts, str):
+            texts = [texts]
+
+        hashes, cached, missing = self._split_cached(texts)
+
+        if missing:
+            embeddings = self.embedding.embed(list(missing.values()))
+            computed = dict(zip(missing.keys(), embeddings))
+            self._store(computed)
+            cached.update(computed)
+
+        return [cached[h] for h in hashes]
+
+    async def aembed(self, texts: list) -> list:
+        if isinstance(texts, str):
+            texts = [texts]
+
+        hashes, cached, missing = await asyncio.to_thread(self._split_cached, texts)
+
+        if missing:
+            embeddings = await self.embedding.aembed(list(missing.values()))
+            computed = dict(zip(missing.keys(), embeddings))
+            await asyncio.to_thread(self._store, computed)
+            cached.update(computed)
+
+        return [cached[h] for h in hashes]
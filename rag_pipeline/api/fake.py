@@ -0,0 +1,76 @@
+import asyncio
+import hashlib
+import time
+from collections.abc import Iterator
+import numpy as np
+from .base import AbstractLLM, AbstractEmbedding
+
+
+class FakeLLM(AbstractLLM):
+    """Offline LLM stub. Answers deterministically; the first token arrives after
+    `fake_latency` seconds and every further token after `fake_token_latency`."""
+
+    name = "fake"
+
+    def __init__(self, config: dict) -> None:
+        self.latency = config.get("fake_latency", 0.0)
+        self.token_latency = config.get("fake_token_latency", 0.0)
+        super().__init__(config)
+
+    def _init_client(self):
+        return None
+
+    def _answer(self, query: str) -> str:
+        digest = hashlib.sha256(query.encode("utf-8")).hexdigest()[:8]
+        return f"Fake answer ({digest}) to a prompt of {len(query)} characters."
+
+    def _tokens(self, query: str) -> list:
+        return self._answer(query).split(" ")
+
+    def generate(self, query: str) -> str:
+        return "".join(self.generate_stream(query))
+
+    def generate_stream(self, query: str) -> Iterator[str]:
+        time.sleep(self.latency)
+        for i, token in enumerate(self._tokens(query)):
+            if i:
+                time.sleep(self.token_latency)
+                token = " " + token
+            yield token
+
+    async def agenerate(self, query: str) -> str:
+        tokens = self._tokens(query)
+        await asyncio.sleep(self.latency + self.token_latency * (len(tokens) - 1))
+        return " ".join(tokens)
+
+
+class FakeEmbedding(AbstractEmbedding):
+    """Offline embedding stub. Returns deterministic pseudo-random unit vectors
+    derived from a hash of each text after `fake_latency` seconds per call."""
+
+    name = "fake"
+
+    def __init__(self, config: dict) -> None:
+        self.latency = config.get("fake_latency", 0.0)
+        self.embedding_dim = config["embedding_dim"]
+        super().__init__(config)
+
+    def _init_client(self):
+        return None
+
+    def _embed_text(self, text: str) -> list:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8])
+        vector = np.random.default_rng(seed).standard_normal(self.embedding_dim)
+        return (vector / np.linalg.norm(vector)).astype(np.float32).tolist()
+
+    def embed(self, texts: list) -> list:
+        if isinstance(texts, str):
+            texts = [texts]
+        time.sleep(self.latency)
+        return [self._embed_text(text) for text in texts]
+
+    async def aembed(self, texts: list) -> list:
+        if isinstance(texts, str):
+            texts = [texts]
+        await asyncio.sleep(self.latency)
+        return [self._embed_text(text) for text in texts]
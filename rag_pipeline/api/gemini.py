@@ -1,3 +1,4 @@
+from collections.abc import Iterator
 from google import genai
 from .base import AbstractLLM, AbstractEmbedding
 
@@ -14,6 +15,19 @@ class LLM(AbstractLLM):
         )
         return response.text
 
+    def generate_stream(self, query: str) -> Iterator[str]:
+        for chunk in self.client.models.generate_content_stream(
+            model=self.llm_model_name, contents=query
+        ):
+            if chunk.text:
+                yield chunk.text
+
+    async def agenerate(self, query: str) -> str:
+        response = await self.client.aio.models.generate_content(
+            model=self.llm_model_name, contents=query
+        )
+        return response.text
+
 
 class Embedding(AbstractEmbedding):
     name = "gemini"
@@ -26,3 +40,9 @@ class Embedding(AbstractEmbedding):
             model=self.embedding_model_name, contents=texts
         )
         return [embedding.values for embedding in response.embeddings]
+
+    async def aembed(self, texts: list) -> list:
+        response = await self.client.aio.models.embed_content(
+            model=self.embedding_model_name, contents=texts
+        )
+        return [embedding.values for embedding in response.embeddings]
@@ -1,8 +1,17 @@
 import os
+from collections.abc import Iterable, Iterator
 from abc import ABC, abstractmethod
 from .api.base import AbstractEmbedding, AbstractLLM
+from .api.cache import CachedEmbedding
+from .answer_cache import AnswerCache
+from .bm25 import BM25Index
+from .context import ContextAssembler
 from .chunking.base import AbstractChunking
 from .db.base import AbstractDB
+from .rerank.base import AbstractReranker
+from .text_db.base import AbstractTextDB
+from util.instrumentation import instrument_methods, metrics
+from util.manifest import DocumentManifest
 
 
 class AbstractRAG(ABC):
@@ -15,6 +24,18 @@ class AbstractRAG(ABC):
         super().__init_subclass__(**kwargs)
         if hasattr(cls, "name"):
             AbstractRAG._implementations[cls.name] = cls
+        instrument_methods(
+            cls,
+            {
+                "query": "query",
+                "query_stream": "query",
+                "aquery": "query",
+                "query_batch": "query_batch",
+                "generate_db": "index",
+                "update_db": "index",
+                "load_db": "load_db",
+            },
+        )
 
     @classmethod
     def create(cls, implementation_name: str, config: dict, **kwargs) -> "AbstractRAG":
@@ -50,22 +71,50 @@ class AbstractRAG(ABC):
         """
 
         self.config = config
+        metrics.configure(config)
         self.llm = AbstractLLM.create(config["api_implementation_name"], config)
         self.embedding = AbstractEmbedding.create(
             config["api_implementation_name"], config
         )
+        if config.get("embedding_cache_file"):
+            self.embedding = CachedEmbedding(self.embedding, config)
         self.vdb = AbstractDB.create(config["db_implementation_name"], config)
         self.chunking = AbstractChunking.create(
             config["chunking_implementation_name"], config
         )
 
-        self.text_chunks_db_path = config["dir_text_chunks"]
-        self.text_db_storage_file = os.path.join(
-            self.text_chunks_db_path, "text_db.json"
+        self.text_chunks_db = AbstractTextDB.create(
+            config.get("text_db_implementation_name", "json"), config
         )
+
+        self.text_chunks_db_path = config["dir_text_chunks"]
         self.vdb_storage_file = os.path.join(config["dir_vector_db"], "vdb.json")
 
-        self.text_chunks_db = {}
+        self.answer_cache = (
+            AnswerCache(config)
+            if config.get("answer_cache_enabled")
+            and config.get("answer_cache_max_entries", 10000)
+            else None
+        )
+        self.context_assembler = ContextAssembler(config)
+        self.reranker = (
+            AbstractReranker.create(config["rerank_implementation_name"], config)
+            if config.get("rerank_implementation_name")
+            else None
+        )
+        self.manifest = DocumentManifest(
+            os.path.join(self.text_chunks_db_path, "manifest.json")
+        )
+        self.lexical_index = (
+            BM25Index(os.path.join(self.text_chunks_db_path, "bm25"), config)
+            if config.get("lexical_search_enabled")
+            else None
+        )
+
+    @property
+    def text_db_storage_file(self) -> str:
+        """The file whose existence means that there is a text DB to load."""
+        return self.text_chunks_db.storage_file
 
     @abstractmethod
     def chunk(self, documents: list) -> list:
@@ -93,20 +142,104 @@ class AbstractRAG(ABC):
         """
         pass
 
+    @abstractmethod
+    def update_db(self, documents: Iterable[dict], removed: list) -> None:
+        """
+        Incrementally updates the vector and text DB. Only the chunks of the given
+        documents are (re-)embedded; chunks of all other documents are untouched.
+        Documents are consumed lazily, so they can be streamed from disk.
+
+        Besides "source", every field of a document's metadata (e.g. "tags") is
+        stored next to the vectors of its chunks and can be filtered on.
+
+        Args:
+            documents (Iterable[dict]): New or changed documents.
+            removed (List[str]): Sources of documents that were deleted.
+        """
+        pass
+
     @abstractmethod
     def load_db(self) -> None:
         """Loads the vector and text DB"""
         pass
 
     @abstractmethod
-    def query(self, query: str) -> str:
+    def query(self, query: str, filters: dict | None = None) -> str:
         """
         Queries the DB with a given User Query, returning the LLM generated response.
 
         Args:
             query (str): The User Query.
+            filters (dict | None, optional): Filter expression on the chunk metadata
+                ("full_doc_id" and document metadata such as "tags"), see
+                `rag_pipeline.db.metadata`. Defaults to None.
+
+        Returns:
+            str: The generated answer.
+        """
+        pass
+
+    @abstractmethod
+    def query_stream(self, query: str, filters: dict | None = None) -> Iterator[dict]:
+        """
+        Queries the DB with a given User Query and streams the LLM generated
+        response as it is produced.
+
+        Args:
+            query (str): The User Query.
+            filters (dict | None, optional): Filter expression on the chunk
+                metadata. Defaults to None.
+
+        Yields:
+            dict: First {"type": "sources", "sources": [...]} with the retrieved
+                chunks, then {"type": "context", "context": {...}} with the report
+                of the context assembly (not for cached answers), then
+                {"type": "delta", "text": str} for every text delta.
+        """
+        pass
+
+    @abstractmethod
+    async def aquery(self, query: str, filters: dict | None = None) -> str:
+        """
+        Asynchronously queries the DB with a given User Query, returning the LLM
+        generated response. CPU-bound retrieval runs off the event loop, so one
+        process can keep many queries in flight.
+
+        Args:
+            query (str): The User Query.
+            filters (dict | None, optional): Filter expression on the chunk
+                metadata. Defaults to None.
 
         Returns:
             str: The generated answer.
         """
         pass
+
+    @abstractmethod
+    def query_batch(
+        self, queries: list, filters: dict | None = None
+    ) -> tuple[list, dict]:
+        """
+        Answers many User Queries at once. The queries are embedded in batches,
+        retrieved with a single matrix-matrix product and answered concurrently.
+
+        Args:
+            queries (List[str]): The User Queries.
+            filters (dict | None, optional): Filter expression on the chunk
+                metadata, applied to all queries. Defaults to None.
+
+        Returns:
+            tuple[list, dict]: The generated answers in input order and the
+                duration of every stage ("embed", "retrieve", "prompt", "generate")
+                in seconds.
+        """
+        pass
+
+    def close(self) -> None:
+        """Closes the DBs, the embedding cache and the API clients, e.g. of an
+        index generation that was replaced. The instance can't be used anymore."""
+        for component in (self.vdb, self.text_chunks_db, self.lexical_index):
+            if hasattr(component, "close"):
+                component.close()
+        self.embedding.close()
+        self.llm.close()
@@ -0,0 +1,691 @@
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+from collections import Counter
+from itertools import islice
+import numpy
+from util.instrumentation import instrumented
+from util.storage import (
+    WriterLock,
+    commit_json,
+    commit_lock,
+    read_json,
+    remove_unreferenced,
+    truncate_lines,
+    unshare,
+    versioned_name,
+)
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list:
+    """Splits text into lowercase word tokens. Identifiers such as "AB-1234" are
+    split into their alphanumeric parts, which the query is split into as well.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        list: The tokens.
+    """
+    return _TOKEN.findall(text.casefold())
+
+
+@functools.lru_cache(maxsize=1 << 20)
+def term_hash(term: str) -> int:
+    """Returns a stable 63-bit hash of a term, so no vocabulary has to be stored.
+
+    Args:
+        term (str): The term.
+
+    Returns:
+        int: The hash.
+    """
+    digest = hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") >> 1
+
+
+class BM25Index:
+    """Inverted index for lexical (BM25) retrieval of chunks.
+
+    Postings are kept in immutable segments of flat arrays, one segment per save:
+        - terms.npy: sorted term hashes
+        - indptr.npy: postings of terms[i] are at indptr[i]:indptr[i + 1]
+        - rows.npy, tfs.npy: chunk row and term frequency of every posting
+        - top_terms.npy, top_rows.npy, top_tfs.npy: for every term with more than
+          `bm25_champions` postings, the `bm25_champions` postings of the rows it
+          weighs most in (its champion list), sorted by row; those of
+          top_terms[i] are at [i * n:(i + 1) * n], n = len(top_rows) // len(top_terms)
+
+    Files within the index directory besides the segments:
+        - ids-NNNNNN.txt: one chunk id per row
+        - lengths-NNNNNN.bin: token count (int32) of every row
+        - meta.json: the commit: row count, deleted rows, segment and file names
+
+    Segments are memory-mapped, so a query only touches the postings of its terms.
+    Updated or deleted chunks are masked out until segments are merged, which
+    happens once there are more than `bm25_max_segments`. Commits work like those
+    of `MmapDB`: loading only reads, new rows are appended, a merge writes the
+    files of a new version, and replacing meta.json switches to them at once. Rows
+    beyond its count (e.g. after a crash) are cut off by the next writer.
+
+    Terms with more than `bm25_max_postings` postings (e.g. "the" in a large
+    corpus) only select candidates by their champion lists, see `query`.
+    """
+
+    # arrays of a segment; segments written before champion lists lack the top ones
+    segment_keys = (
+        "terms",
+        "indptr",
+        "rows",
+        "tfs",
+        "top_terms",
+        "top_rows",
+        "top_tfs",
+    )
+
+    # deleted rows force a merge once they exceed this fraction
+    compaction_threshold = 0.25
+
+    # file names before meta.json named them
+    legacy_files = {"ids": "ids.txt", "lengths": "lengths.bin"}
+
+    def __init__(self, dir_index: str, config: dict) -> None:
+        self.dir_index = dir_index
+        self.k1 = config.get("bm25_k1", 1.2)
+        self.b = config.get("bm25_b", 0.75)
+        self.max_segments = config.get("bm25_max_segments", 8)
+        self.max_postings = config.get("bm25_max_postings", 5000)
+        self.champions = min(config.get("bm25_champions", 500), self.max_postings)
+
+        self.meta_file = os.path.join(dir_index, "meta.json")
+        self.lock = WriterLock(dir_index)
+        # (key, rows) of the last mapping built by `mask_of_rows`
+        self._row_map = None
+
+        self.load()
+
+    def _path(self, kind: str) -> str:
+        return os.path.join(self.dir_index, self.files[kind])
+
+    def load(self) -> None:
+        """Loads the last commit. A missing index is treated as empty. Only reads,
+        so it is safe while another process writes."""
+        self.lock.release()
+        self._load_commit()
+
+    def _load_commit(self) -> None:
+        with commit_lock(self.dir_index, shared=True):
+            self._open_commit()
+
+    def _open_commit(self) -> None:
+        self.ids = []
+        self.rows = {}
+        self.deleted = set()
+        self.lengths = numpy.empty(0, dtype=numpy.int32)
+        self.segment_names = []
+        self.segments = []
+        self.next_segment = 0
+        # chunks added since the last save: (row, term hashes, term frequencies)
+        self.pending = []
+        self._dead = None
+
+        self.meta = read_json(self.meta_file)
+        if self.meta is None:
+            # version 0 is never committed, see `MmapDB`
+            self.version = 0
+            self.files = {
+                "ids": versioned_name("ids", 0, ".txt"),
+                "lengths": versioned_name("lengths", 0, ".bin"),
+            }
+            return
+
+        self.version = self.meta.get("version", 0)
+        self.files = dict(self.meta.get("files", self.legacy_files))
+        count = self.meta["count"]
+
+        with open(self._path("ids"), "r", encoding="utf-8") as file:
+            self.ids = file.read().splitlines()[:count]
+        self.lengths = numpy.fromfile(
+            self._path("lengths"), dtype=numpy.int32, count=count
+        )
+        self.deleted = set(self.meta["deleted"])
+        self.rows = {
+            chunk_id: row
+            for row, chunk_id in enumerate(self.ids)
+            if row not in self.deleted
+        }
+        self.segment_names = list(self.meta["segments"])
+        self.segments = [self._load_segment(name) for name in self.segment_names]
+        self.next_segment = self.meta["next_segment"]
+
+    def _begin_write(self) -> None:
+        """Takes the writer lock before the first change after a commit. Reloads
+        if another writer committed since this index was loaded, and cuts off rows
+        appended after the last commit."""
+        if self.lock.held:
+            return
+        self.lock.acquire()
+
+        if read_json(self.meta_file) != self.meta:
+            self._load_commit()
+        for kind in ("ids", "lengths"):
+            unshare(self._path(kind))
+        truncate_lines(self._path("ids"), len(self.ids))
+        if os.path.exists(self._path("lengths")):
+            if os.path.getsize(self._path("lengths")) > len(self.ids) * 4:
+                with open(self._path("lengths"), "r+b") as file:
+                    file.truncate(len(self.ids) * 4)
+
+    @staticmethod
+    def _write_ids(path: str, ids: list) -> None:
+        with open(path, "w", encoding="utf-8") as file:
+            file.writelines(f"{chunk_id}\n" for chunk_id in ids)
+
+    def _load_segment(self, name: str) -> dict:
+        path = os.path.join(self.dir_index, name)
+        # plain ndarray views of the maps skip the per-slice overhead of memmap
+        return {
+            key: numpy.asarray(
+                numpy.load(os.path.join(path, f"{key}.npy"), mmap_mode="r")
+            )
+            for key in self.segment_keys
+            if os.path.exists(os.path.join(path, f"{key}.npy"))
+        }
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def upsert(self, chunks: dict) -> None:
+        """Indexes chunks without persisting them. Chunks with a known id replace
+        the previous version.
+
+        Args:
+            chunks (dict): The content of every chunk by chunk id.
+        """
+        if not chunks:
+            return
+
+        self._begin_write()
+        self.delete([chunk_id for chunk_id in chunks if chunk_id in self.rows])
+
+        lengths = []
+        for chunk_id, content in chunks.items():
+            counts = Counter(tokenize(content))
+            row = len(self.ids)
+            self.ids.append(chunk_id)
+            self.rows[chunk_id] = row
+            lengths.append(sum(counts.values()))
+            self.pending.append(
+                (
+                    row,
+                    numpy.array([term_hash(term) for term in counts], numpy.int64),
+                    numpy.array(list(counts.values()), numpy.int32),
+                )
+            )
+
+        self.lengths = numpy.concatenate(
+            [self.lengths, numpy.array(lengths, dtype=numpy.int32)]
+        )
+        self._dead = None
+
+    def delete(self, chunk_ids: list) -> None:
+        """Deletes chunks without persisting it. Unknown ids are ignored.
+
+        Args:
+            chunk_ids (list): The chunk ids.
+        """
+        if not chunk_ids:
+            return
+
+        self._begin_write()
+        for chunk_id in chunk_ids:
+            row = self.rows.pop(chunk_id, None)
+            if row is not None:
+                self.deleted.add(row)
+        self._dead = None
+
+    def _dead_mask(self) -> numpy.ndarray:
+        """Boolean mask over all rows that is True for deleted rows."""
+        if self._dead is None or len(self._dead) != len(self.ids):
+            self._dead = numpy.zeros(len(self.ids), dtype=bool)
+            self._dead[list(self.deleted)] = True
+            # live document frequency by term, see `_document_frequency`
+            self._live_frequencies = {}
+            self._average_length = (
+                max(float(self.lengths[~self._dead].mean()), 1.0) if self.rows else 1.0
+            )
+        return self._dead
+
+    def _build_segment(
+        self,
+        terms: numpy.ndarray,
+        rows: numpy.ndarray,
+        tfs: numpy.ndarray,
+        lengths: numpy.ndarray,
+    ) -> dict:
+        """Groups postings by term and selects the champion lists of the terms
+        with more than `bm25_champions` postings. Must be called after
+        `_dead_mask`, which computes the average length.
+
+        Args:
+            terms (numpy.ndarray): Term hash of every posting.
+            rows (numpy.ndarray): Row of every posting.
+            tfs (numpy.ndarray): Term frequency of every posting.
+            lengths (numpy.ndarray): Token count of every row.
+
+        Returns:
+            dict: The segment arrays.
+        """
+        order = numpy.lexsort((rows, terms))
+        terms, rows, tfs = terms[order], rows[order], tfs[order]
+        unique_terms, starts = numpy.unique(terms, return_index=True)
+        indptr = numpy.append(starts, len(terms)).astype(numpy.int64)
+
+        # a term weighs most in the rows where its saturated, length-normalized
+        # frequency is highest; the idf is the same for all of them
+        norms = self.k1 * (1 - self.b + self.b * lengths / self._average_length).astype(
+            numpy.float32
+        )
+        common = numpy.flatnonzero(numpy.diff(indptr) > self.champions)
+        top = [numpy.empty(0, dtype=numpy.int64)]
+        for i in common:
+            term_rows = rows[indptr[i] : indptr[i + 1]]
+            term_tfs = tfs[indptr[i] : indptr[i + 1]].astype(numpy.float32)
+            impact = term_tfs / (term_tfs + norms[term_rows])
+            best = numpy.argpartition(impact, -self.champions)[-self.champions :]
+            # postings are sorted by row, so are their sorted positions
+            top.append(indptr[i] + numpy.sort(best))
+        top = numpy.concatenate(top)
+
+        return {
+            "terms": unique_terms,
+            "indptr": indptr,
+            "rows": rows.astype(numpy.int32),
+            "tfs": tfs.astype(numpy.int32),
+            "top_terms": unique_terms[common],
+            "top_rows": rows[top].astype(numpy.int32),
+            "top_tfs": tfs[top].astype(numpy.int32),
+        }
+
+    def _write_segment(self, segment: dict) -> str:
+        name = f"segment-{self.next_segment:06d}"
+        self.next_segment += 1
+        path = os.path.join(self.dir_index, name)
+        os.makedirs(path, exist_ok=True)
+        for key, array in segment.items():
+            numpy.save(os.path.join(path, f"{key}.npy"), array)
+        return name
+
+    def _merge(self, version: int) -> None:
+        """Merges all segments into one and writes the rows of the new version,
+        dropping deleted rows.
+
+        Args:
+            version (int): The version being committed.
+        """
+        alive = numpy.flatnonzero(~self._dead_mask())
+        new_row = numpy.full(len(self.ids), -1, dtype=numpy.int64)
+        new_row[alive] = numpy.arange(len(alive))
+
+        terms, rows, tfs = [], [], []
+        for segment in self.segments:
+            counts = numpy.diff(segment["indptr"])
+            segment_rows = numpy.asarray(segment["rows"])
+            keep = new_row[segment_rows] >= 0
+            terms.append(numpy.repeat(segment["terms"], counts)[keep])
+            rows.append(new_row[segment_rows[keep]])
+            tfs.append(numpy.asarray(segment["tfs"])[keep])
+        merged = self._build_segment(
+            numpy.concatenate(terms),
+            numpy.concatenate(rows),
+            numpy.concatenate(tfs),
+            self.lengths[alive],
+        )
+
+        self.segment_names = [self._write_segment(merged)]
+        self.segments = [self._load_segment(self.segment_names[0])]
+
+        self.ids = [self.ids[row] for row in alive]
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self.lengths = self.lengths[alive]
+        self.deleted = set()
+        self._dead = None
+
+        self.files = {
+            "ids": versioned_name("ids", version, ".txt"),
+            "lengths": versioned_name("lengths", version, ".bin"),
+        }
+        self._write_ids(self._path("ids"), self.ids)
+        self.lengths.tofile(self._path("lengths"))
+
+    def _remove_unreferenced(self, previous: dict | None) -> None:
+        """Removes the files and segments of commits before the previous one,
+        which readers that just loaded it may still open."""
+        previous = previous or {}
+        files = set(self.files.values())
+        files.update(previous.get("files", self.legacy_files).values())
+        remove_unreferenced(
+            self.dir_index, files, legacy=tuple(self.legacy_files.values())
+        )
+
+        segments = set(self.segment_names) | set(previous.get("segments", []))
+        for name in os.listdir(self.dir_index):
+            if name.startswith("segment-") and name not in segments:
+                shutil.rmtree(os.path.join(self.dir_index, name), ignore_errors=True)
+
+    def save(self) -> None:
+        """Persists the index. Chunks added since the last save become a new
+        segment."""
+        if not self.lock.held:
+            # nothing changed since the last commit
+            return
+
+        os.makedirs(self.dir_index, exist_ok=True)
+        version = self.version + 1
+
+        if self.pending:
+            first_row = self.pending[0][0]
+            with open(self._path("ids"), "a", encoding="utf-8") as file:
+                file.writelines(f"{chunk_id}\n" for chunk_id in self.ids[first_row:])
+            with open(self._path("lengths"), "ab") as file:
+                file.write(self.lengths[first_row:].tobytes())
+
+            self._dead_mask()
+            segment = self._build_segment(
+                numpy.concatenate([terms for _, terms, _ in self.pending]),
+                numpy.concatenate(
+                    [numpy.full(len(terms), row) for row, terms, _ in self.pending]
+                ),
+                numpy.concatenate([tfs for _, _, tfs in self.pending]),
+                self.lengths,
+            )
+            name = self._write_segment(segment)
+            self.segment_names.append(name)
+            self.segments.append(self._load_segment(name))
+            self.pending = []
+
+        if len(self.segments) > self.max_segments or len(
+            self.deleted
+        ) > self.compaction_threshold * len(self.ids):
+            self._merge(version)
+
+        meta = {
+            "count": len(self.ids),
+            "deleted": sorted(self.deleted),
+            "segments": list(self.segment_names),
+            "next_segment": self.next_segment,
+            "version": version,
+            "files": dict(self.files),
+        }
+        synced = [self._path(kind) for kind in self.files]
+        synced.extend(
+            os.path.join(self.dir_index, name, f"{key}.npy")
+            for name, segment in zip(self.segment_names, self.segments)
+            for key in segment
+        )
+        with commit_lock(self.dir_index):
+            commit_json(self.meta_file, meta, synced=synced)
+            self._remove_unreferenced(self.meta)
+        self.meta = meta
+        self.version = version
+        self.lock.release()
+
+    def close(self) -> None:
+        """Releases the writer lock; changes since the last save are dropped."""
+        self.lock.release()
+
+    def _postings(self, term: int) -> list:
+        """Returns the (rows, tfs) postings of a term in every segment containing it.
+
+        Args:
+            term (int): The term hash.
+
+        Returns:
+            list: Tuples of row and term frequency arrays, each sorted by row.
+        """
+        postings = []
+        for segment in self.segments:
+            position = int(numpy.searchsorted(segment["terms"], term))
+            if position < len(segment["terms"]) and segment["terms"][position] == term:
+                start = segment["indptr"][position]
+                end = segment["indptr"][position + 1]
+                postings.append((segment["rows"][start:end], segment["tfs"][start:end]))
+        return postings
+
+    def _champion_postings(self, term: int) -> list:
+        """Returns the postings that select candidates for a term with more than
+        `bm25_max_postings` postings: its champion list in every segment where it
+        has one, and all its (at most `bm25_champions`) postings in the others.
+
+        Args:
+            term (int): The term hash.
+
+        Returns:
+            list: Tuples of row and term frequency arrays, each sorted by row.
+        """
+        postings = []
+        for segment in self.segments:
+            top_terms = segment.get("top_terms")
+            if top_terms is not None and len(top_terms):
+                position = int(numpy.searchsorted(top_terms, term))
+                if position < len(top_terms) and top_terms[position] == term:
+                    # the segment may have been written with other `bm25_champions`
+                    width = len(segment["top_rows"]) // len(top_terms)
+                    top = slice(position * width, (position + 1) * width)
+                    postings.append((segment["top_rows"][top], segment["top_tfs"][top]))
+                    continue
+            position = int(numpy.searchsorted(segment["terms"], term))
+            if position < len(segment["terms"]) and segment["terms"][position] == term:
+                start = segment["indptr"][position]
+                end = segment["indptr"][position + 1]
+                postings.append((segment["rows"][start:end], segment["tfs"][start:end]))
+        return postings
+
+    def _document_frequency(self, term: int, postings: list) -> int:
+        """Number of live chunks containing a term. Postings of deleted rows stay
+        until the next merge; their count is cached until rows change."""
+        if not self.deleted:
+            return sum(len(rows) for rows, _ in postings)
+
+        dead = self._dead_mask()
+        frequency = self._live_frequencies.get(term)
+        if frequency is None:
+            frequency = sum(
+                len(rows) - int(numpy.count_nonzero(dead[rows])) for rows, _ in postings
+            )
+            self._live_frequencies[term] = frequency
+        return frequency
+
+    def _term_weights(
+        self, rows: numpy.ndarray, tfs: numpy.ndarray, idf: float
+    ) -> numpy.ndarray:
+        """BM25 score contributions of a term's postings."""
+        tfs = numpy.asarray(tfs, dtype=numpy.float32)
+        norm = self.k1 * (
+            1 - self.b + self.b * self.lengths[rows] / self._average_length
+        )
+        return idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+    def mask_of(self, chunk_ids: list) -> numpy.ndarray:
+        """Returns a boolean mask over the rows that is True for the given chunks,
+        e.g. those passing a metadata filter, to restrict `query` to them.
+
+        Args:
+            chunk_ids (list): The chunk ids. Unknown ids are ignored.
+
+        Returns:
+            numpy.ndarray: The mask.
+        """
+        mask = numpy.zeros(len(self.ids), dtype=bool)
+        mask[[self.rows[i] for i in chunk_ids if i in self.rows]] = True
+        return mask
+
+    def mask_of_rows(
+        self, key: object, ids: list, passing: numpy.ndarray
+    ) -> numpy.ndarray:
+        """Like `mask_of`, for the passing rows of another index, e.g. of the
+        vector DB, see `AbstractDB.matching_rows`. Its rows are mapped to the rows
+        of this index once, until `key` or the rows here change, so a mask costs
+        a few array operations instead of a lookup per chunk.
+
+        Args:
+            key (object): Changes whenever the rows of the other index do.
+            ids (list): The chunk id of every row of the other index.
+            passing (numpy.ndarray): Boolean mask over the rows of the other index.
+
+        Returns:
+            numpy.ndarray: The mask.
+        """
+        cache_key = (key, self.version, len(self.ids))
+        cached = self._row_map
+        if cached is None or cached[0] != cache_key:
+            # -1 for chunks missing here, e.g. not yet saved
+            rows = numpy.fromiter(
+                (self.rows.get(i, -1) for i in islice(ids, len(passing))),
+                dtype=numpy.int64,
+                count=len(passing),
+            )
+            self._row_map = cached = (cache_key, rows)
+
+        rows = cached[1][passing]
+        mask = numpy.zeros(len(self.ids), dtype=bool)
+        mask[rows[rows >= 0]] = True
+        return mask
+
+    @instrumented("lexical_search")
+    def query(
+        self, query: str, top_k: int = 5, mask: numpy.ndarray | None = None
+    ) -> list:
+        """Returns the chunks with the highest BM25 score for a query. Only
+        persisted chunks are searched.
+
+        Candidates are the chunks containing at least one selective query term,
+        i.e. one with at most `bm25_max_postings` postings, pruned to the
+        `bm25_max_postings` best. If all query terms are common, the candidates
+        are the champion lists of the terms instead, at most `bm25_champions`
+        chunks per term and segment. The common terms are only looked up for the
+        candidates by binary search instead of scanning their long postings, so the
+        cost of a query doesn't grow with the frequency of its terms. Chunks that
+        only contain common terms can therefore be missed if they aren't among the
+        champions of one of them.
+
+        With a mask, chunks outside of it are dropped before candidates are
+        pruned. If at most `bm25_max_postings` chunks are in the mask, all of them
+        are scored, so a selective filter never misses a match.
+
+        Args:
+            query (str): The query.
+            top_k (int, optional): Number of results. Defaults to 5.
+            mask (numpy.ndarray | None, optional): Boolean mask over the rows of
+                the chunks that may be returned, see `mask_of`. Defaults to None
+                (all chunks).
+
+        Returns:
+            list: Dicts with "__id__" and "__metrics__" (the BM25 score), best first.
+        """
+        alive = len(self.rows)
+        if not alive or not self.segments:
+            return []
+
+        dead = self._dead_mask()
+
+        terms = []
+        for term in set(map(term_hash, tokenize(query))):
+            postings = self._postings(term)
+            document_frequency = self._document_frequency(term, postings)
+            if document_frequency:
+                idf = numpy.log(
+                    1 + (alive - document_frequency + 0.5) / (document_frequency + 0.5)
+                )
+                terms.append((document_frequency, idf, postings, term))
+
+        if not terms:
+            return []
+
+        terms.sort(key=lambda term: term[0])
+        excluded = dead if mask is None else dead | ~mask
+        allowed = numpy.flatnonzero(~excluded) if mask is not None else None
+
+        if allowed is not None and len(allowed) <= self.max_postings:
+            # few chunks pass the mask: score them all by lookups
+            candidates = allowed
+            scores = numpy.zeros(len(candidates), dtype=numpy.float32)
+            common = terms
+        else:
+            selective = [term for term in terms if term[0] <= self.max_postings]
+            if selective:
+                selecting = [(idf, postings) for _, idf, postings, _ in selective]
+                common = terms[len(selective) :]
+            else:
+                # only common terms: their champions select the candidates, which
+                # are then scored by all postings
+                selecting = [
+                    (idf, self._champion_postings(term)) for _, idf, _, term in terms
+                ]
+                common = terms
+
+            rows = numpy.concatenate(
+                [rows for _, postings in selecting for rows, _ in postings]
+            )
+            contributions = numpy.concatenate(
+                [
+                    self._term_weights(rows, tfs, idf)
+                    for idf, postings in selecting
+                    for rows, tfs in postings
+                ]
+            )
+            if mask is not None or not selective:
+                keep = ~excluded[rows]
+                rows, contributions = rows[keep], contributions[keep]
+            if not len(rows):
+                return []
+
+            # the postings of every term are sorted by row, so a stable (merge)
+            # sort of their concatenation is near-linear
+            order = numpy.argsort(rows, kind="stable")
+            rows, contributions = rows[order], contributions[order]
+            starts = numpy.flatnonzero(numpy.diff(rows, prepend=-1))
+            candidates = rows[starts]
+            scores = numpy.add.reduceat(contributions, starts)
+
+            if len(candidates) > self.max_postings:
+                keep = numpy.argpartition(scores, -self.max_postings)[
+                    -self.max_postings :
+                ]
+                keep.sort()  # sorted candidates make the lookups below cache-friendly
+                candidates, scores = candidates[keep], scores[keep]
+            if not selective:
+                scores[:] = 0
+
+        for _, idf, postings, _ in common:
+            for term_rows, term_tfs in postings:
+                positions = numpy.searchsorted(term_rows, candidates)
+                positions = numpy.minimum(positions, len(term_rows) - 1)
+                found = term_rows[positions] == candidates
+                scores[found] += self._term_weights(
+                    candidates[found], term_tfs[positions[found]], idf
+                )
+
+        scores[excluded[candidates]] = -numpy.inf
+        if allowed is not None:
+            # allowed chunks that contain no query term
+            scores[scores == 0] = -numpy.inf
+
+        top_k = min(top_k, int(numpy.isfinite(scores).sum()))
+        if not top_k:
+            return []
+        if top_k < len(scores):
+            best = numpy.argpartition(scores, -top_k)[-top_k:]
+        else:
+            best = numpy.arange(len(scores))
+        best = best[numpy.argsort(scores[best])[::-1]]
+
+        return [
+            {"__id__": self.ids[candidates[i]], "__metrics__": float(scores[i])}
+            for i in best
+        ]
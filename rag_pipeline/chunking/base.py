@@ -1,4 +1,5 @@
 from abc import abstractmethod, ABC
+from util.instrumentation import instrument_methods, instrumented
 
 
 class AbstractChunking(ABC):
@@ -8,6 +9,7 @@ class AbstractChunking(ABC):
         super().__init_subclass__(**kwargs)
         if hasattr(cls, "name"):
             AbstractChunking._implementations[cls.name] = cls
+        instrument_methods(cls, {"chunk": "chunk", "chunk_batch": "chunk"})
 
     @classmethod
     def create(
@@ -49,3 +51,15 @@ class AbstractChunking(ABC):
             list: The chunked content.
         """
         pass
+
+    @instrumented("chunk")
+    def chunk_batch(self, contents: list) -> list:
+        """Chunks many documents at once. Implementations may parallelize this.
+
+        Args:
+            contents (list): The contents to chunk.
+
+        Returns:
+            list: The chunked content of every document, in input order.
+        """
+        return [self.chunk(content) for content in contents]
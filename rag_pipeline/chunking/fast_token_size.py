@@ -0,0 +1,91 @@
+import functools
+import numpy as np
+from .base import AbstractChunking
+from util.process_docs import get_encoding
+
+
+@functools.lru_cache(maxsize=None)
+def token_byte_lengths(tokenizer: str) -> np.ndarray:
+    """Returns the UTF-8 byte length of every token of an encoding. Computed once
+    per process.
+
+    Args:
+        tokenizer (str): The tokenizer.
+
+    Returns:
+        np.ndarray: Byte length by token id.
+    """
+    enc = get_encoding(tokenizer)
+    lengths = np.zeros(enc.n_vocab, dtype=np.int64)
+    for token in range(enc.n_vocab):
+        try:
+            lengths[token] = len(enc.decode_single_token_bytes(token))
+        except KeyError:
+            pass  # unused token id
+    return lengths
+
+
+class FastChunkingByTokenSize(AbstractChunking):
+    """Produces the same token windows as `ChunkingByTokenSize`, without decoding
+    every window. Token byte lengths are summed to find the character offsets of
+    the windows, so each chunk is a slice of the source text. Many documents are
+    encoded at once with Tiktoken's multi-threaded batch encoder.
+    """
+
+    name = "token_size_fast"
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.num_threads = config.get("chunking_num_threads", 8)
+
+    def _split(self, content: str, tokens: list) -> list:
+        """Splits a document into overlapping token windows.
+
+        Args:
+            content (str): The document.
+            tokens (list): The document's Token-IDs.
+
+        Returns:
+            list: The chunks.
+        """
+        if not tokens:
+            return []
+
+        # byte offset of the end of every token
+        byte_ends = np.cumsum(token_byte_lengths(self.tokenizer)[tokens])
+        byte_starts = np.concatenate([[0], byte_ends[:-1]])
+
+        # number of characters that start before each byte offset
+        content_bytes = np.frombuffer(content.encode("utf-8"), dtype=np.uint8)
+        char_at_byte = np.concatenate([[0], np.cumsum((content_bytes & 0xC0) != 0x80)])
+
+        starts = np.arange(
+            0, len(tokens), self.max_token_size - self.overlap_token_size
+        )
+        ends = np.minimum(starts + self.max_token_size, len(tokens))
+        char_starts = char_at_byte[byte_starts[starts]]
+        char_ends = char_at_byte[byte_ends[ends - 1]]
+
+        return [
+            {
+                "tokens": int(end - start),
+                "content": content[char_start:char_end].strip(),
+                "chunk_order_index": index,
+            }
+            for index, (start, end, char_start, char_end) in enumerate(
+                zip(starts, ends, char_starts, char_ends)
+            )
+        ]
+
+    def chunk(self, content: str) -> list:
+        tokens = get_encoding(self.tokenizer).encode_ordinary(content)
+        return self._split(content, tokens)
+
+    def chunk_batch(self, contents: list) -> list:
+        token_lists = get_encoding(self.tokenizer).encode_ordinary_batch(
+            contents, num_threads=self.num_threads
+        )
+        return [
+            self._split(content, tokens)
+            for content, tokens in zip(contents, token_lists)
+        ]
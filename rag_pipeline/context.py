@@ -0,0 +1,210 @@
+import re
+import threading
+from util.instrumentation import instrumented, metrics
+from util.process_docs import get_encoding
+
+
+def join_overlapping(first: str, second: str, probe: int = 32) -> str:
+    """Joins the texts of consecutive chunks, keeping the text they share once.
+
+    Args:
+        first (str): The text of the earlier chunk.
+        second (str): The text of the following chunk.
+        probe (int, optional): Length of the prefix of `second` searched for in
+            `first`. Defaults to 32.
+
+    Returns:
+        str: The joined text; the plain concatenation if the chunks don't overlap.
+    """
+    if not second:
+        return first
+
+    head = second[:probe]
+    # the overlap can't be longer than the second chunk
+    position = first.find(head, max(0, len(first) - len(second)))
+    while position != -1:
+        if second.startswith(first[position:]):
+            return first[:position] + second
+        position = first.find(head, position + 1)
+    return first + second
+
+
+def shingles(text: str, size: int = 5) -> set:
+    """Returns the set of word n-grams of a text, used to compare passages.
+
+    Args:
+        text (str): The text.
+        size (int, optional): Words per n-gram. Defaults to 5.
+
+    Returns:
+        set: The n-grams; the single words for texts shorter than `size`.
+    """
+    words = re.findall(r"\w+", text.casefold())
+    if len(words) < size:
+        return set(words)
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+class ContextAssembler:
+    """Turns retrieved chunks into the passages of the prompt context.
+
+    1. Chunks of the same document with consecutive `chunk_order_index` are merged
+       into one passage; the tokens they overlap by are kept once.
+    2. Passages whose word 5-grams are already covered by a better scoring passage
+       to at least `context_dedup_threshold` are dropped as near-duplicates.
+    3. The remaining passages, best first, are packed into `context_max_tokens`
+       tokens of the configured tokenizer (0 disables the budget). The first
+       passage that doesn't fit is truncated if at least `min_passage_tokens`
+       remain.
+
+    Tokens saved are counted against sending every retrieved chunk in full.
+    """
+
+    min_passage_tokens = 50
+
+    def __init__(self, config: dict) -> None:
+        self.max_tokens = config.get("context_max_tokens", 4000)
+        self.dedup_threshold = config.get("context_dedup_threshold", 0.8)
+        self.tokenizer = config["tokenizer"]
+
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.tokens = 0
+        self.tokens_saved = 0
+
+    def _count_tokens(self, text: str) -> int:
+        return len(get_encoding(self.tokenizer).encode_ordinary(text))
+
+    @staticmethod
+    def _stored_tokens(chunk: dict) -> int | None:
+        """Returns the stored token count of a chunk, or None if it is unknown,
+        e.g. "TBD" in text DBs of older versions."""
+        tokens = chunk.get("tokens")
+        if isinstance(tokens, int) and not isinstance(tokens, bool):
+            return tokens
+        return None
+
+    def _merge(self, chunks: list) -> list:
+        """Merges consecutive chunks of the same document into passages."""
+        ordered = sorted(
+            chunks,
+            key=lambda c: (c.get("full_doc_id", ""), c.get("chunk_order_index", 0)),
+        )
+
+        passages = []
+        for chunk in ordered:
+            previous = passages[-1] if passages else None
+            if (
+                previous is not None
+                and previous["full_doc_id"] == chunk.get("full_doc_id")
+                and previous["last_order_index"] + 1 == chunk.get("chunk_order_index")
+            ):
+                previous["content"] = join_overlapping(
+                    previous["content"], chunk["content"]
+                )
+                previous["ids"].append(chunk["id"])
+                previous["score"] = max(previous["score"], chunk["score"])
+                previous["last_order_index"] += 1
+                previous["tokens"] = None
+            else:
+                passages.append(
+                    {
+                        "full_doc_id": chunk.get("full_doc_id"),
+                        "content": chunk["content"],
+                        "ids": [chunk["id"]],
+                        "score": chunk["score"],
+                        "last_order_index": chunk.get("chunk_order_index"),
+                        "tokens": self._stored_tokens(chunk),
+                    }
+                )
+
+        for passage in passages:
+            del passage["last_order_index"]
+        return passages
+
+    def _deduplicate(self, passages: list) -> list:
+        """Drops passages mostly covered by better scoring ones; best first."""
+        kept = []
+        seen = set()
+        for passage in sorted(passages, key=lambda p: p["score"], reverse=True):
+            passage_shingles = shingles(passage["content"])
+            if passage_shingles and (
+                len(passage_shingles & seen) / len(passage_shingles)
+                >= self.dedup_threshold
+            ):
+                continue
+            seen |= passage_shingles
+            kept.append(passage)
+        return kept
+
+    def _pack(self, passages: list) -> list:
+        """Keeps the passages that fit into the token budget."""
+        packed = []
+        remaining = self.max_tokens
+        for passage in passages:
+            if passage["tokens"] is None:
+                passage["tokens"] = self._count_tokens(passage["content"])
+            if not self.max_tokens or passage["tokens"] <= remaining:
+                packed.append(passage)
+                remaining -= passage["tokens"]
+            elif remaining >= self.min_passage_tokens:
+                encoding = get_encoding(self.tokenizer)
+                tokens = encoding.encode_ordinary(passage["content"])[:remaining]
+                packed.append(
+                    {**passage, "content": encoding.decode(tokens), "tokens": remaining}
+                )
+                break
+        return packed
+
+    @instrumented("context_assembly")
+    def assemble(self, chunks: list) -> tuple[list, dict]:
+        """Assembles the context of a query.
+
+        Args:
+            chunks (list): The retrieved chunks with "id", "score", "content",
+                "full_doc_id", "chunk_order_index" and optionally "tokens".
+
+        Returns:
+            tuple[list, dict]: The passages, best first, each with "full_doc_id",
+                "content", "ids", "score" and "tokens"; and a report with the
+                number of "chunks" and "passages", the context "tokens" and the
+                "tokens_saved".
+        """
+        tokens_before = sum(
+            (
+                tokens
+                if (tokens := self._stored_tokens(chunk)) is not None
+                else self._count_tokens(chunk["content"])
+            )
+            for chunk in chunks
+        )
+
+        passages = self._pack(self._deduplicate(self._merge(chunks)))
+
+        tokens = sum(passage["tokens"] for passage in passages)
+        report = {
+            "chunks": len(chunks),
+            "passages": len(passages),
+            "tokens": tokens,
+            "tokens_saved": tokens_before - tokens,
+        }
+
+        with self._lock:
+            self.queries += 1
+            self.tokens += tokens
+            self.tokens_saved += report["tokens_saved"]
+        metrics.count("context_tokens", tokens)
+        metrics.count("context_tokens_saved", report["tokens_saved"])
+
+        return passages, report
+
+    def stats(self) -> dict:
+        """Returns the context tokens and tokens saved, in total and per query."""
+        return {
+            "queries": self.queries,
+            "tokens": self.tokens,
+            "tokens_saved": self.tokens_saved,
+            "tokens_saved_per_query": (
+                self.tokens_saved / self.queries if self.queries else 0.0
+            ),
+        }
@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
 import numpy
 import os
+from util.instrumentation import instrument_methods, instrumented
 
 
 class AbstractDB(ABC):
@@ -10,6 +11,16 @@ class AbstractDB(ABC):
         super().__init_subclass__(**kwargs)
         if hasattr(cls, "name"):
             AbstractDB._implementations[cls.name] = cls
+        instrument_methods(
+            cls,
+            {
+                "query_db": "vector_search",
+                "query_db_batch": "vector_search",
+                "upsert": "vector_upsert",
+                "save": "vector_save",
+                "load": "vector_load",
+            },
+        )
 
     @classmethod
     def create(cls, implementation_name: str, config: dict, **kwargs) -> "AbstractDB":
@@ -35,6 +46,7 @@ class AbstractDB(ABC):
 
     def __init__(self, config: dict) -> None:
         self.embedding_dim = config["embedding_dim"]
+        self.dir_vector_db = config["dir_vector_db"]
         self.storage_file = os.path.join(config["dir_vector_db"], "vdb.json")
         self.vdb = self._init_client()
 
@@ -44,26 +56,56 @@ class AbstractDB(ABC):
         pass
 
     @abstractmethod
-    def update(self, data: numpy.ndarray) -> None:
-        """Updates DB with given data.
+    def upsert(self, data: list) -> None:
+        """Inserts or updates the given data in memory without persisting it.
 
         Args:
-            data (numpy.ndarray): The data.
+            data (list): List of dicts containing "__id__", "__vector__" and
+                optionally "__metadata__", a dict of filterable fields whose values
+                are strings, numbers or lists of them.
         """
         pass
 
+    @abstractmethod
+    def delete(self, ids: list) -> None:
+        """Deletes the given ids in memory without persisting it.
+
+        Args:
+            ids (list): The ids to delete.
+        """
+        pass
+
+    @abstractmethod
+    def save(self) -> None:
+        """Persists the vector DB."""
+        pass
+
+    def update(self, data: list) -> None:
+        """Updates DB with given data and persists it.
+
+        Args:
+            data (list): List of dicts containing "__id__" and "__vector__".
+        """
+        self.upsert(data)
+        self.save()
+
     @abstractmethod
     def load(self) -> None:
         """Loads the vector DB."""
         pass
 
     @abstractmethod
-    def query_db(self, query: numpy.ndarray, top_k: int) -> list:
+    def query_db(
+        self, query: numpy.ndarray, top_k: int, filters: dict | None = None
+    ) -> list:
         """Queries the DB for chunks.
 
         Args:
             query (str): Embedded query.
             top_k (int, optional): Top k results to be returned. Defaults to 5.
+            filters (dict | None, optional): Filter expression on the metadata, see
+                `rag_pipeline.db.metadata`. Only matching chunks are scored.
+                Defaults to None.
 
         Returns:
             list: List of relevant chunks.
@@ -71,6 +113,65 @@ class AbstractDB(ABC):
         """
         pass
 
+    @instrumented("vector_search")
+    def query_db_batch(
+        self, queries: numpy.ndarray, top_k: int = 5, filters: dict | None = None
+    ) -> list:
+        """Queries the DB for several embedded queries at once.
+
+        Args:
+            queries (numpy.ndarray): (n, embedding_dim) embedded queries.
+            top_k (int, optional): Top k results per query. Defaults to 5.
+            filters (dict | None, optional): Filter expression applied to all
+                queries. Defaults to None.
+
+        Returns:
+            list: One list of relevant chunks per query, in input order.
+        """
+        return [self.query_db(query, top_k, filters) for query in queries]
+
+    @abstractmethod
+    def filter_ids(self, ids: list, filters: dict) -> list:
+        """Keeps the ids whose metadata passes a filter expression, e.g. to filter
+        results of another retriever.
+
+        Args:
+            ids (list): The ids.
+            filters (dict): The filter expression.
+
+        Returns:
+            list: The passing ids, in input order.
+        """
+        pass
+
+    def matching_ids(self, filters: dict) -> list | None:
+        """Returns the ids of all vectors passing a filter expression, e.g. to
+        restrict another retriever to them before it ranks.
+
+        Args:
+            filters (dict): The filter expression.
+
+        Returns:
+            list | None: The passing ids, or None if the DB has no metadata index
+                to find them without a full scan; results of other retrievers
+                are then filtered with `filter_ids`.
+        """
+        return None
+
+    def matching_rows(self, filters: dict) -> tuple | None:
+        """Like `matching_ids`, but as a boolean mask over the rows of the DB, so
+        another index can map the rows to its own once and reuse that mapping.
+
+        Args:
+            filters (dict): The filter expression.
+
+        Returns:
+            tuple | None: A key that changes whenever the rows do, the id of every
+                row and the mask of the passing rows; or None if the DB doesn't
+                number its vectors by row, then see `matching_ids`.
+        """
+        return None
+
     @abstractmethod
     def req_update(
         self, dir_text_chunks: str, dir_vector_db: str, dir_doc_store: str
@@ -0,0 +1,94 @@
+import json
+import numpy
+from util.batching import MicroBatcher
+from .base import AbstractDB
+
+
+class BatchedDB(AbstractDB):
+    """Answers single queries that many threads submit concurrently, e.g. the
+    queries of a server's request threads, with shared `query_db_batch` calls to
+    the wrapped DB, which scan the vectors once for the whole batch.
+
+    Queries wait up to `server_batch_window_ms` for others to join their batch of
+    at most `server_batch_max_size` queries. A batch is split into one
+    `query_db_batch` call per distinct top_k and filter expression. Everything else
+    is delegated to the wrapped DB.
+    """
+
+    def __init__(self, db: AbstractDB, config: dict) -> None:
+        self.db = db
+        self.batcher = MicroBatcher(
+            self._query_batch,
+            window=config.get("server_batch_window_ms", 2) / 1000,
+            max_batch_size=config.get("server_batch_max_size", 64),
+        )
+        super().__init__(config)
+
+    def _init_client(self):
+        return self.db.vdb
+
+    def __getattr__(self, name: str):
+        # other attributes of the wrapped DB
+        if name == "db":
+            raise AttributeError(name)
+        return getattr(self.db, name)
+
+    def _query_batch(self, items: list) -> list:
+        """Answers (query, top_k, filters) items with one `query_db_batch` call per
+        distinct top_k and filter expression."""
+        groups = {}
+        for i, (_, top_k, filters) in enumerate(items):
+            key = (top_k, json.dumps(filters, sort_keys=True) if filters else None)
+            groups.setdefault(key, []).append(i)
+
+        results = [None] * len(items)
+        for (top_k, _), indices in groups.items():
+            queries = numpy.stack([items[i][0] for i in indices])
+            filters = items[indices[0]][2]
+            for i, result in zip(
+                indices, self.db.query_db_batch(queries, top_k, filters)
+            ):
+                results[i] = result
+        return results
+
+    def close(self) -> None:
+        """Stops the batching thread and closes the wrapped DB, if it can be."""
+        self.batcher.close()
+        if hasattr(self.db, "close"):
+            self.db.close()
+
+    def upsert(self, data: list) -> None:
+        self.db.upsert(data)
+
+    def delete(self, ids: list) -> None:
+        self.db.delete(ids)
+
+    def save(self) -> None:
+        self.db.save()
+
+    def load(self) -> None:
+        self.db.load()
+
+    def query_db(
+        self, query: numpy.ndarray, top_k: int = 5, filters: dict | None = None
+    ) -> list:
+        return self.batcher((numpy.asarray(query, dtype=numpy.float32), top_k, filters))
+
+    def query_db_batch(
+        self, queries: numpy.ndarray, top_k: int = 5, filters: dict | None = None
+    ) -> list:
+        return self.db.query_db_batch(queries, top_k, filters)
+
+    def filter_ids(self, ids: list, filters: dict) -> list:
+        return self.db.filter_ids(ids, filters)
+
+    def matching_ids(self, filters: dict) -> list | None:
+        return self.db.matching_ids(filters)
+
+    def matching_rows(self, filters: dict) -> tuple | None:
+        return self.db.matching_rows(filters)
+
+    def req_update(
+        self, dir_text_chunks: str, dir_vector_db: str, dir_doc_store: str
+    ) -> bool:
+        return self.db.req_update(dir_text_chunks, dir_vector_db, dir_doc_store)
@@ -0,0 +1,240 @@
+import math
+import os
+import numpy
+from util.instrumentation import metrics
+from util.storage import versioned_name
+from .mmap_vdb import MmapDB, normalize, top_k_indices
+
+
+def kmeans(
+    vectors: numpy.ndarray, n_clusters: int, iterations: int, seed: int = 0
+) -> numpy.ndarray:
+    """Spherical k-means on normalized vectors.
+
+    Args:
+        vectors (numpy.ndarray): (n, dim) normalized training vectors.
+        n_clusters (int): Number of centroids.
+        iterations (int): Number of Lloyd iterations.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        numpy.ndarray: (n_clusters, dim) normalized centroids.
+    """
+    rng = numpy.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = assign(vectors, centroids)
+
+        order = numpy.argsort(assignments, kind="stable")
+        counts = numpy.bincount(assignments, minlength=n_clusters)
+        starts = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]])
+
+        sums = numpy.zeros_like(centroids)
+        non_empty = counts > 0
+        sums[non_empty] = numpy.add.reduceat(vectors[order], starts[non_empty], axis=0)
+
+        # re-seed empty clusters with random training vectors
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), empty.sum())]
+
+        centroids = normalize(sums)
+
+    return centroids.astype(numpy.float32)
+
+
+def assign(
+    vectors: numpy.ndarray, centroids: numpy.ndarray, block_size: int = 1 << 14
+) -> numpy.ndarray:
+    """Assigns every vector to its most similar centroid.
+
+    Args:
+        vectors (numpy.ndarray): (n, dim) normalized vectors.
+        centroids (numpy.ndarray): (n_clusters, dim) normalized centroids.
+        block_size (int, optional): Vectors scored at once. Defaults to 16384.
+
+    Returns:
+        numpy.ndarray: (n,) int32 centroid indices.
+    """
+    assignments = numpy.empty(len(vectors), dtype=numpy.int32)
+    for start in range(0, len(vectors), block_size):
+        block = numpy.asarray(vectors[start : start + block_size], numpy.float32)
+        assignments[start : start + block_size] = numpy.argmax(
+            block @ centroids.T, axis=1
+        )
+    return assignments
+
+
+class IVFDB(MmapDB):
+    """Approximate nearest neighbour search with an inverted file (IVF) index on top
+    of the memory-mapped vector store.
+
+    Vectors are clustered with k-means into `ivf_nlist` lists. A query only scores
+    the vectors of the `ivf_nprobe` lists whose centroids are most similar to it.
+    Vectors added after training are assigned to their nearest existing centroid;
+    the centroids are retrained once the DB has doubled in size. Until
+    `min_train_size` vectors exist, queries fall back to the exact scan.
+    """
+
+    name = "ivf_vdb"
+
+    min_train_size = 1000
+
+    legacy_files = {**MmapDB.legacy_files, "ivf": "ivf.npz"}
+
+    def __init__(self, config: dict) -> None:
+        self.nlist = config.get("ivf_nlist", 0)
+        self.nprobe = config.get("ivf_nprobe", 8)
+        self.train_sample = config.get("ivf_train_sample", 100_000)
+        self.kmeans_iterations = config.get("ivf_kmeans_iterations", 20)
+        super().__init__(config)
+
+    def _load_commit(self) -> None:
+        super()._load_commit()
+        self.centroids = None
+        self.assignments = numpy.empty(0, dtype=numpy.int32)
+        self.trained_count = 0
+        self._lists = None
+
+        if self.ids and "ivf" in self.files and os.path.exists(self._path("ivf")):
+            with numpy.load(self._path("ivf")) as index:
+                self.centroids = index["centroids"]
+                self.assignments = index["assignments"][: len(self.ids)]
+                self.trained_count = int(index["trained_count"])
+
+    def _needs_training(self) -> bool:
+        if len(self.rows) < self.min_train_size:
+            return False
+        return self.centroids is None or len(self.rows) >= 2 * self.trained_count
+
+    def train(self) -> None:
+        """(Re-)trains the centroids on a sample of the stored vectors and
+        reassigns all vectors."""
+        alive = numpy.flatnonzero(~self._dead_mask())
+        rng = numpy.random.default_rng(0)
+        sample = numpy.sort(
+            rng.choice(alive, min(len(alive), self.train_sample), replace=False)
+        )
+        nlist = self.nlist or int(4 * math.sqrt(len(alive)))
+        nlist = max(1, min(nlist, len(sample)))
+
+        training_vectors = numpy.asarray(self.matrix[sample], numpy.float32)
+        self.centroids = kmeans(training_vectors, nlist, self.kmeans_iterations)
+        self.assignments = assign(self.matrix, self.centroids)
+        self.trained_count = len(alive)
+        self._lists = None
+
+    def _assign_pending(self) -> None:
+        """Assigns vectors appended since the last assignment to their lists."""
+        if self.centroids is None or len(self.assignments) == len(self.ids):
+            return
+
+        pending = self.matrix[len(self.assignments) :]
+        self.assignments = numpy.concatenate(
+            [self.assignments, assign(pending, self.centroids)]
+        )
+        self._lists = None
+
+    def _inverted_lists(self) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """Returns the rows sorted by list and the offsets of every list (CSR)."""
+        if self._lists is None:
+            order = numpy.argsort(self.assignments, kind="stable")
+            offsets = numpy.searchsorted(
+                self.assignments[order], numpy.arange(len(self.centroids) + 1)
+            )
+            self._lists = (order, offsets)
+        return self._lists
+
+    def _compact(self) -> None:
+        self._assign_pending()
+        alive = ~self._dead_mask()
+        super()._compact()
+        if self.centroids is not None:
+            self.assignments = self.assignments[alive]
+            self._lists = None
+
+    def save(self) -> None:
+        if self.lock.held:
+            if self._needs_training():
+                self.train()
+            else:
+                self._assign_pending()
+
+        super().save()
+
+    def _write_files(self, version: int) -> dict:
+        files = super()._write_files(version)
+        if self.centroids is None:
+            return files
+
+        files["ivf"] = versioned_name("ivf", version, ".npz")
+        with open(os.path.join(self.dir_vector_db, files["ivf"]), "wb") as file:
+            numpy.savez(
+                file,
+                centroids=self.centroids,
+                assignments=self.assignments,
+                trained_count=self.trained_count,
+            )
+        return files
+
+    def candidate_rows(
+        self,
+        query: numpy.ndarray,
+        nprobe: int,
+        excluded: numpy.ndarray | None = None,
+    ) -> numpy.ndarray:
+        """Returns the sorted, non-excluded rows of the `nprobe` closest lists.
+
+        Args:
+            query (numpy.ndarray): The normalized query.
+            nprobe (int): Number of lists to search.
+            excluded (numpy.ndarray | None, optional): Rows to skip. Defaults to
+                the deleted rows.
+
+        Returns:
+            numpy.ndarray: The candidate rows.
+        """
+        order, offsets = self._inverted_lists()
+        probes = top_k_indices(self.centroids @ query, nprobe)
+        rows = numpy.concatenate(
+            [order[offsets[probe] : offsets[probe + 1]] for probe in probes]
+        )
+        rows = numpy.sort(rows)  # sequential access into the map
+        if excluded is None:
+            excluded = self._dead_mask()
+        return rows[~excluded[rows]]
+
+    def query_db(
+        self, query: numpy.ndarray, top_k: int = 5, filters: dict | None = None
+    ) -> list:
+        if self.centroids is None:
+            return super().query_db(query, top_k, filters)
+
+        self._assign_pending()
+        query = normalize(numpy.asarray(query, dtype=numpy.float32))
+
+        excluded = self._excluded_mask(filters)
+        remaining = len(excluded) - numpy.count_nonzero(excluded)
+        if filters and remaining <= self.nprobe * len(excluded) / len(self.centroids):
+            # fewer rows pass the filter than the probed lists hold; score them all
+            return super().query_db(query, top_k, filters)
+
+        rows = self.candidate_rows(query, self.nprobe, excluded)
+        if filters and len(rows) < top_k:
+            # the filter removed most candidates of the probed lists
+            return super().query_db(query, top_k, filters)
+        metrics.count("vectors_scanned", len(rows))
+        scores = self.matrix[rows].astype(numpy.float32, copy=False) @ query
+        keep = top_k_indices(scores, top_k)
+
+        return [
+            {"__id__": self.ids[rows[i]], "__metrics__": float(scores[i])} for i in keep
+        ]
+
+    def query_db_batch(
+        self, queries: numpy.ndarray, top_k: int = 5, filters: dict | None = None
+    ) -> list:
+        if self.centroids is None:
+            return super().query_db_batch(queries, top_k, filters)
+
+        return [self.query_db(query, top_k, filters) for query in queries]
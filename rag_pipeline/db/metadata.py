@@ -0,0 +1,189 @@
+import json
+import os
+from collections import OrderedDict
+import numpy
+
+# Filter expressions are dicts; all conditions of a dict must hold:
+#   {"full_doc_id": "a.txt"}                equals, or contains for list fields (tags)
+#   {"full_doc_id": ["a.txt", "b.txt"]}     any of the values
+#   {"tags": "finance", "year": 2024}       several fields
+#   {"$or": [filter, ...]}, {"$and": [filter, ...]}, {"$not": filter}
+
+
+def _values(value) -> list:
+    return value if isinstance(value, list) else [value]
+
+
+def matches(filters: dict, metadata: dict) -> bool:
+    """Evaluates a filter expression against the metadata of a single vector.
+
+    Args:
+        filters (dict): The filter expression.
+        metadata (dict): The metadata.
+
+    Returns:
+        bool: Whether the metadata passes the filter.
+    """
+    for key, condition in filters.items():
+        if key == "$and":
+            if not all(matches(f, metadata) for f in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(f, metadata) for f in condition):
+                return False
+        elif key == "$not":
+            if matches(condition, metadata):
+                return False
+        elif not set(_values(condition)) & set(_values(metadata.get(key, []))):
+            return False
+    return True
+
+
+class MetadataIndex:
+    """Metadata of every row of a vector matrix, with an inverted index from
+    (field, value) to rows.
+
+    Filter expressions are evaluated as boolean masks over all rows, combined from
+    per-value bitmaps, so a filter costs a few vectorized AND/OR operations instead
+    of a pass over the metadata. The `max_cached_bitmaps` most recently used bitmaps
+    are kept.
+
+    The metadata is stored as one JSON object per row, appended like the ids of
+    `MmapDB`. After updates or a compaction, it is written to a new file with
+    `save_as`.
+    """
+
+    max_cached_bitmaps = 256
+
+    def __init__(self, storage_file: str) -> None:
+        self.storage_file = storage_file
+        self.records = []
+        self.postings = {}
+        self._bitmaps = OrderedDict()
+        self._dirty = False
+
+    def load(self, count: int) -> None:
+        """Loads the metadata of the first `count` rows; missing rows (e.g. of a DB
+        written before metadata was stored) get empty metadata.
+
+        Args:
+            count (int): Number of committed rows.
+        """
+        self.records = []
+        self.postings = {}
+        self._bitmaps.clear()
+
+        lines = []
+        if os.path.exists(self.storage_file):
+            with open(self.storage_file, "r", encoding="utf-8") as file:
+                lines = file.read().splitlines()
+
+        for line in lines[:count]:
+            metadata = json.loads(line)
+            self._index(len(self.records), metadata)
+            self.records.append(metadata)
+        while len(self.records) < count:
+            self.records.append({})
+
+        # rewrite if rows are missing, e.g. of a DB written before metadata was
+        # stored; lines beyond `count` are uncommitted and ignored
+        self._dirty = len(lines) < count
+
+    def _index(self, row: int, metadata: dict) -> None:
+        for field, value in metadata.items():
+            for v in _values(value):
+                self.postings.setdefault((field, v), set()).add(row)
+
+    def append(self, metadatas: list) -> None:
+        """Adds the metadata of new rows and appends it to the storage file.
+
+        Args:
+            metadatas (list): The metadata of every new row.
+        """
+        for metadata in metadatas:
+            self._index(len(self.records), metadata)
+            self.records.append(metadata)
+        self._bitmaps.clear()
+
+        if not self._dirty:
+            with open(self.storage_file, "a", encoding="utf-8") as file:
+                file.writelines(
+                    json.dumps(metadata, ensure_ascii=False) + "\n"
+                    for metadata in metadatas
+                )
+
+    def compact(self, alive: list) -> None:
+        """Keeps the metadata of the given rows only, renumbered in order.
+
+        Args:
+            alive (list): The rows to keep.
+        """
+        records = [self.records[row] for row in alive]
+        self.records = []
+        self.postings = {}
+        self._bitmaps.clear()
+        for metadata in records:
+            self._index(len(self.records), metadata)
+            self.records.append(metadata)
+        self._dirty = True
+
+    @property
+    def dirty(self) -> bool:
+        """Whether the storage file doesn't match the records."""
+        return self._dirty
+
+    def save_as(self, storage_file: str) -> None:
+        """Writes the metadata of all rows to a new storage file, which is appended
+        to from then on.
+
+        Args:
+            storage_file (str): The new file.
+        """
+        with open(storage_file, "w", encoding="utf-8") as file:
+            file.writelines(
+                json.dumps(metadata, ensure_ascii=False) + "\n"
+                for metadata in self.records
+            )
+        self.storage_file = storage_file
+        self._dirty = False
+
+    def _bitmap(self, field: str, value) -> numpy.ndarray:
+        key = (field, value)
+        bitmap = self._bitmaps.get(key)
+        if bitmap is None:
+            bitmap = numpy.zeros(len(self.records), dtype=bool)
+            bitmap[list(self.postings.get(key, ()))] = True
+            self._bitmaps[key] = bitmap
+            if len(self._bitmaps) > self.max_cached_bitmaps:
+                self._bitmaps.popitem(last=False)
+        else:
+            self._bitmaps.move_to_end(key)
+        return bitmap
+
+    def mask(self, filters: dict) -> numpy.ndarray:
+        """Evaluates a filter expression over all rows.
+
+        Args:
+            filters (dict): The filter expression.
+
+        Returns:
+            numpy.ndarray: Boolean mask that is True for rows passing the filter.
+        """
+        result = numpy.ones(len(self.records), dtype=bool)
+        for key, condition in filters.items():
+            if key == "$and":
+                for f in condition:
+                    result &= self.mask(f)
+            elif key == "$or":
+                any_of = numpy.zeros(len(self.records), dtype=bool)
+                for f in condition:
+                    any_of |= self.mask(f)
+                result &= any_of
+            elif key == "$not":
+                result &= ~self.mask(condition)
+            else:
+                any_of = numpy.zeros(len(self.records), dtype=bool)
+                for value in _values(condition):
+                    any_of |= self._bitmap(key, value)
+                result &= any_of
+        return result
@@ -0,0 +1,495 @@
+import os
+from collections.abc import Iterator
+import numpy
+from util.check_db import is_update_required
+from util.instrumentation import metrics
+from util.storage import (
+    WriterLock,
+    commit_json,
+    commit_lock,
+    read_json,
+    remove_unreferenced,
+    truncate_lines,
+    unshare,
+    versioned_name,
+)
+from .base import AbstractDB
+from .metadata import MetadataIndex, matches
+
+
+def normalize(vectors: numpy.ndarray) -> numpy.ndarray:
+    """L2-normalizes vectors along the last axis.
+
+    Args:
+        vectors (numpy.ndarray): The vectors.
+
+    Returns:
+        numpy.ndarray: The normalized vectors.
+    """
+    norm = numpy.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / numpy.maximum(norm, 1e-12)
+
+
+def top_k_indices(scores: numpy.ndarray, top_k: int) -> numpy.ndarray:
+    """Returns the indices of the `top_k` highest scores in descending order.
+
+    Args:
+        scores (numpy.ndarray): The scores.
+        top_k (int): Number of indices to return.
+
+    Returns:
+        numpy.ndarray: The indices.
+    """
+    if top_k < len(scores):
+        candidates = numpy.argpartition(scores, -top_k)[-top_k:]
+    else:
+        candidates = numpy.arange(len(scores))
+    return candidates[numpy.argsort(scores[candidates])[::-1]]
+
+
+class MmapDB(AbstractDB):
+    """Vector DB that keeps vectors in a binary, memory-mapped matrix.
+
+    Files within `dir_vector_db`:
+        - vectors-NNNNNN.bin: contiguous (count, embedding_dim) matrix of normalized
+          vectors
+        - ids-NNNNNN.txt: one chunk id per matrix row
+        - metadata-NNNNNN.jsonl: filterable metadata of every row, see
+          `MetadataIndex`
+        - meta.json: the last commit: dim, dtype, row count, deleted rows and the
+          names of the files above
+
+    Loading maps the matrix instead of decoding it, so start-up is near-instant and
+    processes mapping the same file share its pages through the OS page cache.
+    Loading never writes; rows beyond the committed count are ignored.
+
+    The first change after a commit takes the directory's `WriterLock` until the
+    next save. New vectors are appended to the files; replaced and deleted rows are
+    only marked as deleted, so committed rows never change while readers map them.
+    Compactions and rewritten files get new, versioned names. meta.json is replaced
+    last, so readers and a crash see either the previous or the new commit. Rows a
+    crashed writer appended after the last commit are cut off by the next writer.
+    """
+
+    name = "mmap_vdb"
+
+    # deleted rows are only compacted away once they exceed this fraction
+    compaction_threshold = 0.25
+    scan_block_size = 1 << 16
+    # filters passing at most this fraction of rows score only those rows
+    filter_gather_fraction = 0.5
+
+    # file kinds named by every commit, see `versioned_name`
+    extensions = {"vectors": ".bin", "ids": ".txt", "metadata": ".jsonl"}
+    # file names of DBs written before the names were versioned
+    legacy_files = {
+        "vectors": "vectors.bin",
+        "ids": "ids.txt",
+        "metadata": "metadata.jsonl",
+    }
+
+    def __init__(self, config: dict) -> None:
+        self.dtype = numpy.dtype(config.get("vdb_dtype", "float32"))
+        self.dir_vector_db = config["dir_vector_db"]
+        self.meta_file = os.path.join(self.dir_vector_db, "meta.json")
+        self.lock = WriterLock(self.dir_vector_db)
+        super().__init__(config)
+
+    def _path(self, kind: str) -> str:
+        return os.path.join(self.dir_vector_db, self.files[kind])
+
+    @property
+    def vectors_file(self) -> str:
+        return self._path("vectors")
+
+    @property
+    def ids_file(self) -> str:
+        return self._path("ids")
+
+    @property
+    def metadata_file(self) -> str:
+        return self._path("metadata")
+
+    def _init_client(self):
+        """Loads the last commit. Only reads, so it is safe while another process
+        writes."""
+        with commit_lock(self.dir_vector_db, shared=True):
+            self._load_commit()
+        return None
+
+    def _load_commit(self) -> None:
+        """Opens the files of the last commit. Subclasses load their own."""
+        self.ids = []
+        self.rows = {}
+        self.deleted = set()
+        self._matrix = None
+        self._dead = None
+
+        self.meta = read_json(self.meta_file)
+        if self.meta is None:
+            # version 0 is never committed, so the first commit can compact into
+            # its own names
+            self.version = 0
+            self.files = {
+                kind: versioned_name(kind, 0, extension)
+                for kind, extension in self.extensions.items()
+            }
+        else:
+            self.version = self.meta.get("version", 0)
+            self.files = dict(self.meta.get("files", self.legacy_files))
+        self.metadata = MetadataIndex(self.metadata_file)
+
+        if self.meta is None:
+            return
+
+        if self.meta["embedding_dim"] != self.embedding_dim:
+            raise ValueError(
+                f"Embedding dim mismatch, expected: {self.embedding_dim}, but loaded: {self.meta['embedding_dim']}"
+            )
+        self.dtype = numpy.dtype(self.meta["dtype"])
+
+        if os.path.exists(self.ids_file):
+            with open(self.ids_file, "r", encoding="utf-8") as file:
+                self.ids = file.read().splitlines()[: self.meta["count"]]
+
+        self.deleted = set(self.meta["deleted"])
+        self.rows = {
+            chunk_id: row
+            for row, chunk_id in enumerate(self.ids)
+            if row not in self.deleted
+        }
+        self.metadata.load(len(self.ids))
+        # mapped now, so the vectors stay readable after a later commit removed them
+        self.matrix
+
+    def _begin_write(self) -> None:
+        """Takes the writer lock before the first change after a commit. Reloads
+        if another writer committed since this instance was loaded, and cuts off
+        rows appended after the last commit."""
+        if self.lock.held:
+            return
+        self.lock.acquire()
+
+        if read_json(self.meta_file) != self.meta:
+            self.vdb = self._init_client()
+        # appended to below; mapped rows keep reading the old copy
+        for path in (self.vectors_file, self.ids_file, self.metadata_file):
+            unshare(path)
+
+        row_bytes = self.embedding_dim * self.dtype.itemsize
+        if os.path.exists(self.vectors_file):
+            if os.path.getsize(self.vectors_file) > len(self.ids) * row_bytes:
+                with open(self.vectors_file, "r+b") as file:
+                    file.truncate(len(self.ids) * row_bytes)
+        truncate_lines(self.ids_file, len(self.ids))
+        truncate_lines(self.metadata_file, len(self.ids))
+
+    @staticmethod
+    def _write_ids(path: str, ids: list) -> None:
+        with open(path, "w", encoding="utf-8") as file:
+            file.writelines(f"{chunk_id}\n" for chunk_id in ids)
+
+    @property
+    def matrix(self) -> numpy.ndarray:
+        """The memory-mapped (count, embedding_dim) matrix, remapped after appends."""
+        if self._matrix is None or len(self._matrix) != len(self.ids):
+            if self.ids:
+                self._matrix = numpy.memmap(
+                    self.vectors_file,
+                    dtype=self.dtype,
+                    mode="r",
+                    shape=(len(self.ids), self.embedding_dim),
+                )
+            else:
+                self._matrix = numpy.empty((0, self.embedding_dim), dtype=self.dtype)
+        return self._matrix
+
+    def _dead_mask(self) -> numpy.ndarray:
+        """Boolean mask over all matrix rows that is True for deleted rows."""
+        if self._dead is None or len(self._dead) != len(self.ids):
+            self._dead = numpy.zeros(len(self.ids), dtype=bool)
+            self._dead[list(self.deleted)] = True
+        return self._dead
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def upsert(self, data: list) -> None:
+        if not data:
+            return
+
+        self._begin_write()
+
+        vectors = normalize(numpy.array([d["__vector__"] for d in data])).astype(
+            self.dtype
+        )
+
+        new_vectors = {}
+        new_metadata = {}
+        for d, vector in zip(data, vectors):
+            row = self.rows.get(d["__id__"])
+            if row is not None:
+                # the new vector is appended; readers may still map the old row
+                self.deleted.add(row)
+                self._dead = None
+            new_vectors[d["__id__"]] = vector
+            new_metadata[d["__id__"]] = d.get("__metadata__", {})
+
+        with open(self.vectors_file, "ab") as file:
+            file.write(numpy.array(list(new_vectors.values())).tobytes())
+        with open(self.ids_file, "a", encoding="utf-8") as file:
+            file.writelines(f"{chunk_id}\n" for chunk_id in new_vectors)
+        self.metadata.append(list(new_metadata.values()))
+
+        for chunk_id in new_vectors:
+            self.rows[chunk_id] = len(self.ids)
+            self.ids.append(chunk_id)
+
+    def delete(self, ids: list) -> None:
+        if not ids:
+            return
+
+        self._begin_write()
+        for chunk_id in ids:
+            row = self.rows.pop(chunk_id, None)
+            if row is not None:
+                self.deleted.add(row)
+        self._dead = None
+
+    def _compact(self) -> None:
+        """Writes the alive rows to the files of the next version."""
+        alive = [row for row in range(len(self.ids)) if row not in self.deleted]
+        ids = [self.ids[row] for row in alive]
+
+        files = {
+            kind: versioned_name(kind, self.version + 1, self.extensions[kind])
+            for kind in ("vectors", "ids")
+        }
+        with open(os.path.join(self.dir_vector_db, files["vectors"]), "wb") as file:
+            for start in range(0, len(alive), self.scan_block_size):
+                block = alive[start : start + self.scan_block_size]
+                file.write(self.matrix[block].tobytes())
+        self._write_ids(os.path.join(self.dir_vector_db, files["ids"]), ids)
+
+        self._matrix = None
+        self.files.update(files)
+        self.ids = ids
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(ids)}
+        self.deleted = set()
+        self._dead = None
+        self.metadata.compact(alive)
+
+    def _write_files(self, version: int) -> dict:
+        """Writes the files that are rewritten as a whole on a commit, under the
+        names of its version. Subclasses add their own.
+
+        Args:
+            version (int): The version being committed.
+
+        Returns:
+            dict: The written file names by kind.
+        """
+        if not self.metadata.dirty:
+            return {}
+        name = versioned_name("metadata", version, self.extensions["metadata"])
+        self.metadata.save_as(os.path.join(self.dir_vector_db, name))
+        return {"metadata": name}
+
+    def save(self) -> None:
+        if not self.lock.held:
+            # nothing changed since the last commit
+            return
+
+        if len(self.deleted) > self.compaction_threshold * len(self.ids):
+            self._compact()
+
+        version = self.version + 1
+        self.files.update(self._write_files(version))
+
+        meta = {
+            "embedding_dim": self.embedding_dim,
+            "dtype": self.dtype.name,
+            "count": len(self.ids),
+            "deleted": sorted(self.deleted),
+            "version": version,
+            "files": dict(self.files),
+        }
+        # keep the files of the previous commit for readers that just loaded it
+        previous = self.meta.get("files", self.legacy_files) if self.meta else {}
+        with commit_lock(self.dir_vector_db):
+            commit_json(
+                self.meta_file,
+                meta,
+                synced=[
+                    os.path.join(self.dir_vector_db, n) for n in self.files.values()
+                ],
+            )
+            remove_unreferenced(
+                self.dir_vector_db,
+                set(self.files.values()) | set(previous.values()),
+                legacy=tuple(self.legacy_files.values()),
+            )
+
+        self.meta = meta
+        self.version = version
+        self.lock.release()
+
+    def load(self) -> None:
+        # appended but uncommitted rows are cut off by the next writer
+        self.lock.release()
+        self.vdb = self._init_client()
+
+    def close(self) -> None:
+        """Releases the writer lock and unmaps the matrix."""
+        self.lock.release()
+        self._matrix = None
+
+    def _excluded_mask(self, filters: dict | None) -> numpy.ndarray:
+        """Boolean mask over all matrix rows that is True for deleted rows and rows
+        not passing the filter."""
+        if not filters:
+            return self._dead_mask()
+        return self._dead_mask() | ~self.metadata.mask(filters)
+
+    def _blocks(self, excluded: numpy.ndarray) -> Iterator[tuple]:
+        """Yields the rows to score block-wise, so float16 matrices are never
+        upcast as a whole. If most rows are excluded, only the remaining rows are
+        gathered; otherwise the matrix is scanned sequentially and the excluded
+        rows are masked.
+
+        Args:
+            excluded (numpy.ndarray): Rows not to return, see `_excluded_mask`.
+
+        Yields:
+            tuple: The rows of a block, their float32 vectors and a mask of the
+                excluded rows among them (or None).
+        """
+        matrix = self.matrix
+        remaining = len(excluded) - numpy.count_nonzero(excluded)
+
+        if remaining <= self.filter_gather_fraction * len(excluded):
+            rows = numpy.flatnonzero(~excluded)
+            for start in range(0, len(rows), self.scan_block_size):
+                block = rows[start : start + self.scan_block_size]
+                metrics.count("vectors_scanned", len(block))
+                yield block, matrix[block].astype(numpy.float32, copy=False), None
+            return
+
+        for start in range(0, len(matrix), self.scan_block_size):
+            end = min(start + self.scan_block_size, len(matrix))
+            metrics.count("vectors_scanned", end - start)
+            vectors = matrix[start:end].astype(numpy.float32, copy=False)
+            yield numpy.arange(start, end), vectors, excluded[start:end]
+
+    def query_db(
+        self, query: numpy.ndarray, top_k: int = 5, filters: dict | None = None
+    ) -> list:
+        query = normalize(numpy.asarray(query, dtype=numpy.float32))
+
+        best_rows = numpy.empty(0, dtype=numpy.int64)
+        best_scores = numpy.empty(0, dtype=numpy.float32)
+
+        for rows, vectors, excluded in self._blocks(self._excluded_mask(filters)):
+            scores = vectors @ query
+            if excluded is not None:
+                scores[excluded] = -numpy.inf
+
+            scores = numpy.concatenate([best_scores, scores])
+            rows = numpy.concatenate([best_rows, rows])
+            keep = top_k_indices(scores, top_k)
+            best_scores, best_rows = scores[keep], rows[keep]
+
+        best_rows = best_rows[numpy.isfinite(best_scores)]
+        best_scores = best_scores[numpy.isfinite(best_scores)]
+
+        return [
+            {"__id__": self.ids[row], "__metrics__": float(score)}
+            for row, score in zip(best_rows, best_scores)
+        ]
+
+    def query_db_batch(
+        self, queries: numpy.ndarray, top_k: int = 5, filters: dict | None = None
+    ) -> list:
+        queries = normalize(numpy.asarray(queries, dtype=numpy.float32))
+
+        best_rows = numpy.empty((0, len(queries)), dtype=numpy.int64)
+        best_scores = numpy.empty((0, len(queries)), dtype=numpy.float32)
+
+        for rows, vectors, excluded in self._blocks(self._excluded_mask(filters)):
+            scores = vectors @ queries.T
+            if excluded is not None:
+                scores[excluded] = -numpy.inf
+
+            scores = numpy.concatenate([best_scores, scores])
+            rows = numpy.concatenate(
+                [
+                    best_rows,
+                    numpy.broadcast_to(rows[:, None], scores[len(best_rows) :].shape),
+                ]
+            )
+            if len(scores) > top_k:
+                keep = numpy.argpartition(scores, -top_k, axis=0)[-top_k:]
+                scores = numpy.take_along_axis(scores, keep, axis=0)
+                rows = numpy.take_along_axis(rows, keep, axis=0)
+            best_scores, best_rows = scores, rows
+
+        order = numpy.argsort(-best_scores, axis=0)
+        best_scores = numpy.take_along_axis(best_scores, order, axis=0)
+        best_rows = numpy.take_along_axis(best_rows, order, axis=0)
+
+        return [
+            [
+                {"__id__": self.ids[row], "__metrics__": float(score)}
+                for row, score in zip(best_rows[:, i], best_scores[:, i])
+                if numpy.isfinite(score)
+            ]
+            for i in range(len(queries))
+        ]
+
+    def export(self, ids: list | None = None) -> Iterator[dict]:
+        """Yields the stored vectors, e.g. to move them to another DB.
+
+        Args:
+            ids (list | None, optional): The ids to export; missing ids are
+                skipped. Defaults to None, which exports all vectors.
+
+        Yields:
+            dict: "__id__", "__vector__" (normalized) and "__metadata__".
+        """
+        if ids is None:
+            rows = sorted(self.rows.values())
+        else:
+            rows = sorted(self.rows[i] for i in ids if i in self.rows)
+
+        matrix = self.matrix
+        for start in range(0, len(rows), self.scan_block_size):
+            block = rows[start : start + self.scan_block_size]
+            for row, vector in zip(block, matrix[block].astype(numpy.float32)):
+                yield {
+                    "__id__": self.ids[row],
+                    "__vector__": vector,
+                    "__metadata__": self.metadata.records[row],
+                }
+
+    def filter_ids(self, ids: list, filters: dict) -> list:
+        return [
+            chunk_id
+            for chunk_id in ids
+            if chunk_id in self.rows
+            and matches(filters, self.metadata.records[self.rows[chunk_id]])
+        ]
+
+    def matching_ids(self, filters: dict) -> list:
+        rows = numpy.flatnonzero(~self._excluded_mask(filters))
+        return [self.ids[row] for row in rows]
+
+    def matching_rows(self, filters: dict) -> tuple:
+        # rows are only renumbered by a commit; new rows are appended
+        ids = self.ids
+        passing = ~self._excluded_mask(filters)
+        return (self.version, len(passing)), ids, passing
+
+    def req_update(
+        self, dir_text_chunks: str, dir_vector_db: str, dir_doc_store: str
+    ) -> bool:
+        return is_update_required(dir_text_chunks, dir_vector_db, dir_doc_store)
@@ -1,7 +1,9 @@
 from nano_vectordb import NanoVectorDB
 from util.check_db import is_update_required
+from util.storage import unshare
 import numpy
 from .base import AbstractDB
+from .metadata import matches
 
 
 class DB(AbstractDB):
@@ -10,21 +12,50 @@ class DB(AbstractDB):
     def _init_client(self):
         return NanoVectorDB(self.embedding_dim, storage_file=self.storage_file)
 
-    def update(self, data: numpy.ndarray) -> None:
+    def upsert(self, data: list) -> None:
         # TBD: move dtype conversion of data into DB class.
-
         self.vdb.upsert(datas=data)
+
+    def delete(self, ids: list) -> None:
+        self.vdb.delete(ids)
+
+    def save(self) -> None:
+        # nano-vectordb rewrites its file in place
+        unshare(self.storage_file)
         self.vdb.save()
 
     def load(self) -> None:
         # not necessary for nano_vdb; implemented for consistency
         self.vdb = NanoVectorDB(self.embedding_dim, storage_file=self.storage_file)
 
-    def query_db(self, query: numpy.ndarray, top_k: int = 5) -> list:
-        results = self.vdb.query(query=query, top_k=top_k)
+    def query_db(
+        self, query: numpy.ndarray, top_k: int = 5, filters: dict | None = None
+    ) -> list:
+        filter_lambda = None
+        if filters:
+            filter_lambda = lambda data: matches(filters, data.get("__metadata__", {}))
+
+        try:
+            results = self.vdb.query(
+                query=query, top_k=top_k, filter_lambda=filter_lambda
+            )
+        except IndexError:
+            # nano-vectordb can't index with an empty selection; nothing matched
+            return []
 
         return results
 
+    def filter_ids(self, ids: list, filters: dict) -> list:
+        metadata = {
+            data["__id__"]: data.get("__metadata__", {})
+            for data in self.vdb.get(set(ids))
+        }
+        return [
+            chunk_id
+            for chunk_id in ids
+            if chunk_id in metadata and matches(filters, metadata[chunk_id])
+        ]
+
     def req_update(
         self, dir_text_chunks: str, dir_vector_db: str, dir_doc_store: str
     ) -> bool:
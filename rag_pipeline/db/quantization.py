@@ -0,0 +1,180 @@
+import numpy
+
+
+def _kmeans_l2(
+    vectors: numpy.ndarray,
+    n_clusters: int,
+    iterations: int,
+    rng: numpy.random.Generator,
+) -> numpy.ndarray:
+    """Euclidean k-means.
+
+    Args:
+        vectors (numpy.ndarray): (n, dim) training vectors.
+        n_clusters (int): Number of centroids.
+        iterations (int): Number of Lloyd iterations.
+        rng (numpy.random.Generator): The random generator.
+
+    Returns:
+        numpy.ndarray: (n_clusters, dim) centroids.
+    """
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        distances = (
+            (vectors**2).sum(axis=1, keepdims=True)
+            - 2 * vectors @ centroids.T
+            + (centroids**2).sum(axis=1)
+        )
+        assignments = numpy.argmin(distances, axis=1)
+        order = numpy.argsort(assignments, kind="stable")
+        counts = numpy.bincount(assignments, minlength=n_clusters)
+        starts = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]])
+
+        non_empty = counts > 0
+        centroids[non_empty] = (
+            numpy.add.reduceat(vectors[order], starts[non_empty], axis=0)
+            / counts[non_empty, None]
+        )
+        empty = ~non_empty
+        centroids[empty] = vectors[rng.choice(len(vectors), empty.sum())]
+
+    return centroids
+
+
+class ScalarQuantizer:
+    """Symmetric int8 quantization with one scale per dimension (1 byte per dim)."""
+
+    name = "int8"
+
+    def __init__(self, config: dict) -> None:
+        self.scale = None
+
+    def train(self, vectors: numpy.ndarray) -> None:
+        """Fits the per-dimension scales.
+
+        Args:
+            vectors (numpy.ndarray): (n, dim) training vectors.
+        """
+        self.scale = numpy.maximum(numpy.abs(vectors).max(axis=0), 1e-12) / 127
+        self.scale = self.scale.astype(numpy.float32)
+
+    def encode(self, vectors: numpy.ndarray) -> numpy.ndarray:
+        """Encodes vectors into (n, dim) int8 codes.
+
+        Args:
+            vectors (numpy.ndarray): (n, dim) vectors.
+
+        Returns:
+            numpy.ndarray: The codes.
+        """
+        codes = numpy.rint(numpy.asarray(vectors, numpy.float32) / self.scale)
+        return numpy.clip(codes, -127, 127).astype(numpy.int8)
+
+    def score(self, query: numpy.ndarray, codes: numpy.ndarray) -> numpy.ndarray:
+        """Approximates the inner products of a query with encoded vectors.
+
+        Args:
+            query (numpy.ndarray): (dim,) query.
+            codes (numpy.ndarray): (n, dim) codes.
+
+        Returns:
+            numpy.ndarray: (n,) scores.
+        """
+        return codes.astype(numpy.float32) @ (query * self.scale)
+
+    def code_width(self, dim: int) -> int:
+        """Returns the bytes of one vector's code."""
+        return dim
+
+    def state(self) -> dict:
+        return {"scale": self.scale}
+
+    def load_state(self, state: dict) -> None:
+        self.scale = state["scale"]
+
+    def nbytes(self) -> int:
+        return self.scale.nbytes
+
+
+class ProductQuantizer:
+    """Product quantization: every vector is split into `pq_subvectors` parts that
+    are each replaced by the id of the nearest of 256 sub-centroids (1 byte per
+    part). Queries are scored with asymmetric distance computation (ADC): the
+    un-quantized query is compared against a per-query lookup table."""
+
+    name = "pq"
+
+    n_centroids = 256
+
+    def __init__(self, config: dict) -> None:
+        self.n_subvectors = config.get("pq_subvectors", 96)
+        self.iterations = config.get("pq_kmeans_iterations", 15)
+        self.codebooks = None
+
+    def _split(self, vectors: numpy.ndarray) -> list:
+        return numpy.array_split(
+            numpy.asarray(vectors, numpy.float32), self.n_subvectors, axis=-1
+        )
+
+    def train(self, vectors: numpy.ndarray) -> None:
+        """Fits one codebook of sub-centroids per sub-vector.
+
+        Args:
+            vectors (numpy.ndarray): (n, dim) training vectors.
+        """
+        rng = numpy.random.default_rng(0)
+        self.codebooks = [
+            _kmeans_l2(part, self.n_centroids, self.iterations, rng)
+            for part in self._split(vectors)
+        ]
+
+    def encode(self, vectors: numpy.ndarray) -> numpy.ndarray:
+        """Encodes vectors into (n, pq_subvectors) uint8 codes.
+
+        Args:
+            vectors (numpy.ndarray): (n, dim) vectors.
+
+        Returns:
+            numpy.ndarray: The codes.
+        """
+        codes = numpy.empty((len(vectors), self.n_subvectors), dtype=numpy.uint8)
+        for j, (part, codebook) in enumerate(zip(self._split(vectors), self.codebooks)):
+            distances = -2 * part @ codebook.T + (codebook**2).sum(axis=1)
+            codes[:, j] = numpy.argmin(distances, axis=1)
+        return codes
+
+    def score(self, query: numpy.ndarray, codes: numpy.ndarray) -> numpy.ndarray:
+        """Approximates the inner products of a query with encoded vectors (ADC).
+
+        Args:
+            query (numpy.ndarray): (dim,) query.
+            codes (numpy.ndarray): (n, pq_subvectors) codes.
+
+        Returns:
+            numpy.ndarray: (n,) scores.
+        """
+        table = numpy.zeros((self.n_subvectors, self.n_centroids), numpy.float32)
+        for j, (part, codebook) in enumerate(zip(self._split(query), self.codebooks)):
+            table[j, : len(codebook)] = codebook @ part
+
+        return table[numpy.arange(self.n_subvectors), codes].sum(axis=1)
+
+    def code_width(self, dim: int) -> int:
+        """Returns the bytes of one vector's code."""
+        return self.n_subvectors
+
+    def state(self) -> dict:
+        return {f"codebook_{j}": codebook for j, codebook in enumerate(self.codebooks)}
+
+    def load_state(self, state: dict) -> None:
+        self.codebooks = [state[f"codebook_{j}"] for j in range(self.n_subvectors)]
+
+    def nbytes(self) -> int:
+        return sum(codebook.nbytes for codebook in self.codebooks)
+
+
+QUANTIZERS = {
+    quantizer.name: quantizer for quantizer in (ScalarQuantizer, ProductQuantizer)
+}
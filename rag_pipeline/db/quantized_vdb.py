@@ -0,0 +1,223 @@
+import logging
+import os
+import numpy
+from util.instrumentation import metrics
+from util.storage import versioned_name
+from .mmap_vdb import MmapDB, normalize, top_k_indices
+from .quantization import QUANTIZERS
+
+logger = logging.getLogger(__name__)
+
+
+class QuantizedDB(MmapDB):
+    """Memory-mapped vector store that scans compact quantized codes instead of
+    the float vectors.
+
+    Only the codes ("int8": 1 byte per dimension, "pq": 1 byte per sub-vector) are
+    held in memory. The float vectors stay on disk in the memory-mapped matrix. With
+    `quantization_rerank_factor` > 0, the top `top_k * factor` candidates are
+    re-scored exactly against it, so only their pages are read. Until
+    `min_train_size` vectors exist, queries fall back to the exact scan.
+
+    The codes file records the quantizer that wrote it. If `vdb_quantization` or
+    `pq_subvectors` changed since, the codes are ignored and the quantizer is
+    re-trained with the next commit; queries scan exactly until then.
+    """
+
+    name = "quantized_vdb"
+
+    min_train_size = 1000
+
+    legacy_files = {**MmapDB.legacy_files, "codes": "codes.npz"}
+
+    def __init__(self, config: dict) -> None:
+        self.quantizer = QUANTIZERS[config.get("vdb_quantization", "int8")](config)
+        self.rerank_factor = config.get("quantization_rerank_factor", 4)
+        self.train_sample = config.get("quantization_train_sample", 20000)
+        super().__init__(config)
+
+    def _load_commit(self) -> None:
+        super()._load_commit()
+        self.codes = None
+        self.trained_count = 0
+
+        if self.ids and "codes" in self.files and os.path.exists(self._path("codes")):
+            with numpy.load(self._path("codes")) as stored:
+                if self._matches(stored):
+                    self.codes = stored["codes"][: len(self.ids)]
+                    self.trained_count = int(stored["trained_count"])
+                    self.quantizer.load_state(
+                        {k[2:]: stored[k] for k in stored.files if k.startswith("q_")}
+                    )
+
+    def _matches(self, stored: numpy.lib.npyio.NpzFile) -> bool:
+        """Checks whether stored codes were written by the configured quantizer."""
+        if "quantizer" in stored.files:
+            name = str(stored["quantizer"])
+        else:
+            # written before the quantizer was recorded
+            name = "int8" if "q_scale" in stored.files else "pq"
+
+        width = stored["codes"].shape[1]
+        expected = self.quantizer.code_width(self.embedding_dim)
+        if name == self.quantizer.name and width == expected:
+            return True
+
+        logger.warning(
+            "Ignoring the %s codes (%d bytes per vector) of %s, the config asks "
+            "for %s (%d bytes per vector); re-training with the next commit",
+            name,
+            width,
+            self.dir_vector_db,
+            self.quantizer.name,
+            expected,
+        )
+        return False
+
+    def _needs_training(self) -> bool:
+        if len(self.rows) < self.min_train_size:
+            return False
+        return self.codes is None or len(self.rows) >= 2 * self.trained_count
+
+    def _encode(self, rows: numpy.ndarray, block_size: int = 1 << 14) -> numpy.ndarray:
+        """Encodes matrix rows block-wise.
+
+        Args:
+            rows (numpy.ndarray): The rows to encode.
+            block_size (int, optional): Rows encoded at once. Defaults to 16384.
+
+        Returns:
+            numpy.ndarray: The codes.
+        """
+        blocks = [
+            self.quantizer.encode(self.matrix[rows[start : start + block_size]])
+            for start in range(0, len(rows), block_size)
+        ]
+        if not blocks:
+            return self.quantizer.encode(numpy.empty((0, self.embedding_dim)))
+        return numpy.concatenate(blocks)
+
+    def train(self) -> None:
+        """(Re-)trains the quantizer on a sample of the stored vectors and
+        re-encodes all vectors."""
+        alive = numpy.flatnonzero(~self._dead_mask())
+        rng = numpy.random.default_rng(0)
+        sample = numpy.sort(
+            rng.choice(alive, min(len(alive), self.train_sample), replace=False)
+        )
+        self.quantizer.train(numpy.asarray(self.matrix[sample], numpy.float32))
+        self.codes = self._encode(numpy.arange(len(self.ids)))
+        self.trained_count = len(alive)
+
+    def _encode_pending(self) -> None:
+        """Encodes vectors appended since the last encoding."""
+        if self.codes is None or len(self.codes) == len(self.ids):
+            return
+
+        pending = numpy.arange(len(self.codes), len(self.ids))
+        self.codes = numpy.concatenate([self.codes, self._encode(pending)])
+
+    def _compact(self) -> None:
+        self._encode_pending()
+        alive = ~self._dead_mask()
+        super()._compact()
+        if self.codes is not None:
+            self.codes = self.codes[alive]
+
+    def save(self) -> None:
+        if self.lock.held:
+            if self._needs_training():
+                self.train()
+            else:
+                self._encode_pending()
+
+        super().save()
+
+    def _write_files(self, version: int) -> dict:
+        files = super()._write_files(version)
+        if self.codes is None:
+            return files
+
+        files["codes"] = versioned_name("codes", version, ".npz")
+        state = {f"q_{k}": v for k, v in self.quantizer.state().items()}
+        with open(os.path.join(self.dir_vector_db, files["codes"]), "wb") as file:
+            numpy.savez(
+                file,
+                codes=self.codes,
+                trained_count=self.trained_count,
+                quantizer=self.quantizer.name,
+                **state,
+            )
+        return files
+
+    def memory_footprint(self) -> dict:
+        """Reports the bytes needed to scan the DB in memory.
+
+        Returns:
+            dict: Vector count, bytes of the float32 matrix and of the quantized
+                codes (incl. codebooks/scales) and the compression ratio.
+        """
+        float32_bytes = len(self.ids) * self.embedding_dim * 4
+        quantized_bytes = (
+            self.codes.nbytes + self.quantizer.nbytes()
+            if self.codes is not None
+            else float32_bytes
+        )
+        return {
+            "vectors": len(self.ids),
+            "float32_bytes": float32_bytes,
+            "quantized_bytes": quantized_bytes,
+            "compression": float32_bytes / max(quantized_bytes, 1),
+        }
+
+    def query_db(
+        self, query: numpy.ndarray, top_k: int = 5, filters: dict | None = None
+    ) -> list:
+        if self.codes is None:
+            return super().query_db(query, top_k, filters)
+
+        self._encode_pending()
+        query = normalize(numpy.asarray(query, dtype=numpy.float32))
+        excluded = self._excluded_mask(filters)
+        remaining = len(excluded) - numpy.count_nonzero(excluded)
+
+        if remaining <= self.filter_gather_fraction * len(excluded):
+            # score the codes of the remaining rows only
+            scored_rows = numpy.flatnonzero(~excluded)
+            codes = self.codes[scored_rows]
+        else:
+            scored_rows, codes = None, self.codes
+
+        metrics.count("codes_scanned", len(codes))
+        scores = numpy.empty(len(codes), dtype=numpy.float32)
+        for start in range(0, len(codes), self.scan_block_size):
+            end = start + self.scan_block_size
+            scores[start:end] = self.quantizer.score(query, codes[start:end])
+        if scored_rows is None:
+            scores[excluded] = -numpy.inf
+
+        n_candidates = top_k * self.rerank_factor if self.rerank_factor else top_k
+        candidates = top_k_indices(scores, n_candidates)
+        candidates = candidates[numpy.isfinite(scores[candidates])]
+        rows = candidates if scored_rows is None else scored_rows[candidates]
+        scores = scores[candidates]
+
+        if self.rerank_factor:
+            rows = numpy.sort(rows)  # sequential access into the map
+            metrics.count("vectors_scanned", len(rows))
+            scores = self.matrix[rows].astype(numpy.float32, copy=False) @ query
+            keep = top_k_indices(scores, top_k)
+            rows, scores = rows[keep], scores[keep]
+
+        return [
+            {"__id__": self.ids[row], "__metrics__": float(score)}
+            for row, score in zip(rows, scores)
+        ]
+
+    def query_db_batch(
+        self, queries: numpy.ndarray, top_k: int = 5, filters: dict | None = None
+    ) -> list:
+        if self.codes is None:
+            return super().query_db_batch(queries, top_k, filters)
+
+        return [self.query_db(query, top_k, filters) for query in queries]
@@ -0,0 +1,387 @@
+import heapq
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy
+from util.check_db import is_update_required
+from .base import AbstractDB
+from .mmap_vdb import MmapDB
+
+# register the shard backends, also in spawned worker processes
+from .ivf_vdb import IVFDB
+from .quantized_vdb import QuantizedDB
+
+
+def shard_of(chunk_id: str, shard_count: int) -> int:
+    """Returns the shard a chunk id belongs to. The hash is stable across processes
+    and runs, unlike `hash`.
+
+    Args:
+        chunk_id (str): The chunk id.
+        shard_count (int): Number of shards.
+
+    Returns:
+        int: The shard.
+    """
+    return zlib.crc32(chunk_id.encode("utf-8")) % shard_count
+
+
+def _serve_shard(connection, backend: str, config: dict) -> None:
+    """Main loop of a shard worker process: opens its shard read-only and answers
+    commands until it receives "stop".
+
+    Args:
+        connection: Pipe end to the parent process.
+        backend (str): Name of the shard's DB implementation.
+        config (dict): Config of the shard.
+    """
+    shard = AbstractDB.create(backend, config)
+    while True:
+        command, args = connection.recv()
+        if command == "stop":
+            break
+        try:
+            if command == "load":
+                shard.load()
+                result = None
+            else:
+                result = shard.query_db_batch(*args)
+        except Exception as e:
+            connection.send((False, e))
+        else:
+            connection.send((True, result))
+    connection.close()
+
+
+class ShardWorker:
+    """A worker process serving queries on one shard."""
+
+    def __init__(self, context, backend: str, config: dict) -> None:
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_serve_shard,
+            args=(child_connection, backend, config),
+            daemon=True,
+        )
+        self.process.start()
+        child_connection.close()
+        # a request and its response must not interleave with other threads'
+        self.lock = threading.Lock()
+
+    def send(self, command: str, *args) -> None:
+        self.connection.send((command, args))
+
+    def receive(self):
+        success, result = self.connection.recv()
+        if not success:
+            raise result
+        return result
+
+    def stop(self) -> None:
+        try:
+            self.connection.send(("stop", ()))
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.connection.close()
+
+
+class ShardedDB(AbstractDB):
+    """Vector DB that partitions the vectors over `vdb_shards` shards, each a DB of
+    type `vdb_shard_backend` in its own subdirectory (shard-000, ...).
+
+    Chunk ids are assigned to shards by a stable hash. A query is sent to all shards
+    at once and their top_k results are merged into the global top_k. With
+    `vdb_shard_processes` every shard is searched by a worker process that maps the
+    shard's files read-only, so a query scans all shards in parallel on separate
+    cores; otherwise the shards are searched by threads of this process.
+
+    Writes go to the shards of this process; workers only see them after `save`,
+    which makes them reload their shard. Workers never write: loading a shard only
+    reads its last commit, and waits while a commit replaces it (see
+    `util.storage.commit_lock`).
+
+    The number of shards is stored in shards.json. Changing `vdb_shards`, or the
+    shards outgrowing `vdb_shard_max_vectors` on average (which doubles the number
+    of shards), redistributes the vectors on the next `save`, see `rebalance`.
+    """
+
+    name = "sharded_vdb"
+
+    # vectors moved between shards at once while rebalancing
+    rebalance_batch_size = 10000
+
+    def __init__(self, config: dict) -> None:
+        self.config = config
+        self.backend = config.get("vdb_shard_backend", "mmap_vdb")
+        self.configured_shard_count = config.get("vdb_shards", 4)
+        self.use_processes = config.get("vdb_shard_processes", True)
+        self.max_shard_size = config.get("vdb_shard_max_vectors", 0)
+        self.layout_file = os.path.join(config["dir_vector_db"], "shards.json")
+        self.workers = None
+        self.executor = None
+        self._start_lock = threading.Lock()
+
+        backend_class = AbstractDB._implementations.get(self.backend)
+        if backend_class is None or not issubclass(backend_class, MmapDB):
+            raise ValueError(
+                f"Shard backend {self.backend} not supported. Choose one of the following: {[n for n, c in AbstractDB._implementations.items() if issubclass(c, MmapDB)]}"
+            )
+        super().__init__(config)
+
+    def _init_client(self):
+        self.close()
+        shard_count = self.configured_shard_count
+        self.layout = None
+
+        if os.path.exists(self.layout_file):
+            with open(self.layout_file, "r", encoding="utf-8") as file:
+                self.layout = json.load(file)
+            if self.layout["backend"] != self.backend:
+                raise ValueError(
+                    f"Shard backend mismatch, expected: {self.backend}, but loaded: {self.layout['backend']}"
+                )
+            shard_count = self.layout["shard_count"]
+
+        self.shards = [self._open_shard(i) for i in range(shard_count)]
+        return None
+
+    def _shard_config(self, shard: int) -> dict:
+        return {
+            **self.config,
+            "dir_vector_db": os.path.join(self.dir_vector_db, f"shard-{shard:03d}"),
+        }
+
+    def _open_shard(self, shard: int) -> MmapDB:
+        return AbstractDB.create(self.backend, self._shard_config(shard))
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+
+    def _start_workers(self) -> None:
+        with self._start_lock:
+            if self.use_processes and self.workers is None:
+                context = multiprocessing.get_context("spawn")
+                self.workers = [
+                    ShardWorker(context, self.backend, self._shard_config(i))
+                    for i in range(len(self.shards))
+                ]
+            elif not self.use_processes and self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=len(self.shards))
+
+    def close(self) -> None:
+        """Stops the worker processes, if any. They are restarted on demand."""
+        if self.workers is not None:
+            for worker in self.workers:
+                worker.stop()
+            self.workers = None
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def _fan_out(self, command: str, *args) -> list:
+        """Sends a command to all workers at once and collects their results.
+
+        Returns:
+            list: The result of every shard.
+        """
+        if self.workers is None:
+            self._start_workers()
+        workers = self.workers
+
+        # locks are always taken in shard order, so concurrent fan-outs can't deadlock
+        for worker in workers:
+            worker.lock.acquire()
+        try:
+            for worker in workers:
+                worker.send(command, *args)
+            results = []
+            error = None
+            for worker in workers:
+                try:
+                    results.append(worker.receive())
+                except Exception as e:
+                    # keep receiving, so no response is left in a pipe
+                    error = error or e
+            if error is not None:
+                raise error
+            return results
+        finally:
+            for worker in workers:
+                worker.lock.release()
+
+    def upsert(self, data: list) -> None:
+        by_shard = {}
+        for d in data:
+            by_shard.setdefault(shard_of(d["__id__"], len(self.shards)), []).append(d)
+
+        for i, shard_data in by_shard.items():
+            self.shards[i].upsert(shard_data)
+
+    def delete(self, ids: list) -> None:
+        # every shard is asked, so copies left by an interrupted rebalance go too
+        for shard in self.shards:
+            shard.delete([chunk_id for chunk_id in ids if chunk_id in shard.rows])
+
+    def _target_shard_count(self) -> int:
+        """The number of shards the vectors should be spread over."""
+        if (
+            self.layout is None
+            or self.layout["configured"] != self.configured_shard_count
+        ):
+            shard_count = self.configured_shard_count
+        else:
+            shard_count = len(self.shards)
+
+        if self.max_shard_size:
+            while len(self) > shard_count * self.max_shard_size:
+                shard_count *= 2
+        return shard_count
+
+    def save(self) -> None:
+        shard_count = self._target_shard_count()
+        if shard_count != len(self.shards):
+            self.rebalance(shard_count)
+            return
+
+        for shard in self.shards:
+            shard.save()
+        if len(self) or self.layout is not None:
+            self._write_layout()
+
+        if self.workers is not None:
+            self._fan_out("load")
+
+    def _write_layout(self) -> None:
+        self.layout = {
+            "backend": self.backend,
+            "shard_count": len(self.shards),
+            "configured": self.configured_shard_count,
+        }
+        os.makedirs(self.dir_vector_db, exist_ok=True)
+        tmp_file = self.layout_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as file:
+            json.dump(self.layout, file)
+        os.replace(tmp_file, self.layout_file)
+
+    def rebalance(self, shard_count: int) -> None:
+        """Redistributes the vectors over `shard_count` shards and persists the DB.
+
+        Only vectors whose shard changes are moved; doubling the number of shards
+        moves about half of them. The new shards are saved before the vectors are
+        removed from their old shards and shards.json is written last, so an
+        interrupted rebalance loses no vectors: it leaves the old layout with at
+        most some duplicates, which queries merge and `delete` removes.
+
+        Args:
+            shard_count (int): The new number of shards.
+        """
+        self.close()
+
+        for i in range(len(self.shards), shard_count):
+            # drop leftovers of an interrupted rebalance
+            shutil.rmtree(self._shard_config(i)["dir_vector_db"], ignore_errors=True)
+            self.shards.append(self._open_shard(i))
+
+        moved = []
+        for i, shard in enumerate(self.shards):
+            moving = [
+                chunk_id
+                for chunk_id in shard.rows
+                if shard_of(chunk_id, shard_count) != i
+            ]
+            for start in range(0, len(moving), self.rebalance_batch_size):
+                by_shard = {}
+                for d in shard.export(
+                    moving[start : start + self.rebalance_batch_size]
+                ):
+                    by_shard.setdefault(shard_of(d["__id__"], shard_count), []).append(
+                        d
+                    )
+                for target, data in by_shard.items():
+                    self.shards[target].upsert(data)
+            moved.append(moving)
+
+        for shard in self.shards[:shard_count]:
+            shard.save()
+        for shard, moving in zip(self.shards, moved):
+            shard.delete(moving)
+        for shard in self.shards[:shard_count]:
+            shard.save()
+
+        removed = self.shards[shard_count:]
+        self.shards = self.shards[:shard_count]
+        self._write_layout()
+        for shard in removed:
+            shutil.rmtree(shard.dir_vector_db, ignore_errors=True)
+
+    def load(self) -> None:
+        self.vdb = self._init_client()
+
+    @staticmethod
+    def _merge(results: list, top_k: int) -> list:
+        """Merges the results of all shards for one query into the global top_k."""
+        best = {}
+        for shard_results in results:
+            for result in shard_results:
+                previous = best.get(result["__id__"])
+                if previous is None or result["__metrics__"] > previous["__metrics__"]:
+                    best[result["__id__"]] = result
+        return heapq.nlargest(top_k, best.values(), key=lambda r: r["__metrics__"])
+
+    def query_db(
+        self, query: numpy.ndarray, top_k: int = 5, filters: dict | None = None
+    ) -> list:
+        return self.query_db_batch(numpy.asarray(query)[None], top_k, filters)[0]
+
+    def query_db_batch(
+        self, queries: numpy.ndarray, top_k: int = 5, filters: dict | None = None
+    ) -> list:
+        queries = numpy.asarray(queries, dtype=numpy.float32)
+
+        if self.use_processes:
+            results = self._fan_out("query", queries, top_k, filters)
+        else:
+            if self.executor is None:
+                self._start_workers()
+            results = list(
+                self.executor.map(
+                    lambda shard: shard.query_db_batch(queries, top_k, filters),
+                    self.shards,
+                )
+            )
+
+        return [
+            self._merge([shard_results[i] for shard_results in results], top_k)
+            for i in range(len(queries))
+        ]
+
+    def filter_ids(self, ids: list, filters: dict) -> list:
+        by_shard = {}
+        for chunk_id in ids:
+            by_shard.setdefault(shard_of(chunk_id, len(self.shards)), []).append(
+                chunk_id
+            )
+
+        passing = set()
+        for i, shard_ids in by_shard.items():
+            passing.update(self.shards[i].filter_ids(shard_ids, filters))
+        return [chunk_id for chunk_id in ids if chunk_id in passing]
+
+    def matching_ids(self, filters: dict) -> list:
+        return [
+            chunk_id
+            for shard in self.shards
+            for chunk_id in shard.matching_ids(filters)
+        ]
+
+    def req_update(
+        self, dir_text_chunks: str, dir_vector_db: str, dir_doc_store: str
+    ) -> bool:
+        return is_update_required(dir_text_chunks, dir_vector_db, dir_doc_store)
@@ -0,0 +1,25 @@
+def reciprocal_rank_fusion(
+    result_lists: list, weights: list, top_k: int, k: int = 60
+) -> list:
+    """Fuses ranked result lists with weighted reciprocal rank fusion. A result
+    scores the sum of `weight / (k + rank)` over the lists it appears in, so only
+    ranks matter and scores of different retrievers don't have to be comparable.
+
+    Args:
+        result_lists (list): Lists of results ("__id__", "__metrics__"), best first.
+        weights (list): The weight of every list.
+        top_k (int): Number of results to return.
+        k (int, optional): Dampens the influence of top ranks. Defaults to 60.
+
+    Returns:
+        list: Dicts with "__id__" and "__metrics__" (the fused score), best first.
+    """
+    scores = {}
+    for results, weight in zip(result_lists, weights):
+        for rank, result in enumerate(results, start=1):
+            scores[result["__id__"]] = scores.get(result["__id__"], 0.0) + weight / (
+                k + rank
+            )
+
+    best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [{"__id__": chunk_id, "__metrics__": score} for chunk_id, score in best]
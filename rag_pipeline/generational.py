@@ -0,0 +1,281 @@
+import os
+import shutil
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from rag_pipeline.naiverag import NaiveRAG
+from util.check_db import is_update_required
+from util.generations import IndexGenerations
+from util.manifest import DocumentManifest
+from util.process_docs import pdf_to_txt, iter_documents, get_document_paths
+
+
+class GenerationalRAG:
+    """Serves queries from the current index generation while the next one is
+    built in the background, see `IndexGenerations`.
+
+    A rebuild copies the current generation into a new directory, updates the copy
+    incrementally with the changed documents and publishes it; then queries switch
+    to it. Queries never wait for a rebuild: each acquires the NaiveRAG instance
+    that is current when it starts, see `serving`. The instance replaced by a
+    switch is closed completely (DBs, embedding cache, API clients) once the last
+    query using it releases it, and then its generation is garbage collected.
+
+    Before the first generation is published, the first rebuild starts from the
+    DBs in `dir_text_chunks` and `dir_vector_db`, if there are any.
+    """
+
+    def __init__(self, config: dict) -> None:
+        self.config = config
+        self.generations = IndexGenerations(
+            config["dir_index"], config.get("index_generations_keep", 2)
+        )
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._queued = None
+        self._closed = False
+        # instance -> number of queries using it
+        self._users = {}
+        # replaced instances still in use -> their generation
+        self._retired = {}
+
+        self.generation = self.generations.current()
+        self.naiverag = self._open(self.generation)
+
+    def _open(self, generation: str | None) -> NaiveRAG | None:
+        if generation is None:
+            return None
+        naiverag = NaiveRAG(self.generations.config(self.config, generation))
+        naiverag.load_db()
+        return naiverag
+
+    def _dirs(self, generation: str | None) -> dict:
+        """The DB directories of a generation, or of the legacy DBs for None."""
+        config = (
+            self.generations.config(self.config, generation)
+            if generation is not None
+            else self.config
+        )
+        return {
+            "text_chunks": config["dir_text_chunks"],
+            "vector_db": config["dir_vector_db"],
+        }
+
+    def _swap(self, generation: str, naiverag: NaiveRAG) -> None:
+        with self._lock:
+            retired, previous = self.naiverag, self.generation
+            self.generation, self.naiverag = generation, naiverag
+            if retired is not None and retired in self._users:
+                # closed by the last query using it, see `release`
+                self._retired[retired] = previous
+                retired = None
+        if retired is not None:
+            retired.close()
+
+    def _submit(self, fn: Callable[[], object]) -> Future:
+        """Runs a function in the background thread of the rebuilds. Must hold
+        `_lock`."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        return self._executor.submit(fn)
+
+    def _collect_garbage(self) -> None:
+        """Removes the old generations that no instance serves anymore. Must hold
+        the `building` lock."""
+        with self._lock:
+            in_use = {self.generation, *self._retired.values()}
+        self.generations.collect_garbage(in_use)
+
+    def _collect_garbage_blocking(self) -> None:
+        """Like `_collect_garbage`, but waits for the `building` lock."""
+        with self.generations.building():
+            self._collect_garbage()
+
+    def refresh(self) -> bool:
+        """Switches to the current generation if another process published a
+        newer one.
+
+        Returns:
+            bool: Whether the generation changed.
+        """
+        generation = self.generations.current()
+        if generation is None or generation == self.generation:
+            return False
+        self._swap(generation, self._open(generation))
+        return True
+
+    def is_update_required(self) -> bool:
+        """Checks cheaply whether documents changed since the current generation
+        was built, see `is_update_required`."""
+        dirs = self._dirs(self.generations.current())
+        return is_update_required(
+            dirs["text_chunks"], dirs["vector_db"], self.config["dir_doc_store"]
+        )
+
+    def rebuild(
+        self, documents: Iterable[dict] | None = None, removed: list | None = None
+    ) -> str | None:
+        """Builds and publishes a new generation and switches queries to it.
+
+        Args:
+            documents (Iterable[dict] | None, optional): Documents to (re-)index;
+                None indexes the new and changed documents of the doc store.
+                Defaults to None.
+            removed (list | None, optional): Sources of documents to remove; with
+                `documents` None, the documents deleted from the doc store.
+                Defaults to None.
+
+        Returns:
+            str | None: The new generation, or None if nothing changed. The first
+                generation is always built.
+        """
+        with self.generations.building():
+            current = self.generations.current()
+            sources = self._dirs(current)
+
+            if documents is None:
+                pdf_to_txt(
+                    self.config["dir_doc_store"],
+                    max_workers=self.config.get("pdf_max_workers"),
+                )
+                manifest = DocumentManifest(
+                    os.path.join(sources["text_chunks"], "manifest.json")
+                )
+                manifest.load()
+                changed, removed = manifest.diff(
+                    get_document_paths(self.config["dir_doc_store"])
+                )
+                if not changed and not removed and current is not None:
+                    self.refresh()
+                    return None
+                documents = iter_documents(paths=changed)
+
+            with self._build() as naiverag:
+                naiverag.update_db(documents=documents, removed=removed or [])
+            return self.generation
+
+    @contextmanager
+    def build(self) -> Iterator[NaiveRAG]:
+        """Builds one new generation from any number of updates, e.g. `update_db`
+        calls for the batches of a burst of changes. Each update is committed to
+        the new generation, which is published once at the end, so queries switch
+        once. If the block raises, the generation is discarded.
+
+        Yields:
+            NaiveRAG: The instance of the new generation, to be updated.
+        """
+        with self.generations.building(), self._build() as naiverag:
+            yield naiverag
+
+    @contextmanager
+    def _build(self) -> Iterator[NaiveRAG]:
+        """Like `build`, but must hold the `building` lock."""
+        generation = self.generations.create(self._dirs(self.generations.current()))
+        naiverag = None
+        try:
+            naiverag = self._open(generation)
+            yield naiverag
+            self.generations.publish(generation)
+        except BaseException:
+            if naiverag is not None:
+                naiverag.close()
+            shutil.rmtree(self.generations.path(generation), ignore_errors=True)
+            raise
+
+        self._swap(generation, naiverag)
+        self._collect_garbage()
+
+    def start_rebuild(self) -> Future:
+        """Rebuilds from the doc store in a background thread. A rebuild requested
+        while another one is waiting to start is merged into it.
+
+        Returns:
+            Future: Resolves to the result of `rebuild`.
+        """
+        with self._lock:
+            queued = self._queued
+            if queued is not None and not queued.running() and not queued.done():
+                return queued
+            self._queued = self._submit(self.rebuild)
+            return self._queued
+
+    def acquire(self) -> NaiveRAG:
+        """Returns the current instance, which stays open until it is released
+        with `release`, even if a switch replaces it meanwhile.
+
+        Returns:
+            NaiveRAG: The current instance.
+        """
+        with self._lock:
+            naiverag = self.naiverag
+            if naiverag is None:
+                raise RuntimeError("No index generation was published yet.")
+            self._users[naiverag] = self._users.get(naiverag, 0) + 1
+        return naiverag
+
+    def release(self, naiverag: NaiveRAG) -> None:
+        """Releases an instance returned by `acquire`. The last release of a
+        replaced instance closes it and garbage collects its generation in the
+        background, since that waits for a running rebuild.
+
+        Args:
+            naiverag (NaiveRAG): The instance.
+        """
+        with self._lock:
+            self._users[naiverag] -= 1
+            if self._users[naiverag]:
+                return
+            del self._users[naiverag]
+            if naiverag not in self._retired:
+                return
+            del self._retired[naiverag]
+        naiverag.close()
+        with self._lock:
+            if not self._closed:
+                self._submit(self._collect_garbage_blocking)
+
+    @contextmanager
+    def serving(self) -> Iterator[NaiveRAG]:
+        """Acquires the current instance for the enclosed code.
+
+        Yields:
+            NaiveRAG: The current instance.
+        """
+        naiverag = self.acquire()
+        try:
+            yield naiverag
+        finally:
+            self.release(naiverag)
+
+    def query(self, query: str, filters: dict | None = None) -> str:
+        with self.serving() as naiverag:
+            return naiverag.query(query, filters=filters)
+
+    def query_stream(self, query: str, filters: dict | None = None) -> Iterator[dict]:
+        with self.serving() as naiverag:
+            yield from naiverag.query_stream(query, filters=filters)
+
+    async def aquery(self, query: str, filters: dict | None = None) -> str:
+        with self.serving() as naiverag:
+            return await naiverag.aquery(query, filters=filters)
+
+    def query_batch(
+        self, queries: list, filters: dict | None = None
+    ) -> tuple[list, dict]:
+        with self.serving() as naiverag:
+            return naiverag.query_batch(queries, filters=filters)
+
+    def close(self) -> None:
+        """Waits for a running rebuild and closes the instances, also those still
+        in use."""
+        with self._lock:
+            self._closed = True
+            instances = [*self._retired, self.naiverag]
+            self._retired.clear()
+        if self._executor is not None:
+            self._executor.shutdown()
+        for naiverag in instances:
+            if naiverag is not None:
+                naiverag.close()
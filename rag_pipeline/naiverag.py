@@ -1,10 +1,30 @@
 from rag_pipeline.api.gemini import LLM, Embedding
+from rag_pipeline.api.fake import FakeLLM, FakeEmbedding
 from rag_pipeline.db.nano_vdb import DB
+from rag_pipeline.db.mmap_vdb import MmapDB
+from rag_pipeline.db.ivf_vdb import IVFDB
+from rag_pipeline.db.quantized_vdb import QuantizedDB
+from rag_pipeline.db.sharded_vdb import ShardedDB
 from rag_pipeline.chunking.token_size import ChunkingByTokenSize
+from rag_pipeline.chunking.fast_token_size import FastChunkingByTokenSize
+from rag_pipeline.text_db.json_db import JSONTextDB
+from rag_pipeline.text_db.blob_db import BlobTextDB
+from rag_pipeline.rerank.features import FeatureReranker
+from rag_pipeline.rerank.cross_encoder import CrossEncoderReranker
 import numpy as np
-import os
+import hashlib
 import json
+import os
+import time
+import asyncio
+import contextvars
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from .base import AbstractRAG
+from .fusion import reciprocal_rank_fusion
+from util.instrumentation import instrumented
+from util.streaming import prefetch
 
 
 class NaiveRAG(AbstractRAG):
@@ -12,84 +32,441 @@ class NaiveRAG(AbstractRAG):
 
     def chunk(self, documents: list) -> list:
         split_documents = []
-        for document in documents:
-            chunks = self.chunking.chunk(document["page_content"])
+        chunked = self.chunking.chunk_batch(
+            [document["page_content"] for document in documents]
+        )
+        for document, chunks in zip(documents, chunked):
             for chunk in chunks:
                 split_documents.append(
-                    {"page_content": chunk["content"], "metadata": document["metadata"]}
+                    {
+                        "page_content": chunk["content"],
+                        "tokens": chunk["tokens"],
+                        "chunk_order_index": chunk["chunk_order_index"],
+                        "metadata": document["metadata"],
+                    }
                 )
         return split_documents
 
-    def _generate_vectordb(self, chunks: list) -> None:
-        """Generates the vector DB.
+    @staticmethod
+    def _chunk_id(chunk: dict, occurrence: int = 0) -> str:
+        """Derives a stable id from a chunk's source, content and document metadata,
+        so the id doesn't change when other documents are added or removed, but a
+        document re-ingested with e.g. new "tags" replaces its chunks.
 
         Args:
-            chunks (list): The chunks.
+            chunk (dict): The chunk.
+            occurrence (int, optional): Number of chunks with the same content
+                before this one in the document, so repeated passages keep their
+                own chunk and `chunk_order_index`. Defaults to 0.
+
+        Returns:
+            str: The chunk id.
         """
+        key = f"{chunk['metadata']['source']}:{chunk['page_content']}"
+        if occurrence:
+            key += f":{occurrence}"
+        metadata = {
+            field: value
+            for field, value in chunk["metadata"].items()
+            if field != "source"
+        }
+        if metadata:
+            # documents with only a source keep the ids they had before
+            key += ":" + json.dumps(metadata, sort_keys=True, default=str)
+        return "chunk-" + hashlib.md5(key.encode("utf-8")).hexdigest()
+
+    def _chunk_ids(self, chunks: list) -> dict:
+        """Maps the ids of a document's chunks to the chunks, see `_chunk_id`."""
+        occurrences = {}
+        chunks_by_id = {}
+        for chunk in chunks:
+            occurrence = occurrences.get(chunk["page_content"], 0)
+            occurrences[chunk["page_content"]] = occurrence + 1
+            chunks_by_id[self._chunk_id(chunk, occurrence)] = chunk
+        return chunks_by_id
+
+    def _chunk_documents(self, documents: Iterable[dict]) -> Iterator[tuple]:
+        """Chunks documents in small batches of `chunking_batch_size`.
 
-        list_data = [{"__id__": f"chunk-{i}"} for i in range(len(chunks))]
+        Args:
+            documents (Iterable[dict]): The documents.
 
-        contents = [chunk["page_content"] for chunk in chunks]
+        Yields:
+            tuple[str, list]: The source of a document and its chunks.
+        """
+        documents = iter(documents)
+        batch_size = self.config.get("chunking_batch_size", 16)
 
-        embeddings_list = self.embedding.embed(contents)
+        while batch := list(islice(documents, batch_size)):
+            chunks_by_source = {
+                document["metadata"]["source"]: [] for document in batch
+            }
+            for chunk in self.chunk(batch):
+                chunks_by_source[chunk["metadata"]["source"]].append(chunk)
+            yield from chunks_by_source.items()
+
+    @staticmethod
+    def _chunk_metadata(chunk: dict) -> dict:
+        """Returns the filterable metadata of a chunk: its "full_doc_id" and every
+        field of its document's metadata except "source", e.g. user "tags".
 
-        for i, d in enumerate(list_data):
-            d["__vector__"] = np.array(embeddings_list[i], dtype=np.float32)
+        Args:
+            chunk (dict): The chunk.
 
-        self.vdb.update(data=list_data)
+        Returns:
+            dict: The metadata.
+        """
+        metadata = {
+            field: value
+            for field, value in chunk["metadata"].items()
+            if field != "source"
+        }
+        metadata["full_doc_id"] = os.path.basename(chunk["metadata"]["source"])
+        return metadata
 
-    def _generate_textdb(self, chunks: list) -> None:
-        """Generates the text DB
+    def _add_to_textdb(self, chunks: list) -> None:
+        """Adds chunks to the text DB without persisting it.
 
         Args:
-            chunks (list): The chunks.
+            chunks (list): Tuples of chunk id and chunk.
         """
-        self.text_chunks_db = {
-            f"chunk-{i}": {
-                "content": chunk["page_content"],
-                "tokens": "TBD",
-                "chunk_order_index": i,
-                "full_doc_id": os.path.basename(chunk["metadata"]["source"]),
+        self.text_chunks_db.upsert(
+            {
+                chunk_id: {
+                    "content": chunk["page_content"],
+                    "tokens": chunk["tokens"],
+                    "chunk_order_index": chunk["chunk_order_index"],
+                    "full_doc_id": os.path.basename(chunk["metadata"]["source"]),
+                }
+                for chunk_id, chunk in chunks
             }
-            for i, chunk in enumerate(chunks)
-        }
+        )
+
+    def _delete_chunks(self, chunk_ids: Iterable[str]) -> None:
+        """Deletes chunks from all DBs without persisting them.
+
+        Args:
+            chunk_ids (Iterable[str]): The chunk ids.
+        """
+        chunk_ids = list(chunk_ids)
+        if chunk_ids:
+            self.vdb.delete(chunk_ids)
+            self.text_chunks_db.delete(chunk_ids)
+            if self.lexical_index is not None:
+                self.lexical_index.delete(chunk_ids)
+
+    def _save_dbs(self) -> None:
+        """Persists the vector DB, the text DB and the lexical index."""
+        self.vdb.save()
+        self.text_chunks_db.save()
+        if self.lexical_index is not None:
+            self.lexical_index.save()
+
+    def _index(
+        self, chunked_documents: Iterable[tuple], replaced_ids: set | None = None
+    ) -> set:
+        """Streams chunked documents into the DBs.
+
+        The stages run concurrently with bounded buffers in between, so memory
+        doesn't grow with the corpus:
+        chunking (background thread, up to `ingest_queue_size` buffered chunks)
+        -> batched, concurrent embedding -> DB writes as batches finish.
+
+        Chunks that are already indexed are skipped. Previous chunks of a document
+        that weren't regenerated are deleted. The documents are recorded in the
+        manifest once their chunks are saved; if indexing fails, all DBs are
+        reloaded, so nothing of it is kept.
+
+        Args:
+            chunked_documents (Iterable[tuple]): Tuples of a document's source and
+                chunks, e.g. from `_chunk_documents`.
+            replaced_ids (set | None, optional): Ids of previous chunks that are
+                deleted unless the documents regenerate them. Defaults to None.
+
+        Returns:
+            set: Ids of all chunks of the given documents.
+        """
+        seen_ids = set()
+        stale_ids = []
+        # manifest entries of the chunked documents, recorded after saving
+        entries = {}
+
+        def new_chunks() -> Iterator[tuple]:
+            for source, chunks in chunked_documents:
+                chunks_by_id = self._chunk_ids(chunks)
+                stale_ids.extend(
+                    set(self.manifest.chunk_ids(source)) - chunks_by_id.keys()
+                )
+                entries[source] = self.manifest.entry(source, list(chunks_by_id))
+                seen_ids.update(chunks_by_id)
+
+                for chunk_id, chunk in chunks_by_id.items():
+                    if chunk_id not in self.text_chunks_db:
+                        yield chunk_id, chunk
+
+        # chunks handed to the embedder but not yet written, by position
+        pending = {}
+        prefetched = prefetch(new_chunks(), self.config.get("ingest_queue_size", 1000))
+
+        def contents() -> Iterator[str]:
+            for i, (chunk_id, chunk) in enumerate(prefetched):
+                pending[i] = (chunk_id, chunk)
+                yield chunk["page_content"]
+
+        try:
+            for offset, embeddings_list in self.embedding.embed_in_batches(contents()):
+                batch = [pending.pop(offset + i) for i in range(len(embeddings_list))]
+                self.vdb.upsert(
+                    data=[
+                        {
+                            "__id__": chunk_id,
+                            "__vector__": np.array(embedding, dtype=np.float32),
+                            "__metadata__": self._chunk_metadata(chunk),
+                        }
+                        for (chunk_id, chunk), embedding in zip(batch, embeddings_list)
+                    ]
+                )
+                self._add_to_textdb(batch)
+                if self.lexical_index is not None:
+                    self.lexical_index.upsert(
+                        {chunk_id: chunk["page_content"] for chunk_id, chunk in batch}
+                    )
+
+            self._delete_chunks(stale_ids)
+            if replaced_ids:
+                self._delete_chunks(replaced_ids - seen_ids)
 
-        with open(self.text_db_storage_file, "w", encoding="utf-8") as file:
-            json.dump(self.text_chunks_db, file, ensure_ascii=False, indent=4)
+            self._save_dbs()
+        except BaseException:
+            # stops chunking; drops the unsaved changes and releases the DBs
+            prefetched.close()
+            self.load_db()
+            raise
+
+        self.manifest.documents.update(entries)
+        self.manifest.save()
+
+        if self.answer_cache:
+            # cached answers may be based on outdated chunks
+            self.answer_cache.clear()
+
+        return seen_ids
 
     def generate_db(self, chunks: list) -> None:
         if not chunks:
             raise ValueError("No chunks available to generate the vector database.")
 
-        self._generate_vectordb(chunks)
+        chunks_by_source = {}
+        for chunk in chunks:
+            chunks_by_source.setdefault(chunk["metadata"]["source"], []).append(chunk)
+
+        previous_ids = set(self.text_chunks_db)
+        self.manifest.documents = {}
+
+        self._index(chunks_by_source.items(), replaced_ids=previous_ids)
+
+    def update_db(self, documents: Iterable[dict], removed: list) -> None:
+        # the chunks of a DB built before the manifest existed can't be assigned
+        # to documents; as every document is new to the manifest, they are all
+        # re-indexed and the old chunks are replaced like in `generate_db`
+        untracked_ids = (
+            set(self.text_chunks_db)
+            if not os.path.exists(self.manifest.storage_file)
+            else set()
+        )
+        removed_ids = []
+
+        for source in removed:
+            removed_ids.extend(self.manifest.chunk_ids(source))
+            self.manifest.forget(source)
 
-        self._generate_textdb(chunks)
+        self._delete_chunks(removed_ids)
+
+        self._index(self._chunk_documents(documents), replaced_ids=untracked_ids)
 
     def load_db(self) -> None:
         self.vdb.load()
 
-        with open(self.text_db_storage_file, "r", encoding="utf-8") as file:
-            self.text_chunks_db = json.load(file)
+        self.text_chunks_db.load()
+
+        self.manifest.load()
+
+        if self.lexical_index is not None:
+            self.lexical_index.load()
+            if not len(self.lexical_index):
+                self._backfill_lexical_index()
+
+    def _backfill_lexical_index(self) -> None:
+        """Indexes all chunks of the text DB lexically, e.g. after lexical search
+        was enabled for an existing DB."""
+        chunk_ids = iter(list(self.text_chunks_db))
+        while batch := list(islice(chunk_ids, 10000)):
+            self.lexical_index.upsert(
+                {
+                    chunk_id: chunk["content"]
+                    for chunk_id, chunk in zip(
+                        batch, self.text_chunks_db.get_many(batch)
+                    )
+                    if chunk is not None
+                }
+            )
+        self.lexical_index.save()
+
+    @instrumented("text_lookup")
+    def _lookup_chunks(self, results: list) -> list:
+        """Looks up the text chunks of vector DB results.
+
+        Args:
+            results (list): Results of `query_db`.
 
-    def _retrieve_chunks(self, embed_query: np.ndarray) -> list:
-        """Queries the DB with a given embedding, returning a list of top_k text chunks.
+        Returns:
+            list: A list of chunks, each with "id", "score" and the text DB fields.
+        """
+        documents = []
+
+        chunks = self.text_chunks_db.get_many([res["__id__"] for res in results])
+
+        for res, chunk in zip(results, chunks):
+            if chunk is not None:
+                documents.append(
+                    {**chunk, "id": res["__id__"], "score": float(res["__metrics__"])}
+                )
+
+        return documents
+
+    def _num_first_stage(self) -> int:
+        """Number of chunks retrieval passes on: top_k, or more candidates for the
+        reranker to choose the top_k from."""
+        top_k = self.config.get("top_k", 5)
+        if self.reranker is None:
+            return top_k
+        return max(top_k, self.config.get("rerank_candidates", 50))
+
+    def _num_candidates(self) -> int:
+        """Number of dense results to fetch per query. With lexical search, more
+        candidates are fetched so fusion can promote lexical matches."""
+        if self.lexical_index is None:
+            return self._num_first_stage()
+        return self._num_first_stage() * self.config.get("hybrid_candidate_factor", 4)
+
+    def _lexical_mask(self, filters: dict | None) -> np.ndarray | None:
+        """Returns the mask of the chunks passing a filter over the rows of the
+        lexical index, so lexical search only ranks those. None without a filter,
+        or if the vector DB can't list the passing chunks."""
+        if self.lexical_index is None or not filters:
+            return None
+        matching_rows = self.vdb.matching_rows(filters)
+        if matching_rows is not None:
+            return self.lexical_index.mask_of_rows(*matching_rows)
+        matching = self.vdb.matching_ids(filters)
+        if matching is None:
+            return None
+        return self.lexical_index.mask_of(matching)
+
+    def _fuse_lexical(
+        self,
+        query: str,
+        dense_results: list,
+        filters: dict | None = None,
+        mask: np.ndarray | None = None,
+    ) -> list:
+        """Fuses dense results with the BM25 results of the query text.
 
         Args:
+            query (str): The User Query.
+            dense_results (list): Results of `query_db`, best first.
+            filters (dict | None, optional): The filter expression the dense
+                results were retrieved with. Defaults to None.
+            mask (np.ndarray | None, optional): `_lexical_mask` of the filters,
+                if already computed, e.g. once for a batch. Defaults to None.
+
+        Returns:
+            list: The first stage results ("__id__", "__metrics__").
+        """
+        top_k = self._num_first_stage()
+        if self.lexical_index is None:
+            return dense_results[:top_k]
+
+        if mask is None:
+            mask = self._lexical_mask(filters)
+        lexical_results = self.lexical_index.query(
+            query, top_k=self._num_candidates(), mask=mask
+        )
+        if filters and mask is None:
+            passing = set(
+                self.vdb.filter_ids([res["__id__"] for res in lexical_results], filters)
+            )
+            lexical_results = [
+                res for res in lexical_results if res["__id__"] in passing
+            ]
+
+        return reciprocal_rank_fusion(
+            [dense_results, lexical_results],
+            weights=[
+                self.config.get("hybrid_dense_weight", 1.0),
+                self.config.get("hybrid_lexical_weight", 1.0),
+            ],
+            top_k=top_k,
+            k=self.config.get("rrf_k", 60),
+        )
+
+    @instrumented("retrieve")
+    def _retrieve_chunks(
+        self, query: str, embed_query: np.ndarray, filters: dict | None = None
+    ) -> list:
+        """Queries the DB with a given query and its embedding, returning a list of
+        top_k text chunks.
+
+        Args:
+            query (str): The User Query.
             embed_query (np.ndarray): The embedded query.
+            filters (dict | None, optional): Filter expression on the chunk
+                metadata. Defaults to None.
 
         Returns:
             list: A list of chunks.
         """
-        results = self.vdb.query_db(embed_query)
+        results = self.vdb.query_db(
+            embed_query, top_k=self._num_candidates(), filters=filters
+        )
 
-        documents = []
+        return self._rerank(
+            query, self._lookup_chunks(self._fuse_lexical(query, results, filters))
+        )
 
-        for res in results:
-            if res["__id__"] in self.text_chunks_db:
-                content = self.text_chunks_db.get(res["__id__"])["content"]
-                documents.append(content)
+    def _rerank(self, query: str, chunks: list) -> list:
+        """Lets the reranker pick the top_k of the first stage chunks, if one is
+        configured.
 
-        return documents
+        Args:
+            query (str): The User Query.
+            chunks (list): The first stage chunks, best first.
+
+        Returns:
+            list: The top_k chunks, best first.
+        """
+        if self.reranker is None:
+            return chunks
+        return self.reranker.rerank(query, chunks, self.config.get("top_k", 5))
+
+    @staticmethod
+    def _sources(relevant_chunks: list) -> list:
+        """Describes where the retrieved chunks come from.
+
+        Args:
+            relevant_chunks (list): The retrieved chunks.
+
+        Returns:
+            list: One dict with "id", "full_doc_id" and "score" per chunk.
+        """
+        return [
+            {
+                "id": chunk["id"],
+                "full_doc_id": chunk["full_doc_id"],
+                "score": chunk["score"],
+            }
+            for chunk in relevant_chunks
+        ]
 
     def _create_prompt_template(self) -> str:
         """Creates and returns the prompt template.
@@ -102,22 +479,197 @@ class NaiveRAG(AbstractRAG):
         """
         return template
 
-    def query(self, query: str) -> str:
+    @instrumented("prompt_build")
+    def _build_prompt(self, query: str, passages: list) -> str:
+        """Fills the prompt template with the context passages and the query.
+
+        Args:
+            query (str): The User Query.
+            passages (list): The passages assembled from the retrieved chunks, see
+                `ContextAssembler.assemble`.
+
+        Returns:
+            str: The prompt for the LLM.
+        """
         prompt_template = self._create_prompt_template()
 
+        system_prompt = prompt_template.format(
+            content_data="\n\n".join(
+                f"[{i}] {passage['full_doc_id']}\n{passage['content']}"
+                for i, passage in enumerate(passages, start=1)
+            )
+        )
+
+        return f"{system_prompt}\n\nUser Question: {query}"
+
+    def query(self, query: str, filters: dict | None = None) -> str:
+        start = time.perf_counter()
+        # the answer cache is keyed by the query only; filtered queries bypass it
+        answer_cache = self.answer_cache if not filters else None
+
+        if answer_cache and (cached := answer_cache.get_exact(query)):
+            return cached["answer"]
+
         embed_query = self.embedding.embed(query)[0]  # returns list!
 
         embed_query = np.array(embed_query, dtype=np.float32)
 
-        # TBD: include more config parameters (top K, ...)
-        relevant_chunks = self._retrieve_chunks(embed_query)
-
-        system_prompt = prompt_template.format(content_data=relevant_chunks)
+        if answer_cache and (cached := answer_cache.get_semantic(embed_query)):
+            return cached["answer"]
 
-        message = []
+        relevant_chunks = self._retrieve_chunks(query, embed_query, filters)
 
-        prompt = f"{system_prompt}\n\nUser Question: {query}"
+        passages, _ = self.context_assembler.assemble(relevant_chunks)
+        prompt = self._build_prompt(query, passages)
 
         response = self.llm.generate(prompt)
 
+        if answer_cache:
+            answer_cache.put(
+                query,
+                embed_query,
+                response,
+                self._sources(relevant_chunks),
+                time.perf_counter() - start,
+            )
+
         return response
+
+    def query_stream(self, query: str, filters: dict | None = None) -> Iterator[dict]:
+        start = time.perf_counter()
+        # the answer cache is keyed by the query only; filtered queries bypass it
+        answer_cache = self.answer_cache if not filters else None
+
+        if answer_cache and (cached := answer_cache.get_exact(query)):
+            yield {"type": "sources", "sources": cached["sources"]}
+            yield {"type": "delta", "text": cached["answer"]}
+            return
+
+        embed_query = self.embedding.embed(query)[0]
+
+        embed_query = np.array(embed_query, dtype=np.float32)
+
+        if answer_cache and (cached := answer_cache.get_semantic(embed_query)):
+            yield {"type": "sources", "sources": cached["sources"]}
+            yield {"type": "delta", "text": cached["answer"]}
+            return
+
+        relevant_chunks = self._retrieve_chunks(query, embed_query, filters)
+        sources = self._sources(relevant_chunks)
+
+        yield {"type": "sources", "sources": sources}
+
+        passages, report = self.context_assembler.assemble(relevant_chunks)
+        yield {"type": "context", "context": report}
+
+        prompt = self._build_prompt(query, passages)
+
+        deltas = []
+        for delta in self.llm.generate_stream(prompt):
+            deltas.append(delta)
+            yield {"type": "delta", "text": delta}
+
+        if answer_cache:
+            answer_cache.put(
+                query,
+                embed_query,
+                "".join(deltas),
+                sources,
+                time.perf_counter() - start,
+            )
+
+    def _retrieve_prompt(
+        self, query: str, embed_query: np.ndarray, filters: dict | None
+    ) -> tuple[list, str]:
+        """Retrieves the chunks of a query and builds its prompt, the CPU-bound
+        part of `aquery` that runs off the event loop.
+
+        Returns:
+            tuple[list, str]: The relevant chunks and the prompt.
+        """
+        relevant_chunks = self._retrieve_chunks(query, embed_query, filters)
+        passages, _ = self.context_assembler.assemble(relevant_chunks)
+        return relevant_chunks, self._build_prompt(query, passages)
+
+    async def aquery(self, query: str, filters: dict | None = None) -> str:
+        start = time.perf_counter()
+        # the answer cache is keyed by the query only; filtered queries bypass it
+        answer_cache = self.answer_cache if not filters else None
+
+        if answer_cache and (cached := answer_cache.get_exact(query)):
+            return cached["answer"]
+
+        embed_query = (await self.embedding.aembed(query))[0]
+
+        embed_query = np.array(embed_query, dtype=np.float32)
+
+        # the semantic lookup scans every cached query embedding
+        if answer_cache and (
+            cached := await asyncio.to_thread(answer_cache.get_semantic, embed_query)
+        ):
+            return cached["answer"]
+
+        relevant_chunks, prompt = await asyncio.to_thread(
+            self._retrieve_prompt, query, embed_query, filters
+        )
+
+        response = await self.llm.agenerate(prompt)
+
+        if answer_cache:
+            await asyncio.to_thread(
+                answer_cache.put,
+                query,
+                embed_query,
+                response,
+                self._sources(relevant_chunks),
+                time.perf_counter() - start,
+            )
+
+        return response
+
+    def query_batch(
+        self, queries: list, filters: dict | None = None
+    ) -> tuple[list, dict]:
+        timings = {}
+
+        start = time.perf_counter()
+        embeddings = np.empty((len(queries), self.vdb.embedding_dim), dtype=np.float32)
+        for offset, embeddings_list in self.embedding.embed_in_batches(queries):
+            embeddings[offset : offset + len(embeddings_list)] = embeddings_list
+        timings["embed"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = self.vdb.query_db_batch(
+            embeddings, top_k=self._num_candidates(), filters=filters
+        )
+        mask = self._lexical_mask(filters)
+        results = [
+            self._fuse_lexical(q, res, filters, mask)
+            for q, res in zip(queries, results)
+        ]
+        timings["retrieve"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        prompts = [
+            self._build_prompt(
+                query,
+                self.context_assembler.assemble(
+                    self._rerank(query, self._lookup_chunks(res))
+                )[0],
+            )
+            for query, res in zip(queries, results)
+        ]
+        timings["prompt"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        max_workers = self.config.get("llm_max_concurrency", 8)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # the context carries the span the answers are generated for
+            futures = [
+                executor.submit(contextvars.copy_context().run, self.llm.generate, p)
+                for p in prompts
+            ]
+            responses = [future.result() for future in futures]
+        timings["generate"] = time.perf_counter() - start
+
+        return responses, timings
@@ -0,0 +1,139 @@
+from abc import abstractmethod, ABC
+import threading
+import time
+from util.instrumentation import instrumented, metrics
+
+
+class AbstractReranker(ABC):
+    """Second retrieval stage: re-scores the candidates of the first stage with a
+    more precise but slower model and keeps the best `top_k`.
+
+    Candidates are scored in batches of `rerank_batch_size`. With a latency budget
+    of `rerank_budget_ms` per query, the scoring time per candidate is tracked and
+    only as many candidates (best first stage ranks first) are scored as fit into
+    the budget; if not even `top_k` fit, re-ranking is skipped and the first stage
+    order is kept.
+    """
+
+    _implementations: dict[str, type["AbstractReranker"]] = {}
+
+    # weight of the latest batch in the moving average of the time per candidate
+    cost_smoothing = 0.2
+
+    def __init_subclass__(cls: type["AbstractReranker"], **kwargs):
+        super().__init_subclass__(**kwargs)
+        if hasattr(cls, "name"):
+            AbstractReranker._implementations[cls.name] = cls
+
+    @classmethod
+    def create(
+        cls, implementation_name: str, config: dict, **kwargs
+    ) -> "AbstractReranker":
+        """Creates class instance.
+
+        Args:
+            implementation_name (str): Name of the subclass to init.
+            config (dict): The config
+
+        Raises:
+            ValueError: Implementation name doesn't exist
+
+        Returns:
+            AbstractReranker: The initialized class
+        """
+        if implementation_name not in cls._implementations:
+            raise ValueError(
+                f"Subclass {implementation_name} not a valid option. Choose one of the following: {list(cls._implementations.keys())}"
+            )
+
+        implementation_class = cls._implementations[implementation_name]
+        return implementation_class(config, **kwargs)
+
+    def __init__(self, config: dict):
+        self.batch_size = config.get("rerank_batch_size", 16)
+        self.budget = config.get("rerank_budget_ms", 0) / 1000
+
+        self._lock = threading.Lock()
+        # moving average of the scoring time per candidate; None until measured
+        self.seconds_per_candidate = None
+
+    @abstractmethod
+    def score(self, query: str, chunks: list) -> list:
+        """Scores how relevant chunks are to a query.
+
+        Args:
+            query (str): The User Query.
+            chunks (list): The chunks with "content", "score" (of the first
+                stage) and "retrieval_rank" (0 is the best).
+
+        Returns:
+            list: One score per chunk; higher is more relevant.
+        """
+        pass
+
+    def _affordable(self, remaining: float) -> int | None:
+        """Number of candidates that can be scored in `remaining` seconds, or None
+        if there is no budget or the cost is not known yet."""
+        if not self.budget or self.seconds_per_candidate is None:
+            return None
+        return int(max(remaining, 0.0) / self.seconds_per_candidate)
+
+    def _observe(self, duration: float, candidates: int) -> None:
+        cost = duration / candidates
+        with self._lock:
+            if self.seconds_per_candidate is None:
+                self.seconds_per_candidate = cost
+            else:
+                self.seconds_per_candidate += self.cost_smoothing * (
+                    cost - self.seconds_per_candidate
+                )
+
+    @instrumented("rerank")
+    def rerank(self, query: str, chunks: list, top_k: int) -> list:
+        """Re-ranks the candidates of a query within the latency budget.
+
+        Args:
+            query (str): The User Query.
+            chunks (list): The candidate chunks, best first stage rank first.
+            top_k (int): Number of chunks to return.
+
+        Returns:
+            list: The best `top_k` chunks, best first. Re-scored chunks carry the
+                new "score" and the first stage score as "retrieval_score".
+        """
+        if len(chunks) <= 1:
+            return chunks[:top_k]
+
+        start = time.perf_counter()
+        affordable = self._affordable(self.budget)
+        if affordable is not None and affordable < min(top_k, len(chunks)):
+            metrics.count("rerank_skipped")
+            return chunks[:top_k]
+
+        candidates = [
+            {**chunk, "retrieval_rank": rank} for rank, chunk in enumerate(chunks)
+        ]
+        scores = []
+        while len(scores) < len(candidates):
+            batch = candidates[len(scores) : len(scores) + self.batch_size]
+            batch_start = time.perf_counter()
+            scores.extend(self.score(query, batch))
+            self._observe(time.perf_counter() - batch_start, len(batch))
+
+            # stop once the next batch would exceed the budget, if top_k are scored
+            if len(scores) >= top_k and len(scores) < len(candidates):
+                remaining = self.budget - (time.perf_counter() - start)
+                affordable = self._affordable(remaining)
+                if affordable is not None and affordable < min(
+                    self.batch_size, len(candidates) - len(scores)
+                ):
+                    metrics.count("rerank_truncated")
+                    break
+
+        metrics.count("candidates_reranked", len(scores))
+        reranked = [
+            {**chunk, "score": float(score), "retrieval_score": chunk["score"]}
+            for chunk, score in zip(candidates, scores)
+        ]
+        reranked.sort(key=lambda chunk: chunk["score"], reverse=True)
+        return reranked[:top_k]
@@ -0,0 +1,32 @@
+from .base import AbstractReranker
+
+
+class CrossEncoderReranker(AbstractReranker):
+    """Re-ranks with a cross-encoder, which reads query and chunk together and is
+    more precise than comparing their embeddings. Runs `rerank_model` locally with
+    sentence-transformers, which has to be installed separately:
+
+        pip install sentence-transformers
+    """
+
+    name = "cross_encoder"
+
+    def __init__(self, config: dict) -> None:
+        super().__init__(config)
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError(
+                "The cross_encoder reranker requires sentence-transformers: pip install sentence-transformers"
+            ) from e
+
+        self.model = CrossEncoder(
+            config.get("rerank_model", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+        )
+
+    def score(self, query: str, chunks: list) -> list:
+        return self.model.predict(
+            [(query, chunk["content"]) for chunk in chunks],
+            batch_size=self.batch_size,
+            show_progress_bar=False,
+        ).tolist()
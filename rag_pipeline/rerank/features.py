@@ -0,0 +1,51 @@
+import math
+from rag_pipeline.bm25 import tokenize
+from .base import AbstractReranker
+
+
+class FeatureReranker(AbstractReranker):
+    """Re-ranks with features computed locally from the query and chunk text, so
+    it needs no model and no API call:
+
+        - term coverage: fraction of the distinct query terms in the chunk
+        - phrase coverage: fraction of the query's adjacent term pairs that occur
+          adjacently in the chunk, which rewards passages using the query's wording
+        - retrieval prior: 1 / log2(2 + first stage rank)
+
+    The score is `rerank_lexical_weight` times the mean of both coverages plus the
+    remaining weight times the prior. Ranks are used instead of first stage scores,
+    as dense similarities and fused scores are not on the same scale.
+    """
+
+    name = "features"
+
+    def __init__(self, config: dict) -> None:
+        super().__init__(config)
+        self.lexical_weight = config.get("rerank_lexical_weight", 0.5)
+
+    def score(self, query: str, chunks: list) -> list:
+        terms = tokenize(query)
+        query_terms = set(terms)
+        query_pairs = set(zip(terms, terms[1:]))
+
+        scores = []
+        for chunk in chunks:
+            tokens = tokenize(chunk["content"])
+            chunk_terms = set(tokens)
+
+            coverage = (
+                len(query_terms & chunk_terms) / len(query_terms) if query_terms else 0
+            )
+            if query_pairs:
+                phrase = len(query_pairs & set(zip(tokens, tokens[1:]))) / len(
+                    query_pairs
+                )
+            else:
+                phrase = coverage
+
+            prior = 1 / math.log2(2 + chunk["retrieval_rank"])
+            scores.append(
+                self.lexical_weight * (coverage + phrase) / 2
+                + (1 - self.lexical_weight) * prior
+            )
+        return scores
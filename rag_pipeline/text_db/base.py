@@ -0,0 +1,107 @@
+from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+import os
+from util.instrumentation import instrument_methods, instrumented
+
+
+class AbstractTextDB(ABC):
+    _implementations: dict[str, type["AbstractTextDB"]] = {}
+
+    def __init_subclass__(cls: type["AbstractTextDB"], **kwargs):
+        super().__init_subclass__(**kwargs)
+        if hasattr(cls, "name"):
+            AbstractTextDB._implementations[cls.name] = cls
+        instrument_methods(cls, {"get": "text_lookup", "get_many": "text_lookup"})
+
+    @classmethod
+    def create(
+        cls, implementation_name: str, config: dict, **kwargs
+    ) -> "AbstractTextDB":
+        """Creates class instance.
+
+        Args:
+            implementation_name (str): Name of the subclass to init.
+            config (dict): The config
+
+        Raises:
+            ValueError: Implementation name doesn't exist
+
+        Returns:
+            AbstractTextDB: The initialized class
+        """
+        if implementation_name not in cls._implementations:
+            raise ValueError(
+                f"Subclass {implementation_name} not a valid option. Choose one of the following: {list(cls._implementations.keys())}"
+            )
+
+        implementation_class = cls._implementations[implementation_name]
+        return implementation_class(config, **kwargs)
+
+    def __init__(self, config: dict) -> None:
+        self.dir_text_chunks = config["dir_text_chunks"]
+        # the file whose existence marks a persisted text DB
+        self.storage_file = os.path.join(self.dir_text_chunks, "text_db.json")
+
+    @abstractmethod
+    def upsert(self, chunks: dict) -> None:
+        """Inserts or updates chunks without persisting them.
+
+        Args:
+            chunks (dict): The chunks ("content", "tokens", "chunk_order_index",
+                "full_doc_id") by chunk id.
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, chunk_ids: Iterable[str]) -> None:
+        """Deletes chunks without persisting it. Unknown ids are ignored.
+
+        Args:
+            chunk_ids (Iterable[str]): The chunk ids.
+        """
+        pass
+
+    @abstractmethod
+    def get(self, chunk_id: str) -> dict | None:
+        """Looks up a single chunk.
+
+        Args:
+            chunk_id (str): The chunk id.
+
+        Returns:
+            dict | None: The chunk or None if it doesn't exist.
+        """
+        pass
+
+    @instrumented("text_lookup")
+    def get_many(self, chunk_ids: Iterable[str]) -> list:
+        """Looks up several chunks.
+
+        Args:
+            chunk_ids (Iterable[str]): The chunk ids.
+
+        Returns:
+            list: The chunk (or None) of every id, in input order.
+        """
+        return [self.get(chunk_id) for chunk_id in chunk_ids]
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return self.get(chunk_id) is not None
+
+    @abstractmethod
+    def __iter__(self) -> Iterator[str]:
+        """Iterates over the ids of all chunks."""
+        pass
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    @abstractmethod
+    def save(self) -> None:
+        """Persists the text DB."""
+        pass
+
+    @abstractmethod
+    def load(self) -> None:
+        """Loads the text DB. A missing text DB is treated as empty."""
+        pass
@@ -0,0 +1,377 @@
+import json
+import logging
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+import numpy
+from util.storage import (
+    WriterLock,
+    commit_json,
+    commit_lock,
+    read_json,
+    remove_unreferenced,
+    unshare,
+    versioned_name,
+)
+from .base import AbstractTextDB
+
+logger = logging.getLogger(__name__)
+
+
+def _index_dtype(id_width: int) -> numpy.dtype:
+    return numpy.dtype([("id", f"S{id_width}"), ("offset", "<i8"), ("length", "<i4")])
+
+
+class BlobTextDB(AbstractTextDB):
+    """Text DB that stores chunks in a single append-only blob with an offsets index.
+
+    Files within `dir_text_chunks`:
+        - blob.json: the commit: version, blob size and the names of the files below
+        - chunks-NNNNNN.bin: one JSON record per line
+        - index-NNNNNN.npy: (id, offset, length) of every live record, sorted by id
+
+    Loading memory-maps the index instead of decoding it, and chunk content is only
+    read (from a memory-mapped blob) when it is looked up, so start-up time and
+    resident memory don't grow with the corpus text. The `text_db_cache_size` most
+    recently read chunks are kept decoded.
+
+    Like `MmapDB`, loading only reads, and a writer holds a lock from its first
+    change until the next save. New records are appended to the blob; every save
+    writes a new index and a compaction a new blob, and replacing blob.json
+    switches to them at once. Records beyond the committed blob size (e.g. after a
+    crash) are cut off by the next writer. A text_db.json of the "json" text DB is
+    migrated on the first load and then renamed to text_db.json.migrated, so
+    switching back to the "json" text DB needs the documents to be ingested again.
+    """
+
+    name = "blob"
+
+    # dead blob bytes are only compacted away once they exceed this fraction
+    compaction_threshold = 0.25
+
+    # file names before blob.json existed
+    legacy_files = {"blob": "chunks.bin", "index": "index.npy"}
+
+    def __init__(self, config: dict) -> None:
+        super().__init__(config)
+        self.json_file = self.storage_file
+        self.meta_file = os.path.join(self.dir_text_chunks, "blob.json")
+        self.cache_size = config.get("text_db_cache_size", 1024)
+        self.lock = WriterLock(self.dir_text_chunks)
+
+        legacy_index = os.path.join(self.dir_text_chunks, self.legacy_files["index"])
+        self.storage_file = next(
+            (
+                path
+                for path in (self.meta_file, legacy_index, self.json_file)
+                if os.path.exists(path)
+            ),
+            self.meta_file,
+        )
+
+        self._lock = threading.Lock()
+        self._blob = None
+        self._blob_handle = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self._close_blob()
+        self._index = numpy.empty(0, dtype=_index_dtype(1))
+        # changes since the last save, by chunk id
+        self._added = {}
+        self._deleted = set()
+        self._cache = OrderedDict()
+
+        self.meta = None
+        # version 0 is never committed, see `MmapDB`
+        self.version = 0
+        self.files = {"blob": versioned_name("chunks", 0, ".bin")}
+        self.blob_size = 0
+
+    def _path(self, kind: str) -> str:
+        return os.path.join(self.dir_text_chunks, self.files[kind])
+
+    @property
+    def blob_file(self) -> str:
+        return self._path("blob")
+
+    def _close_blob(self) -> None:
+        if self._blob is not None:
+            self._blob.close()
+            self._blob = None
+        if self._blob_handle is not None:
+            self._blob_handle.close()
+            self._blob_handle = None
+
+    def _open_blob(self) -> None:
+        """Opens the blob, so it stays readable after a later commit removed it."""
+        self._close_blob()
+        if os.path.exists(self.blob_file):
+            self._blob_handle = open(self.blob_file, "rb")
+
+    def _load_commit(self) -> None:
+        """Loads the last commit. Only reads, so it is safe while another process
+        writes."""
+        with commit_lock(self.dir_text_chunks, shared=True):
+            self._open_commit()
+
+    def _open_commit(self) -> None:
+        self._reset()
+        self.meta = read_json(self.meta_file)
+        if self.meta is not None:
+            self.version = self.meta["version"]
+            self.files = dict(self.meta["files"])
+            self.blob_size = self.meta["blob_size"]
+        elif os.path.exists(os.path.join(self.dir_text_chunks, "index.npy")):
+            self.files = dict(self.legacy_files)
+            self.blob_size = os.path.getsize(self.blob_file)
+
+        if "index" in self.files:
+            self._index = numpy.load(self._path("index"), mmap_mode="r")
+        self._open_blob()
+
+    def _begin_write(self) -> None:
+        """Takes the writer lock before the first change after a commit. Reloads
+        if another writer committed since this instance was loaded, and cuts off
+        records appended after the last commit."""
+        if self.lock.held:
+            return
+        self.lock.acquire()
+
+        if read_json(self.meta_file) != self.meta:
+            self._load_commit()
+        if unshare(self.blob_file):
+            self._open_blob()
+        if os.path.exists(self.blob_file):
+            if os.path.getsize(self.blob_file) > self.blob_size:
+                with open(self.blob_file, "r+b") as file:
+                    file.truncate(self.blob_size)
+
+    def _find(self, chunk_id: str) -> tuple[int, int] | None:
+        """Returns the offset and length of a record in the blob."""
+        if chunk_id in self._deleted:
+            return None
+        if (location := self._added.get(chunk_id)) is not None:
+            return location
+
+        key = chunk_id.encode("utf-8")
+        ids = self._index["id"]
+        if len(key) > ids.dtype.itemsize:
+            return None
+        row = int(numpy.searchsorted(ids, key))
+        if row < len(ids) and ids[row] == key:
+            return int(self._index["offset"][row]), int(self._index["length"][row])
+        return None
+
+    def _read(self, offset: int, length: int) -> bytes:
+        """Reads a record, remapping the blob if it grew since it was mapped."""
+        if self._blob is None or offset + length > len(self._blob):
+            if self._blob_handle is None:
+                self._open_blob()
+            if self._blob is not None:
+                self._blob.close()
+            self._blob = mmap.mmap(
+                self._blob_handle.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        return self._blob[offset : offset + length]
+
+    def upsert(self, chunks: dict) -> None:
+        if not chunks:
+            return
+
+        os.makedirs(self.dir_text_chunks, exist_ok=True)
+
+        records = [
+            json.dumps(chunk, ensure_ascii=False).encode("utf-8")
+            for chunk in chunks.values()
+        ]
+
+        with self._lock:
+            self._begin_write()
+            with open(self.blob_file, "ab") as file:
+                offset = file.seek(0, os.SEEK_END)
+                file.write(b"".join(record + b"\n" for record in records))
+            if self._blob_handle is None:
+                self._open_blob()
+
+            for chunk_id, record in zip(chunks, records):
+                self._added[chunk_id] = (offset, len(record))
+                self._deleted.discard(chunk_id)
+                self._cache.pop(chunk_id, None)
+                offset += len(record) + 1
+
+    def delete(self, chunk_ids: Iterable[str]) -> None:
+        chunk_ids = list(chunk_ids)
+        if not chunk_ids:
+            return
+
+        with self._lock:
+            self._begin_write()
+            for chunk_id in chunk_ids:
+                self._added.pop(chunk_id, None)
+                self._deleted.add(chunk_id)
+                self._cache.pop(chunk_id, None)
+
+    def get(self, chunk_id: str) -> dict | None:
+        with self._lock:
+            if (chunk := self._cache.get(chunk_id)) is not None:
+                self._cache.move_to_end(chunk_id)
+                return chunk
+
+            location = self._find(chunk_id)
+            if location is None:
+                return None
+            record = self._read(*location)
+
+        chunk = json.loads(record)
+
+        with self._lock:
+            self._cache[chunk_id] = chunk
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return chunk
+
+    def __contains__(self, chunk_id: str) -> bool:
+        with self._lock:
+            return chunk_id in self._cache or self._find(chunk_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            changed = self._added.keys() | self._deleted
+            ids = [chunk_id.decode("utf-8") for chunk_id in self._index["id"]]
+            ids = [chunk_id for chunk_id in ids if chunk_id not in changed]
+            ids.extend(self._added)
+        return iter(ids)
+
+    def _merged_index(self) -> numpy.ndarray:
+        """Applies the changes since the last save to the index."""
+        changed = [
+            chunk_id.encode("utf-8") for chunk_id in self._added.keys() | self._deleted
+        ]
+        alive = self._index
+        if changed:
+            alive = alive[~numpy.isin(alive["id"], changed)]
+
+        added = numpy.array(
+            [
+                (chunk_id.encode("utf-8"), offset, length)
+                for chunk_id, (offset, length) in self._added.items()
+            ],
+            dtype=_index_dtype(
+                max((len(c.encode("utf-8")) for c in self._added), default=1)
+            ),
+        )
+
+        id_width = max(alive.dtype["id"].itemsize, added.dtype["id"].itemsize)
+        index = numpy.concatenate(
+            [alive.astype(_index_dtype(id_width)), added.astype(_index_dtype(id_width))]
+        )
+        return index[numpy.argsort(index["id"], kind="stable")]
+
+    def _compact(self, index: numpy.ndarray, version: int) -> numpy.ndarray:
+        """Writes the records of the given index to the blob of a new version.
+
+        Args:
+            index (numpy.ndarray): The new index.
+            version (int): The version being committed.
+
+        Returns:
+            numpy.ndarray: The index with offsets into the new blob.
+        """
+        index = index.copy()
+        name = versioned_name("chunks", version, ".bin")
+        with open(os.path.join(self.dir_text_chunks, name), "wb") as file:
+            # copy in blob order, so the old blob is read sequentially
+            for row in numpy.argsort(index["offset"], kind="stable"):
+                offset, length = int(index["offset"][row]), int(index["length"][row])
+                index["offset"][row] = file.tell()
+                file.write(self._read(offset, length) + b"\n")
+
+        self.files["blob"] = name
+        self._open_blob()
+        return index
+
+    def save(self) -> None:
+        with self._lock:
+            if not self.lock.held:
+                # nothing changed since the last commit
+                return
+
+            version = self.version + 1
+            index = self._merged_index()
+
+            blob_size = (
+                os.path.getsize(self.blob_file) if os.path.exists(self.blob_file) else 0
+            )
+            live_size = int(index["length"].sum()) + len(index)
+            if blob_size - live_size > self.compaction_threshold * blob_size:
+                index = self._compact(index, version)
+                blob_size = os.path.getsize(self.blob_file)
+
+            self.files["index"] = versioned_name("index", version, ".npy")
+            with open(self._path("index"), "wb") as file:
+                numpy.save(file, index)
+
+            meta = {
+                "version": version,
+                "blob_size": blob_size,
+                "files": dict(self.files),
+            }
+            # keep the files of the previous commit for readers that just loaded it
+            previous = self.meta["files"] if self.meta else self.legacy_files
+            with commit_lock(self.dir_text_chunks):
+                commit_json(
+                    self.meta_file,
+                    meta,
+                    synced=[self._path(kind) for kind in self.files],
+                )
+                remove_unreferenced(
+                    self.dir_text_chunks,
+                    set(self.files.values()) | set(previous.values()),
+                    legacy=tuple(self.legacy_files.values()),
+                )
+
+            self.meta = meta
+            self.version = version
+            self.blob_size = blob_size
+            self._index = numpy.load(self._path("index"), mmap_mode="r")
+            self._added = {}
+            self._deleted = set()
+            self.lock.release()
+
+    def _migrate(self) -> None:
+        """Copies the chunks of a text_db.json into the blob store and renames the
+        JSON file once the blob store is committed, so that a stale copy is never
+        loaded by the "json" text DB."""
+        with self._lock:
+            self._begin_write()
+            if self.meta is not None:
+                # migrated by another process meanwhile
+                self.lock.release()
+                return
+
+        logger.info("Migrating %s to the blob text DB", self.json_file)
+        with open(self.json_file, "r", encoding="utf-8") as file:
+            chunks = json.load(file)
+        self.upsert(chunks)
+        self.save()
+        os.replace(self.json_file, self.json_file + ".migrated")
+        self.storage_file = self.meta_file
+
+    def load(self) -> None:
+        with self._lock:
+            # appended but uncommitted records are cut off by the next writer
+            self.lock.release()
+            self._load_commit()
+            migrate = self.meta is None and "index" not in self.files
+        if migrate and os.path.exists(self.json_file):
+            self._migrate()
+
+    def close(self) -> None:
+        """Releases the writer lock and unmaps the blob."""
+        with self._lock:
+            self.lock.release()
+            self._close_blob()
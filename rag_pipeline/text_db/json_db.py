@@ -0,0 +1,50 @@
+import json
+import os
+from collections.abc import Iterable, Iterator
+from .base import AbstractTextDB
+
+
+class JSONTextDB(AbstractTextDB):
+    """Keeps every chunk in memory and persists them as a single JSON file
+    (text_db.json). Loading decodes the whole file, so start-up time and memory grow
+    with the corpus."""
+
+    name = "json"
+
+    def __init__(self, config: dict) -> None:
+        super().__init__(config)
+        self.chunks = {}
+
+    def upsert(self, chunks: dict) -> None:
+        self.chunks.update(chunks)
+
+    def delete(self, chunk_ids: Iterable[str]) -> None:
+        for chunk_id in chunk_ids:
+            self.chunks.pop(chunk_id, None)
+
+    def get(self, chunk_id: str) -> dict | None:
+        return self.chunks.get(chunk_id)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self.chunks
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.chunks))
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def save(self) -> None:
+        os.makedirs(self.dir_text_chunks, exist_ok=True)
+        tmp_file = self.storage_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as file:
+            json.dump(self.chunks, file, ensure_ascii=False)
+        os.replace(tmp_file, self.storage_file)
+
+    def load(self) -> None:
+        if not os.path.exists(self.storage_file):
+            self.chunks = {}
+            return
+
+        with open(self.storage_file, "r", encoding="utf-8") as file:
+            self.chunks = json.load(file)
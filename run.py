@@ -1,47 +1,88 @@
-from util.check_db import is_update_required
-import rag_pipeline.naiverag
-from util.process_docs import pdf_to_txt, get_documents
+import os
+from util.process_docs import pdf_to_txt, iter_documents, get_document_paths
 from rag_pipeline.naiverag import NaiveRAG
+from rag_pipeline.generational import GenerationalRAG
+from rag_pipeline.api.cache import CachedEmbedding
 from util.load_config import load_config
 from util.timer import Timer
+from util.instrumentation import metrics
 
 
-def main():
+def index(config: dict) -> NaiveRAG:
+    """Indexes the new and changed documents of the doc store in place."""
+    # TBD: _file are folders instead of files..
+    naiverag = NaiveRAG(config)
 
-    config_path = "./config.yaml"
+    extraction = pdf_to_txt(
+        config["dir_doc_store"], max_workers=config.get("pdf_max_workers")
+    )
+    if extraction["converted"]:
+        print(
+            f"Converted {extraction['converted']} PDFs ({extraction['pages']} pages, "
+            f"{extraction['pages_per_second']:.1f} pages/s), "
+            f"skipped {extraction['skipped']} up-to-date PDFs"
+        )
+    if extraction["failed"]:
+        print(f"{extraction['failed']} PDFs could not be converted")
+    paths = get_document_paths(config["dir_doc_store"])
+
+    if not paths:
+        raise ValueError("No Documents found in the specified Directory!")
+
+    if os.path.exists(naiverag.text_db_storage_file):
+        naiverag.load_db()
 
-    config = load_config(config_path)
+    changed, removed = naiverag.manifest.diff(paths)
 
-    # TBD: _file are folders instead of files..
-    naiverag = NaiveRAG(config)
+    if changed or removed:
+        documents = iter_documents(paths=changed)
 
-    if is_update_required(
-        dir_text_chunks=config["dir_text_chunks"],
-        dir_vector_db=config["dir_vector_db"],
-        dir_doc_store=config["dir_doc_store"],
-    ):
-        pdf_to_txt()
-        documents = get_documents()
+        naiverag.update_db(documents=documents, removed=removed)
 
-        if not documents:
-            raise ValueError("No Documents found in the specified Directory!")
+        if isinstance(naiverag.embedding, CachedEmbedding):
+            print(f"Embedding cache: {naiverag.embedding.stats()}")
 
-        chunks = naiverag.chunk(documents)
+    return naiverag
 
-        if not chunks:
-            raise ValueError("Chunking failed!")
 
-        naiverag.generate_db(chunks=chunks)
+def main():
+
+    config_path = "./config.yaml"
 
+    config = load_config(config_path)
+
+    generational, rebuild = None, None
+    if config.get("dir_index"):
+        generational = GenerationalRAG(config)
+        if generational.naiverag is None:
+            generational.rebuild()
+        elif generational.is_update_required():
+            # the current generation answers while the next one is built
+            rebuild = generational.start_rebuild()
+        naiverag = generational.naiverag
     else:
-        naiverag.load_db()
+        naiverag = index(config)
 
     query = "How are you?"
 
     with Timer():
-        response = naiverag.query(query)
-
-    print(response)
+        for event in naiverag.query_stream(query):
+            if event["type"] == "delta":
+                print(event["text"], end="", flush=True)
+        print()
+
+    print(f"Context: {naiverag.context_assembler.stats()}")
+
+    if generational is not None:
+        if rebuild is not None:
+            print(f"Published index generation {rebuild.result()}")
+        generational.close()
+
+    if metrics.enabled:
+        if config.get("metrics_jsonl_file"):
+            metrics.export_jsonl(config["metrics_jsonl_file"])
+        if config.get("metrics_prometheus_file"):
+            metrics.export_prometheus(config["metrics_prometheus_file"])
 
 
 if __name__ == "__main__":
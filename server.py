@@ -0,0 +1,473 @@
+"""Long-running HTTP server answering queries from an index loaded once.
+
+Endpoints (JSON in and out):
+    POST /query   {"query": str, "filters": {...}}  -> {"answer", "sources", "context"}
+    POST /ingest  {"documents": [{"page_content", "metadata": {"source", ...}}],
+                   "removed": [source, ...]}       -> {"changed", "removed", "chunks"}
+                  An empty body re-indexes the changed documents of the doc store.
+    GET  /health                                     -> {"status", "chunks"}
+    GET  /stats                                      -> cache, context and coalescing stats
+    GET  /metrics                                    -> Prometheus text format
+
+Identical queries in flight at the same time are answered once. Query embeddings
+and vector searches of concurrent requests are micro-batched, see
+`BatchedEmbedding` and `BatchedDB`. Ingestion waits for running queries and
+blocks new ones until it is done.
+
+With `--workers N` (config `server_workers`) on a POSIX system, a parent process
+loads the index once and forks N worker processes that share it read-only and
+accept connections on the same socket, see `PreforkPool`. Sending SIGHUP to the
+parent hot-swaps the workers to the index as it is on disk now; an ingestion in
+any worker does so automatically. Stats and metrics are per worker.
+
+With `dir_index` set, the index is kept in versioned generations, see
+`GenerationalRAG`: an ingestion builds a new generation while queries keep being
+answered from the current one, and answers {"generation", "chunks"}. Pool workers
+switch to a new generation as soon as it is published.
+
+With `--watch`, a single server process indexes the changes of the doc store as
+they happen, see `watch.py`; a pool is kept up to date by running `watch.py`
+next to it with `dir_index` set.
+
+Usage:
+    python server.py --port 8000
+    python server.py --port 8000 --workers 4
+    python server.py --port 8000 --watch
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from rag_pipeline.naiverag import NaiveRAG
+from rag_pipeline.generational import GenerationalRAG
+from rag_pipeline.api.batching import BatchedEmbedding
+from rag_pipeline.api.cache import CachedEmbedding
+from rag_pipeline.db.batching import BatchedDB
+from util.batching import Coalescer, ReadWriteLock
+from util.generations import IndexGenerations
+from util.instrumentation import metrics
+from util.load_config import load_config
+from util.prefork import PreforkPool
+from util.process_docs import pdf_to_txt, iter_documents, get_document_paths
+from watch import apply_batches, watch
+
+
+class RAGServer(ThreadingHTTPServer):
+    """HTTP server around a NaiveRAG instance, or the current generation of a
+    GenerationalRAG, one thread per connection."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        address: tuple,
+        rag: NaiveRAG | GenerationalRAG,
+        config: dict,
+        bind_and_activate: bool = True,
+    ) -> None:
+        self.config = config
+        self.coalescer = Coalescer()
+        self.lock = ReadWriteLock()
+
+        self._adopting = threading.Lock()
+
+        self.draining = False
+        self._connections = 0
+        self._idle = threading.Condition()
+
+        if isinstance(rag, GenerationalRAG):
+            self.generations = rag
+            rag = rag.naiverag
+        else:
+            self.generations = None
+        self.naiverag = self._wrap(rag)
+
+        super().__init__(address, RequestHandler, bind_and_activate)
+
+    def _wrap(self, naiverag: NaiveRAG) -> NaiveRAG:
+        """Lets a NaiveRAG instance batch concurrent embeddings and searches, unless
+        it does already. The batching is closed with the instance, see
+        `NaiveRAG.close`."""
+        if not isinstance(naiverag.vdb, BatchedDB):
+            naiverag.embedding = BatchedEmbedding(naiverag.embedding, self.config)
+            naiverag.vdb = BatchedDB(naiverag.vdb, self.config)
+        return naiverag
+
+    def process_request(self, request, client_address) -> None:
+        with self._idle:
+            self._connections += 1
+        super().process_request(request, client_address)
+
+    def process_request_thread(self, request, client_address) -> None:
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            with self._idle:
+                self._connections -= 1
+                if not self._connections:
+                    self._idle.notify_all()
+
+    def drain(self, timeout: float | None = None) -> bool:
+        """Stops accepting connections and waits until the open ones are closed.
+        Each is closed after its next response, or when it is idle for longer than
+        the keep-alive timeout. Must not be called from the thread running
+        `serve_forever`.
+
+        Args:
+            timeout (float | None, optional): Seconds to wait for the connections.
+                Defaults to None (no limit).
+
+        Returns:
+            bool: Whether all connections were closed.
+        """
+        self.draining = True
+        self.shutdown()
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._connections, timeout)
+
+    def answer(self, query: str, filters: dict | None = None) -> dict:
+        """Answers a query; concurrent identical queries share one answer.
+
+        Args:
+            query (str): The User Query.
+            filters (dict | None, optional): Filter expression on the chunk
+                metadata. Defaults to None.
+
+        Returns:
+            dict: "answer", "sources" and the "context" report.
+        """
+        key = (
+            " ".join(query.casefold().split()),
+            json.dumps(filters, sort_keys=True) if filters else None,
+        )
+        return self.coalescer.run(key, lambda: self._answer(query, filters))
+
+    @contextmanager
+    def _serving(self) -> Iterator[NaiveRAG]:
+        """Yields the instance to answer with. With generations, it is acquired,
+        so a switch doesn't close it before the enclosed code is done."""
+        if self.generations is None:
+            yield self.naiverag
+            return
+        with self.generations.serving() as naiverag:
+            with self._adopting:
+                # acquired between a switch and `_adopt`
+                self._wrap(naiverag)
+            yield naiverag
+
+    def _answer(self, query: str, filters: dict | None) -> dict:
+        result = {"answer": "", "sources": [], "context": None}
+        deltas = []
+        with self.lock.reading(), self._serving() as naiverag:
+            for event in naiverag.query_stream(query, filters=filters):
+                if event["type"] == "delta":
+                    deltas.append(event["text"])
+                else:
+                    result[event["type"]] = event[event["type"]]
+        result["answer"] = "".join(deltas)
+        return result
+
+    def ingest(self, documents: list | None, removed: list) -> dict:
+        """Indexes documents, or the changed documents of the doc store.
+
+        Args:
+            documents (list | None): Documents with "page_content" and "metadata"
+                (with "source"), or None to scan the doc store.
+            removed (list): Sources of documents to remove.
+
+        Returns:
+            dict: Number of "changed" and "removed" documents, and the "chunks"
+                in the DB; with generations the "generation" instead of the
+                document counts.
+        """
+        if self.generations is not None:
+            # built next to the current generation, which keeps serving
+            self.generations.rebuild(documents, removed)
+            self._adopt()
+            return {
+                "generation": self.generations.generation,
+                "chunks": len(self.naiverag.text_chunks_db),
+            }
+
+        with self.lock.writing():
+            if documents is None:
+                pdf_to_txt(
+                    self.config["dir_doc_store"],
+                    max_workers=self.config.get("pdf_max_workers"),
+                )
+                paths = get_document_paths(self.config["dir_doc_store"])
+                changed, removed = self.naiverag.manifest.diff(paths)
+                documents = iter_documents(paths=changed)
+            else:
+                changed = documents
+
+            if changed or removed:
+                self.naiverag.update_db(documents=documents, removed=removed)
+
+            return {
+                "changed": len(changed),
+                "removed": len(removed),
+                "chunks": len(self.naiverag.text_chunks_db),
+            }
+
+    def ingest_batches(self, batches: Iterator[list], removed: list) -> None:
+        """Indexes the batches of documents of a burst of changes, see `watch`.
+        With generations, all batches go into one new generation.
+
+        Args:
+            batches (Iterator[list]): Batches of documents, each committed on its
+                own.
+            removed (list): Sources of documents to remove.
+        """
+        if self.generations is None:
+            for i, documents in enumerate(batches):
+                self.ingest(documents, [] if i else removed)
+            return
+
+        with self.generations.build() as naiverag:
+            apply_batches(naiverag, batches, removed)
+        self._adopt()
+
+    def _adopt(self) -> None:
+        """Switches to the current generation of the GenerationalRAG."""
+        with self._adopting:
+            # queries in flight finish on the instance they acquired
+            self.naiverag = self._wrap(self.generations.naiverag)
+
+    def stats(self) -> dict:
+        naiverag = self.naiverag
+        stats = {
+            "coalesced_queries": self.coalescer.coalesced,
+            "context": naiverag.context_assembler.stats(),
+        }
+        if naiverag.answer_cache is not None:
+            stats["answer_cache"] = naiverag.answer_cache.stats()
+        if self.generations is not None:
+            stats["generation"] = self.generations.generation
+        if isinstance(naiverag.embedding.embedding, CachedEmbedding):
+            stats["embedding_cache"] = naiverag.embedding.embedding.stats()
+        return stats
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive
+    # seconds an idle connection is kept open
+    timeout = 15
+    server: RAGServer
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if self.server.draining:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        self._send(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        if not length:
+            return {}
+        body = json.loads(self.rfile.read(length))
+        if not isinstance(body, dict):
+            raise ValueError("The request body must be a JSON object.")
+        return body
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            chunks = len(self.server.naiverag.text_chunks_db)
+            self._send_json(200, {"status": "ok", "chunks": chunks})
+        elif self.path == "/stats":
+            self._send_json(200, self.server.stats())
+        elif self.path == "/metrics":
+            body = metrics.to_prometheus().encode("utf-8")
+            self._send(200, body, "text/plain; version=0.0.4")
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self) -> None:
+        try:
+            body = self._read_json()
+        except ValueError as e:
+            self._send_json(400, {"error": f"Invalid request body: {e}"})
+            return
+
+        try:
+            if self.path == "/query":
+                if not isinstance(body.get("query"), str) or not body["query"]:
+                    self._send_json(400, {"error": "Missing query."})
+                    return
+                result = self.server.answer(body["query"], body.get("filters"))
+            elif self.path == "/ingest":
+                result = self.server.ingest(
+                    body.get("documents"), body.get("removed", [])
+                )
+            else:
+                self._send_json(404, {"error": f"Unknown path {self.path}"})
+                return
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+
+        self._send_json(200, result)
+
+
+class PooledRAGServer(RAGServer):
+    """RAGServer of a pool worker. Ingestions are serialized across the workers
+    with a file lock, start from the index as it is on disk and hot-swap the pool
+    to the updated index."""
+
+    def ingest(self, documents: list | None, removed: list) -> dict:
+        if self.generations is not None:
+            # the pool switches to the published generation by itself
+            return super().ingest(documents, removed)
+
+        with ingest_lock(self.config):
+            with self.lock.writing():
+                # other workers may have ingested since this generation was loaded
+                if os.path.exists(self.naiverag.text_db_storage_file):
+                    self.naiverag.load_db()
+            result = super().ingest(documents, removed)
+        os.kill(os.getppid(), signal.SIGHUP)
+        return result
+
+
+@contextmanager
+def ingest_lock(config: dict) -> Iterator[None]:
+    """Serializes the ingestions of pool workers and the reloads of the pool's
+    parent (POSIX), so the parent never loads the DBs halfway through an
+    ingestion, e.g. a new text DB next to the old vector DB."""
+    import fcntl  # POSIX only, like the worker pool
+
+    os.makedirs(config["dir_vector_db"], exist_ok=True)
+    lock_file = os.path.join(config["dir_vector_db"], ".ingest.lock")
+    with open(lock_file, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def load_pool_rag(config: dict) -> NaiveRAG | GenerationalRAG:
+    """Like `load_rag`, for the parent of a pool. Without generations, the DBs
+    are loaded under the ingest lock of the workers."""
+    if config.get("dir_index"):
+        # a published generation is complete and never changes
+        return load_rag(config)
+    with ingest_lock(config):
+        return load_rag(config)
+
+
+def load_rag(config: dict) -> NaiveRAG | GenerationalRAG:
+    """Creates a NaiveRAG and loads its DB, if there is one. With `dir_index`,
+    creates a GenerationalRAG and builds the first generation if there is none."""
+    if config.get("dir_index"):
+        rag = GenerationalRAG(config)
+        if rag.naiverag is None:
+            rag.rebuild()
+        return rag
+
+    naiverag = NaiveRAG(config)
+    if os.path.exists(naiverag.text_db_storage_file):
+        naiverag.load_db()
+    return naiverag
+
+
+def serve_worker(
+    rag: NaiveRAG | GenerationalRAG, listener: socket.socket, config: dict
+) -> None:
+    """Serves a pool's listening socket until SIGTERM, then drains the requests in
+    flight for up to `server_drain_seconds`."""
+    server = PooledRAGServer(
+        listener.getsockname(), rag, config, bind_and_activate=False
+    )
+    server.socket.close()
+    server.socket = listener
+
+    draining = []
+
+    def on_terminate(signum: int, frame) -> None:
+        if not draining:
+            thread = threading.Thread(
+                target=server.drain, args=(config.get("server_drain_seconds", 30),)
+            )
+            thread.start()
+            draining.append(thread)
+
+    signal.signal(signal.SIGTERM, on_terminate)
+    server.serve_forever()
+    for thread in draining:
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="./config.yaml")
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--watch", action="store_true")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+
+    host = args.host or config.get("server_host", "127.0.0.1")
+    port = args.port or config.get("server_port", 8000)
+    workers = args.workers or config.get("server_workers", 1)
+
+    if workers > 1:
+        if args.watch:
+            parser.error("--watch needs a single worker; run watch.py next to the pool")
+        listener = socket.create_server(
+            (host, port), backlog=RAGServer.request_queue_size
+        )
+        # workers that lose the race for a connection must not block in accept
+        listener.setblocking(False)
+        pool = PreforkPool(
+            listener,
+            lambda: load_pool_rag(config),
+            lambda rag, listener: serve_worker(rag, listener, config),
+            workers,
+            watch=(
+                IndexGenerations(config["dir_index"]).current
+                if config.get("dir_index")
+                else None
+            ),
+        )
+        print(f"Serving on http://{host}:{port} with {workers} workers")
+        try:
+            pool.run()
+        finally:
+            listener.close()
+        return
+
+    server = RAGServer((host, port), load_rag(config), config)
+    stop = threading.Event()
+    if args.watch:
+        threading.Thread(
+            target=watch, args=(config, server.ingest_batches, stop), daemon=True
+        ).start()
+    print(f"Serving on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
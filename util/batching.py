@@ -0,0 +1,193 @@
+import threading
+import time
+from collections.abc import Callable, Hashable, Iterator
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Collects items submitted concurrently by many threads and processes them in
+    batches. A background thread waits up to `window` seconds after the first item
+    of a batch for more items, or until `max_batch_size` items are pending, and then
+    calls `process_batch` once for all of them.
+
+    Items submitted while a batch is processed form the next batch, so under load
+    batches grow without waiting for the window.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[list], list],
+        window: float = 0.002,
+        max_batch_size: int = 64,
+    ) -> None:
+        """
+        Args:
+            process_batch (Callable[[list], list]): Processes a list of items and
+                returns one result per item, in order.
+            window (float, optional): Seconds to wait for more items. Defaults to
+                0.002.
+            max_batch_size (int, optional): Maximum items per batch. Defaults to 64.
+        """
+        self.process_batch = process_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+
+        self._pending = []
+        self._closed = False
+        self._condition = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, item) -> Future:
+        """Adds an item to the next batch.
+
+        Args:
+            item: The item.
+
+        Returns:
+            Future: Resolves to the item's result.
+        """
+        future = Future()
+        with self._condition:
+            if not self._closed:
+                self._pending.append((item, future))
+                self._condition.notify()
+                return future
+
+        # closed: process the item on its own
+        try:
+            future.set_result(self.process_batch([item])[0])
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def __call__(self, item):
+        """Processes an item within a batch, blocking until its result is ready."""
+        return self.submit(item).result()
+
+    def close(self) -> None:
+        """Stops the background thread once the pending items are processed.
+        Items submitted afterwards are processed in the submitting thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    def _next_batch(self) -> list | None:
+        with self._condition:
+            while not self._pending:
+                if self._closed:
+                    return None
+                self._condition.wait()
+
+            deadline = time.monotonic() + self.window
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch = self._pending[: self.max_batch_size]
+            del self._pending[: self.max_batch_size]
+            return batch
+
+    def _run(self) -> None:
+        while (batch := self._next_batch()) is not None:
+            try:
+                results = self.process_batch([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+
+
+class Coalescer:
+    """Runs a computation once for concurrent calls with the same key: callers
+    arriving while it is in flight wait for its result instead of repeating it."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.coalesced = 0
+
+    def run(self, key: Hashable, compute: Callable[[], object]):
+        """Returns the result of `compute`, shared with concurrent calls with the
+        same key. Exceptions are raised in all of them.
+
+        Args:
+            key (Hashable): Identifies the computation.
+            compute (Callable[[], object]): The computation.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(compute())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return future.result()
+
+
+class ReadWriteLock:
+    """Lock that is shared by readers and exclusive for a writer. Waiting writers
+    block new readers, so a stream of queries can't starve an ingestion."""
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self) -> None:
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self) -> None:
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self) -> None:
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self) -> None:
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+    @contextmanager
+    def reading(self) -> Iterator[None]:
+        """Holds the lock shared for the enclosed code."""
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def writing(self) -> Iterator[None]:
+        """Holds the lock exclusively for the enclosed code."""
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -0,0 +1,204 @@
+import os
+import re
+import shutil
+import threading
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds are only serialized within a process
+    fcntl = None
+
+_GENERATION = re.compile(r"gen-(\d{6})")
+
+
+def _fsync_dir(path: str) -> None:
+    """Persists the entries of a directory, e.g. after a rename (POSIX only)."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _link_or_copy(source: str, target: str) -> None:
+    """Hard-links a file, or copies it where links aren't supported."""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _fsync_tree(path: str) -> None:
+    """Flushes all files below a directory to disk."""
+    for root, _, files in os.walk(path):
+        for name in files:
+            with open(os.path.join(root, name), "rb+") as file:
+                os.fsync(file.fileno())
+        _fsync_dir(root)
+
+
+class IndexGenerations:
+    """Versioned index directories with an atomically switched pointer.
+
+    Layout within `dir_index`:
+        - gen-000001/, gen-000002/, ...: one complete index each, with the
+          `text_chunks` and `vector_db` directories of the text and vector DB and,
+          once published, an empty PUBLISHED file
+        - CURRENT: name of the generation that is served
+
+    A generation is built while the current one keeps serving and is only
+    published, by replacing CURRENT, once it is complete and flushed to disk. A
+    crash during a build leaves CURRENT untouched; the unpublished generation is
+    removed by the next garbage collection. Builds hold the `building` lock, so
+    there is one at a time, also across processes.
+    """
+
+    subdirs = ("text_chunks", "vector_db")
+
+    def __init__(self, dir_index: str, keep: int = 2) -> None:
+        """
+        Args:
+            dir_index (str): Directory of the generations.
+            keep (int, optional): Number of published generations to keep, the
+                current one included, so readers of the previous generation can
+                finish. Defaults to 2.
+        """
+        self.dir_index = dir_index
+        self.keep = max(keep, 1)
+        self.pointer_file = os.path.join(dir_index, "CURRENT")
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def building(self) -> Iterator[None]:
+        """Holds the build lock for the enclosed code."""
+        os.makedirs(self.dir_index, exist_ok=True)
+        with self._lock, open(os.path.join(self.dir_index, ".build.lock"), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def current(self) -> str | None:
+        """Returns the name of the current generation, or None before the first
+        one is published."""
+        try:
+            with open(self.pointer_file, "r", encoding="utf-8") as file:
+                return file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.dir_index, name)
+
+    def names(self) -> list:
+        """Returns the names of all generation directories, oldest first."""
+        if not os.path.isdir(self.dir_index):
+            return []
+        return sorted(
+            name for name in os.listdir(self.dir_index) if _GENERATION.fullmatch(name)
+        )
+
+    def config(self, config: dict, name: str) -> dict:
+        """Returns a copy of the config with the DB directories of a generation.
+
+        Args:
+            config (dict): The config.
+            name (str): The generation.
+
+        Returns:
+            dict: The config of the generation.
+        """
+        return {
+            **config,
+            "dir_text_chunks": os.path.join(self.path(name), "text_chunks"),
+            "dir_vector_db": os.path.join(self.path(name), "vector_db"),
+        }
+
+    def create(self, sources: dict | None = None) -> str:
+        """Creates the directory of a new generation, optionally as a copy of
+        existing DB directories so it can be updated incrementally.
+
+        The files are hard-linked instead of copied, so creating a generation
+        takes no time or space for the size of the index. The DBs write new files
+        for their commits and give a file its own copy before they append to it,
+        see `unshare`, so the source generation never changes. Lock files are
+        not linked, so each generation has its own locks.
+
+        Args:
+            sources (dict | None, optional): Directory to copy by subdirectory
+                name ("text_chunks", "vector_db"); missing ones start empty.
+                Defaults to None.
+
+        Returns:
+            str: The name of the new generation.
+        """
+        names = self.names()
+        number = int(_GENERATION.fullmatch(names[-1]).group(1)) + 1 if names else 1
+        name = f"gen-{number:06d}"
+        path = self.path(name)
+
+        os.makedirs(path)
+        for subdir in self.subdirs:
+            source = (sources or {}).get(subdir)
+            if source and os.path.isdir(source):
+                shutil.copytree(
+                    source,
+                    os.path.join(path, subdir),
+                    ignore=shutil.ignore_patterns("*.lock"),
+                    copy_function=_link_or_copy,
+                )
+            else:
+                os.makedirs(os.path.join(path, subdir))
+        return name
+
+    def publish(self, name: str) -> None:
+        """Makes a complete generation the current one. Its files are flushed
+        first, so the pointer never references a generation that is partly on
+        disk.
+
+        Args:
+            name (str): The generation.
+        """
+        with open(os.path.join(self.path(name), "PUBLISHED"), "w"):
+            pass
+        _fsync_tree(self.path(name))
+
+        tmp_file = self.pointer_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as file:
+            file.write(name)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_file, self.pointer_file)
+        _fsync_dir(self.dir_index)
+
+    def collect_garbage(self, in_use: Iterable = ()) -> list:
+        """Removes all generations but the `keep` newest published ones, e.g. the
+        leftovers of interrupted builds. Must hold the `building` lock.
+
+        Args:
+            in_use (Iterable, optional): Generations that are kept in any case,
+                e.g. those still served by this process. Defaults to ().
+
+        Returns:
+            list: The removed generations.
+        """
+        current = self.current()
+        names = self.names()
+        published = [
+            name
+            for name in names
+            if name <= (current or "")
+            and os.path.exists(os.path.join(self.path(name), "PUBLISHED"))
+        ]
+        kept = set(published[-self.keep :]) | set(in_use)
+
+        removed = []
+        for name in names:
+            if name not in kept:
+                # files of a mapped generation stay readable until unmapped (POSIX)
+                shutil.rmtree(self.path(name), ignore_errors=True)
+                removed.append(name)
+        return removed
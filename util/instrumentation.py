@@ -0,0 +1,363 @@
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import math
+import os
+import threading
+import time
+
+# (trace id, names of the enclosing spans) of the current thread or task
+_active_spans = contextvars.ContextVar("active_spans", default=(None, ()))
+
+
+class Histogram:
+    """Latency histogram with logarithmic buckets from 10µs to ~100s, each 25%
+    wider than the previous one, so quantiles are estimated within a few percent
+    at a fixed memory cost."""
+
+    min_value = 1e-5
+    growth = 1.25
+    num_buckets = 74
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (self.num_buckets + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def _bucket(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        bucket = math.ceil(math.log(value / self.min_value, self.growth))
+        return min(bucket, self.num_buckets)
+
+    def _upper_bound(self, bucket: int) -> float:
+        return self.min_value * self.growth**bucket
+
+    def observe(self, value: float) -> None:
+        self.buckets[self._bucket(value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile by interpolating within its bucket.
+
+        Args:
+            q (float): The quantile, e.g. 0.95.
+
+        Returns:
+            float: The estimated value; 0.0 if nothing was observed.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bucket, count in enumerate(self.buckets):
+            if count and cumulative + count >= rank:
+                lower = self._upper_bound(bucket - 1) if bucket else 0.0
+                upper = self._upper_bound(bucket)
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self._upper_bound(self.num_buckets)
+
+
+class _NullSpan:
+    """Span returned while instrumentation is disabled; does nothing."""
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """Times a stage of the pipeline. Can be used in a "with" statement."""
+
+    def __init__(self, metrics: "Metrics", name: str) -> None:
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self) -> "Span":
+        trace_id, names = _active_spans.get()
+        self.trace_id = trace_id or next(self.metrics._trace_ids)
+        self.parent = names[-1] if names else None
+        self._token = _active_spans.set((self.trace_id, names + (self.name,)))
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        duration = time.perf_counter() - self.start
+        _active_spans.reset(self._token)
+        self.metrics.observe(self.name, duration)
+        self.metrics._trace(
+            self.trace_id, self.name, self.parent, duration, exc_type is not None
+        )
+
+
+class Metrics:
+    """Collects latency histograms of pipeline stages (spans) and counters.
+
+    Disabled by default; then `span` returns a shared no-op context manager and
+    `count` returns immediately, so instrumented code pays about one attribute
+    lookup. Enabled with `metrics_enabled`. With `metrics_trace_file`, every
+    finished span is appended to it as a JSON line with its trace id and parent
+    span, which breaks down the latency of single queries.
+
+    Aggregates are exported as JSON lines (`export_jsonl`, one snapshot per line)
+    and in the Prometheus text format (`to_prometheus`, `export_prometheus`).
+    """
+
+    quantiles = (0.5, 0.95, 0.99)
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.trace_file = None
+        self._lock = threading.Lock()
+        self._trace_ids = itertools.count(1)
+        self.reset()
+
+    def configure(self, config: dict) -> None:
+        """Enables or disables instrumentation according to the config.
+
+        Args:
+            config (dict): The config.
+        """
+        self.enabled = config.get("metrics_enabled", False)
+        self.trace_file = config.get("metrics_trace_file") or None
+
+    def reset(self) -> None:
+        """Drops all recorded values."""
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+    def span(self, name: str) -> Span | _NullSpan:
+        """Returns a context manager timing the enclosed code as span `name`.
+
+        Args:
+            name (str): The span, e.g. "embed".
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name)
+
+    def is_active(self, name: str) -> bool:
+        """Whether the current thread or task is within span `name`."""
+        return name in _active_spans.get()[1]
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Records a duration of span `name`.
+
+        Args:
+            name (str): The span.
+            seconds (float): The duration.
+        """
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name: str, value: int | float = 1) -> None:
+        """Increments counter `name`.
+
+        Args:
+            name (str): The counter, e.g. "vectors_scanned".
+            value (int | float, optional): The increment. Defaults to 1.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def _trace(
+        self,
+        trace_id: int,
+        name: str,
+        parent: str | None,
+        duration: float,
+        failed: bool,
+    ) -> None:
+        if self.trace_file is None:
+            return
+        record = {
+            "trace": trace_id,
+            "span": name,
+            "parent": parent,
+            "start": time.time() - duration,
+            "duration": duration,
+            "failed": failed,
+        }
+        with self._lock:
+            with open(self.trace_file, "a", encoding="utf-8") as file:
+                file.write(json.dumps(record) + "\n")
+
+    def snapshot(self) -> dict:
+        """Returns the current aggregates.
+
+        Returns:
+            dict: "spans" with count, sum and quantiles (p50, p95, p99) in seconds
+                per span, and "counters".
+        """
+        with self._lock:
+            spans = {
+                name: {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    **{
+                        f"p{round(q * 100)}": histogram.quantile(q)
+                        for q in self.quantiles
+                    },
+                }
+                for name, histogram in self.histograms.items()
+            }
+            return {
+                "time": time.time(),
+                "spans": spans,
+                "counters": dict(self.counters),
+            }
+
+    def export_jsonl(self, path: str) -> None:
+        """Appends a snapshot to a JSON lines file.
+
+        Args:
+            path (str): The file.
+        """
+        with open(path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(self.snapshot()) + "\n")
+
+    def to_prometheus(self, prefix: str = "naiverag") -> str:
+        """Formats the aggregates in the Prometheus text format: spans as summaries
+        with p50/p95/p99, counters as counters.
+
+        Args:
+            prefix (str, optional): Prefix of the metric names. Defaults to
+                "naiverag".
+
+        Returns:
+            str: The metrics.
+        """
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_span_seconds Latency of pipeline stages.",
+            f"# TYPE {prefix}_span_seconds summary",
+        ]
+        for name, span in sorted(snapshot["spans"].items()):
+            for q in self.quantiles:
+                lines.append(
+                    f'{prefix}_span_seconds{{span="{name}",quantile="{q}"}} '
+                    f"{span[f'p{round(q * 100)}']}"
+                )
+            lines.append(f'{prefix}_span_seconds_sum{{span="{name}"}} {span["sum"]}')
+            lines.append(
+                f'{prefix}_span_seconds_count{{span="{name}"}} {span["count"]}'
+            )
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, path: str) -> None:
+        """Writes the aggregates in the Prometheus text format, e.g. for the
+        textfile collector of the node exporter. The file is replaced atomically.
+
+        Args:
+            path (str): The file.
+        """
+        tmp_file = path + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus())
+        os.replace(tmp_file, path)
+
+
+metrics = Metrics()
+
+
+def instrumented(name: str):
+    """Decorator timing every call of a function, coroutine function or generator
+    function as span `name`. Calls within a span of the same name (e.g. an
+    implementation calling its parent class) are not recorded again.
+
+    Args:
+        name (str): The span.
+    """
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not metrics.enabled or metrics.is_active(name):
+                    return await func(*args, **kwargs)
+                with metrics.span(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(func):
+
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                if not metrics.enabled or metrics.is_active(name):
+                    yield from func(*args, **kwargs)
+                    return
+                # the span covers all items, but is only active while the
+                # generator runs, as every item may be consumed in another context
+                generator = func(*args, **kwargs)
+                trace_id, names = _active_spans.get()
+                trace_id = trace_id or next(metrics._trace_ids)
+                parent = names[-1] if names else None
+                failed = False
+                start = time.perf_counter()
+                try:
+                    while True:
+                        token = _active_spans.set(
+                            (trace_id, _active_spans.get()[1] + (name,))
+                        )
+                        try:
+                            item = next(generator)
+                        except StopIteration:
+                            break
+                        finally:
+                            _active_spans.reset(token)
+                        yield item
+                except Exception:
+                    failed = True
+                    raise
+                finally:
+                    generator.close()
+                    duration = time.perf_counter() - start
+                    metrics.observe(name, duration)
+                    metrics._trace(trace_id, name, parent, duration, failed)
+
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled or metrics.is_active(name):
+                return func(*args, **kwargs)
+            with metrics.span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument_methods(cls: type, spans: dict) -> None:
+    """Wraps the methods a class defines itself with `instrumented`, so every
+    implementation of an abstract base is timed without decorating each one.
+
+    Args:
+        cls (type): The class.
+        spans (dict): Span name by method name.
+    """
+    for method_name, span_name in spans.items():
+        method = cls.__dict__.get(method_name)
+        if method is not None and not getattr(method, "__isabstractmethod__", False):
+            setattr(cls, method_name, instrumented(span_name)(method))
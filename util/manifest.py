@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+
+
+def hash_file(path: str) -> str:
+    """Computes the sha256 hash of a file's content.
+
+    Args:
+        path (str): The file path.
+
+    Returns:
+        str: The hex digest.
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class DocumentManifest:
+    """Tracks every indexed document (size, mtime, content hash) and the ids of the
+    chunks generated from it, so that only added, changed or deleted documents have
+    to be re-indexed."""
+
+    def __init__(self, storage_file: str) -> None:
+        self.storage_file = storage_file
+        self.documents = {}
+
+    def load(self) -> None:
+        """Loads the manifest. A missing manifest is treated as empty."""
+        if not os.path.exists(self.storage_file):
+            self.documents = {}
+            return
+
+        with open(self.storage_file, "r", encoding="utf-8") as file:
+            self.documents = json.load(file)
+
+    def save(self) -> None:
+        """Persists the manifest atomically."""
+        tmp_file = self.storage_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as file:
+            json.dump(self.documents, file, ensure_ascii=False)
+        os.replace(tmp_file, self.storage_file)
+
+    def diff(self, paths: list) -> tuple[list, list]:
+        """Compares the given documents against the manifest.
+
+        Size and mtime are checked first; the content is only hashed when they
+        differ, so unchanged documents cost a single stat call. Documents that
+        were not loaded from a file, e.g. ingested through the API, are never
+        reported as removed.
+
+        Args:
+            paths (list): Paths of all documents currently in the document store.
+
+        Returns:
+            tuple[list, list]: Paths of new or changed documents and paths of
+                documents that were deleted since the last indexing.
+        """
+        changed = [path for path in paths if self._is_changed(path)]
+
+        current = set(paths)
+        removed = [
+            path
+            for path, entry in self.documents.items()
+            if path not in current and entry["hash"] is not None
+        ]
+
+        return changed, removed
+
+    def changes(self, paths: list) -> tuple[list, list]:
+        """Like `diff`, but only for the given documents, e.g. the files reported
+        by a file system watcher; all other documents are assumed unchanged.
+
+        Args:
+            paths (list): Paths of documents that may have been added, changed or
+                deleted.
+
+        Returns:
+            tuple[list, list]: Paths of new or changed documents and paths of
+                indexed documents that no longer exist.
+        """
+        changed, removed = [], []
+
+        for path in paths:
+            if os.path.isfile(path):
+                if self._is_changed(path):
+                    changed.append(path)
+            elif path in self.documents:
+                removed.append(path)
+
+        return changed, removed
+
+    def _is_changed(self, path: str) -> bool:
+        entry = self.documents.get(path)
+        if entry is None:
+            return True
+
+        stat = os.stat(path)
+        if stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"]:
+            return False
+
+        if hash_file(path) == entry["hash"]:
+            # touched but unchanged; remember the new mtime to skip hashing later
+            entry["size"], entry["mtime"] = stat.st_size, stat.st_mtime
+            return False
+
+        return True
+
+    def chunk_ids(self, path: str) -> list:
+        """Returns the chunk ids of an indexed document.
+
+        Args:
+            path (str): The document path.
+
+        Returns:
+            list: The chunk ids; empty if the document isn't indexed.
+        """
+        return self.documents.get(path, {}).get("chunk_ids", [])
+
+    def entry(self, path: str, chunk_ids: list) -> dict:
+        """Describes a document as it is now, to be recorded once its chunks are
+        indexed.
+
+        Args:
+            path (str): The document path.
+            chunk_ids (list): Ids of the document's chunks.
+
+        Returns:
+            dict: The manifest entry.
+        """
+        if not os.path.exists(path):
+            # e.g. documents that were not loaded from the document store
+            return {"size": None, "mtime": None, "hash": None, "chunk_ids": chunk_ids}
+
+        stat = os.stat(path)
+        return {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "hash": hash_file(path),
+            "chunk_ids": chunk_ids,
+        }
+
+    def forget(self, path: str) -> None:
+        """Removes a deleted document.
+
+        Args:
+            path (str): The document path.
+        """
+        self.documents.pop(path, None)
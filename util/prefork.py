@@ -0,0 +1,196 @@
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from collections.abc import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class PreforkPool:
+    """Serves a listening socket from worker processes forked from a parent that
+    loaded the shared state (e.g. the index) once.
+
+    The parent calls `load` and forks `workers` processes that inherit its state
+    and the listening socket; each calls `serve(state, listener)`, which accepts
+    connections until the worker receives SIGTERM and returns once in-flight
+    requests are done. Memory-mapped files stay shared through the OS page cache,
+    and the parent's other objects are shared copy-on-write: the garbage collector
+    is frozen before forking, so workers don't write to their pages.
+
+    Signals to the parent:
+        - SIGHUP: loads a new generation of the state, forks its workers and then
+          stops the workers of the old generation, so the socket is served without
+          a gap.
+        - SIGTERM / SIGINT: stops all workers and returns from `run`.
+    A change of the value returned by `watch` reloads like SIGHUP.
+
+    Workers of the current generation that exit unexpectedly are replaced. The
+    parent's state of a generation is closed (if it has `close`) once all of its
+    workers have exited, since it may share e.g. connections with them.
+    Requires `os.fork`, i.e. a POSIX system.
+    """
+
+    # seconds between checks for exited workers
+    poll_interval = 0.2
+
+    def __init__(
+        self,
+        listener: socket.socket,
+        load: Callable[[], object],
+        serve: Callable[[object, socket.socket], None],
+        workers: int,
+        watch: Callable[[], object] | None = None,
+    ) -> None:
+        """
+        Args:
+            listener (socket.socket): The bound and listening socket.
+            load (Callable[[], object]): Loads the state in the parent.
+            serve (Callable[[object, socket.socket], None]): Serves the socket in
+                a worker until it receives SIGTERM.
+            workers (int): Number of worker processes per generation.
+            watch (Callable[[], object] | None, optional): Polled every
+                `poll_interval`, e.g. the version of the state on disk. Defaults
+                to None.
+        """
+        if not hasattr(os, "fork"):
+            raise RuntimeError("A pre-fork worker pool requires os.fork.")
+
+        self.listener = listener
+        self.load = load
+        self.serve = serve
+        self.workers = workers
+        self.watch = watch
+
+        self.generation = 0
+        # worker pid -> generation
+        self.pids = {}
+        self._reload = False
+        self._stop = False
+
+    def _load_generation(self) -> object:
+        gc.unfreeze()
+        try:
+            state = self.load()
+            self.generation += 1
+            return state
+        finally:
+            gc.freeze()
+
+    def _spawn(self, state: object) -> None:
+        pid = os.fork()
+        if pid:
+            self.pids[pid] = self.generation
+            return
+
+        # worker: the parent handles reloads and stopping the pool
+        status = 0
+        try:
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            self.serve(state, self.listener)
+        except BaseException:
+            import traceback
+
+            traceback.print_exc()
+            status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    def _terminate(self, pids: list) -> None:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _reap(self) -> list:
+        """Collects exited workers and returns the generations they served."""
+        generations = []
+        while self.pids:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if not pid:
+                break
+            generations.append(self.pids.pop(pid, None))
+        return generations
+
+    def _close(self, state: object) -> None:
+        if hasattr(state, "close"):
+            try:
+                state.close()
+            except Exception:
+                logger.exception("Cannot close a retired generation")
+
+    def _on_signal(self, signum: int, frame) -> None:
+        if signum == signal.SIGHUP:
+            self._reload = True
+        else:
+            self._stop = True
+
+    def run(self) -> None:
+        """Serves until SIGTERM or SIGINT; reloads on SIGHUP."""
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._on_signal)
+
+        state = self._load_generation()
+        version = self.watch() if self.watch else None
+        for _ in range(self.workers):
+            self._spawn(state)
+        # generation -> state, closed once the generation's workers have exited
+        retired = {}
+
+        while not self._stop:
+            time.sleep(self.poll_interval)
+
+            if self.watch and (latest := self.watch()) != version:
+                version = latest
+                self._reload = True
+
+            if self._reload:
+                self._reload = False
+                try:
+                    new_state = self._load_generation()
+                except Exception as e:
+                    logger.error(
+                        "Reload failed, keeping generation %d: %s", self.generation, e
+                    )
+                else:
+                    retired[self.generation - 1] = state
+                    state = new_state
+                    old = list(self.pids)
+                    for _ in range(self.workers):
+                        self._spawn(state)
+                    self._terminate(old)
+
+            for generation in self._reap():
+                if generation == self.generation and not self._stop:
+                    self._spawn(state)
+
+            serving = set(self.pids.values())
+            exited = [g for g in retired if g not in serving]
+            for generation in exited:
+                self._close(retired.pop(generation))
+            if exited:
+                # collect the closed generations; the workers are forked already
+                gc.unfreeze()
+                gc.collect()
+                gc.freeze()
+
+        self._terminate(list(self.pids))
+        while self.pids:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            self.pids.pop(pid, None)
+        for old_state in [*retired.values(), state]:
+            self._close(old_state)
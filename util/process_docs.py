@@ -1,7 +1,14 @@
+import functools
+import logging
 import os
+import time
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
 import pymupdf
 import tiktoken
 
+logger = logging.getLogger(__name__)
+
 
 def _get_pdf_paths(dir_docs: str = "./doc_store") -> list:
     """Gets all .pdf files from a given directory.
@@ -23,41 +30,130 @@ def _get_pdf_paths(dir_docs: str = "./doc_store") -> list:
     return paths
 
 
-def pdf_to_txt(dir_docs: str = "./doc_store"):
-    """Converts PDF paths in a given directory to .txt
+def _is_up_to_date(pdf_path: str) -> bool:
+    """Checks whether the .txt of a PDF is newer than the PDF itself.
 
     Args:
-        dir_docs (str, optional): The directory in question. Defaults to "./doc_store".
+        pdf_path (str): The PDF path.
+
+    Returns:
+        bool: True if the PDF doesn't need to be converted again.
     """
-    if not os.path.exists(dir_docs):
-        os.makedirs(dir_docs)
-        return
+    txt_filename = os.path.splitext(pdf_path)[0] + ".txt"
+    return os.path.exists(txt_filename) and os.path.getmtime(
+        txt_filename
+    ) >= os.path.getmtime(pdf_path)
 
-    paths = _get_pdf_paths(dir_docs)
 
-    if not paths:
-        return
+def _convert_pdf(pdf_path: str) -> tuple[int, str | None]:
+    """Converts a single PDF to .txt, streaming page by page to the output file.
+    The text is written to a temporary file first, so a partially converted PDF
+    never shows up as a .txt document. A PDF that can't be converted, e.g. a
+    damaged one, leaves no file behind and is tried again with the next run.
 
-    for p in paths:
+    Args:
+        pdf_path (str): The PDF path.
+
+    Returns:
+        tuple[int, str | None]: Number of converted pages and the error, if the
+            conversion failed.
+    """
+    txt_filename = os.path.splitext(pdf_path)[0] + ".txt"
+    tmp_filename = txt_filename + ".tmp"
+
+    try:
+        with (
+            pymupdf.open(pdf_path) as document,
+            open(tmp_filename, "w", encoding="utf-8") as file,
+        ):
+            for page in document:
+                file.write(page.get_text())
+            pages = len(document)
+        os.replace(tmp_filename, txt_filename)
+    except Exception as e:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        return 0, f"{type(e).__name__}: {e}"
+
+    return pages, None
+
+
+def pdf_to_txt(
+    dir_docs: str = "./doc_store", max_workers: int = None, paths: list = None
+) -> dict:
+    """Converts PDF paths in a given directory to .txt. PDFs whose .txt is newer
+    than the PDF are skipped; the others are converted in parallel processes.
+
+    Args:
+        dir_docs (str, optional): The directory in question. Defaults to "./doc_store".
+        max_workers (int, optional): Number of processes. Defaults to all cores.
+        paths (list, optional): Only convert these PDFs. Defaults to all PDFs
+            within `dir_docs`.
 
-        txt_filename = os.path.splitext(p)[0] + ".txt"
+    Returns:
+        dict: Number of converted, skipped and failed documents, pages and
+            pages/sec, and the error of every PDF that failed ("failures").
+    """
+    stats = {
+        "converted": 0,
+        "skipped": 0,
+        "failed": 0,
+        "failures": {},
+        "pages": 0,
+        "pages_per_second": 0.0,
+    }
 
-        document = pymupdf.open(p)
-        text_content = ""
+    if not os.path.exists(dir_docs):
+        os.makedirs(dir_docs)
+        return stats
+
+    if paths is None:
+        paths = _get_pdf_paths(dir_docs)
+    outdated = [p for p in paths if not _is_up_to_date(p)]
+
+    stats["skipped"] = len(paths) - len(outdated)
+
+    if not outdated:
+        return stats
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(outdated))
+    start = time.perf_counter()
+
+    if max_workers == 1:
+        results = [_convert_pdf(p) for p in outdated]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(
+                executor.map(
+                    _convert_pdf,
+                    outdated,
+                    chunksize=max(1, len(outdated) // (4 * max_workers)),
+                )
+            )
 
-        for page_num in range(len(document)):
-            page = document.load_page(page_num)
-            text_content += page.get_text()
+    duration = time.perf_counter() - start
 
-            with open(txt_filename, "w", encoding="utf-8") as file:
-                file.write(text_content)
+    for path, (pages, error) in zip(outdated, results):
+        if error is None:
+            stats["converted"] += 1
+            stats["pages"] += pages
+        else:
+            logger.warning("Cannot convert %s: %s", path, error)
+            stats["failures"][path] = error
+    stats["failed"] = len(stats["failures"])
+    stats["pages_per_second"] = stats["pages"] / duration if duration else 0.0
 
+    return stats
 
-def get_documents(dir_docs: str = "./doc_store") -> list:
-    """Loads the documents from the txt directory.
+
+def get_document_paths(dir_docs: str = "./doc_store") -> list:
+    """Gets all .txt files from a given directory.
+
+    Args:
+        dir_docs (str, optional): The directory in question. Defaults to "./doc_store".
 
     Returns:
-        list: List of documents
+        list: List of .txt file paths.
     """
     paths = []
     for root, _, files in os.walk(dir_docs):
@@ -66,19 +162,58 @@ def get_documents(dir_docs: str = "./doc_store") -> list:
                 full_path = os.path.join(root, f)
                 paths.append(full_path)
 
-    documents = []
+    return paths
+
+
+def iter_documents(dir_docs: str = "./doc_store", paths: list = None) -> Iterator:
+    """Lazily loads the documents from the txt directory, one at a time.
+
+    Args:
+        dir_docs (str, optional): The directory in question. Defaults to "./doc_store".
+        paths (list, optional): Only load these .txt files. Defaults to all files
+            within `dir_docs`.
+
+    Yields:
+        dict: The next document.
+    """
+    if paths is None:
+        paths = get_document_paths(dir_docs)
 
     for p in paths:
         with open(p, "r", encoding="utf-8") as file:
             document_content = file.read()
-            documents.append(
-                {
-                    "page_content": document_content,
-                    "metadata": {"source": p},
-                }
-            )
 
-    return documents
+        yield {
+            "page_content": document_content,
+            "metadata": {"source": p},
+        }
+
+
+def get_documents(dir_docs: str = "./doc_store", paths: list = None) -> list:
+    """Loads the documents from the txt directory.
+
+    Args:
+        dir_docs (str, optional): The directory in question. Defaults to "./doc_store".
+        paths (list, optional): Only load these .txt files. Defaults to all files
+            within `dir_docs`.
+
+    Returns:
+        list: List of documents
+    """
+    return list(iter_documents(dir_docs, paths))
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(tokenizer: str = "cl100k_base") -> tiktoken.Encoding:
+    """Loads a Tiktoken encoding once per process.
+
+    Args:
+        tokenizer (str, optional): The tokenizer to use. Defaults to "cl100k_base".
+
+    Returns:
+        tiktoken.Encoding: The encoding.
+    """
+    return tiktoken.get_encoding(tokenizer)
 
 
 def encode_string_by_tiktoken(content: str, tokenizer: str = "cl100k_base") -> list:
@@ -91,7 +226,7 @@ def encode_string_by_tiktoken(content: str, tokenizer: str = "cl100k_base") -> l
     Returns:
         list: List of Token-IDs.
     """
-    enc = tiktoken.get_encoding(tokenizer)
+    enc = get_encoding(tokenizer)
     return enc.encode(content)
 
 
@@ -105,5 +240,5 @@ def decode_tokens_by_tiktoken(tokens: list, tokenizer: str = "cl100k_base") -> l
     Returns:
         list: The decoded content.
     """
-    enc = tiktoken.get_encoding(tokenizer)
+    enc = get_encoding(tokenizer)
     return enc.decode(tokens)
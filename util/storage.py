@@ -0,0 +1,184 @@
+import json
+import os
+import re
+import shutil
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not serialized across processes
+    fcntl = None
+
+_VERSIONED = re.compile(r"(.+)-(\d{6})(\.\w+)")
+
+
+class WriterLock:
+    """Exclusive lock of a directory's writer, held across processes (POSIX).
+
+    Readers never take it: they only read what a commit file (e.g. meta.json)
+    references, so whatever the writer appends or creates before replacing that
+    file is invisible to them.
+    """
+
+    def __init__(self, directory: str, name: str = ".writer.lock") -> None:
+        self.path = os.path.join(directory, name)
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> None:
+        """Blocks until the lock is held; does nothing if it already is."""
+        if self._file is not None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        file = open(self.path, "a")
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        self._file = file
+
+    def release(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+@contextmanager
+def commit_lock(directory: str, shared: bool = False) -> Iterator[None]:
+    """Serializes loading a commit with committing (POSIX). A commit holds it
+    exclusively while it replaces the commit file and removes old files, a reader
+    shared while it opens the files of the commit, so a reader never opens files
+    that a concurrent commit removes.
+
+    Args:
+        directory (str): The directory of the commit file.
+        shared (bool, optional): Take it as a reader. Defaults to False.
+    """
+    if fcntl is None or (shared and not os.path.isdir(directory)):
+        yield
+        return
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".commit.lock"), "a") as file:
+        fcntl.flock(file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+
+
+def versioned_name(kind: str, version: int, extension: str) -> str:
+    """Returns the name of a file written by one commit, e.g. vectors-000003.bin."""
+    return f"{kind}-{version:06d}{extension}"
+
+
+def read_json(path: str) -> dict | None:
+    """Reads a JSON file, or returns None if it doesn't exist."""
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def fsync_file(path: str) -> None:
+    if os.path.exists(path):
+        with open(path, "rb+") as file:
+            os.fsync(file.fileno())
+
+
+def commit_json(path: str, payload: dict, synced: list = ()) -> None:
+    """Atomically replaces a commit file, after flushing the files it references
+    to disk, so it never points to data that isn't there after a crash.
+
+    Args:
+        path (str): The commit file.
+        payload (dict): Its content.
+        synced (list, optional): Paths to flush first. Defaults to ().
+    """
+    for synced_path in synced:
+        fsync_file(synced_path)
+
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as file:
+        json.dump(payload, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_file, path)
+
+
+def unshare(path: str) -> bool:
+    """Gives a file its own copy if it is hard-linked elsewhere, e.g. into a new
+    index generation (see `IndexGenerations.create`), before it is changed in
+    place. The other links, and readers of the file, keep the old content.
+
+    Args:
+        path (str): The file.
+
+    Returns:
+        bool: Whether the file was copied; handles of it then read the old copy.
+    """
+    try:
+        if os.stat(path).st_nlink <= 1:
+            return False
+    except FileNotFoundError:
+        return False
+
+    tmp_file = path + ".tmp"
+    shutil.copy2(path, tmp_file)
+    os.replace(tmp_file, path)
+    return True
+
+
+def truncate_lines(path: str, count: int) -> bool:
+    """Cuts a line-based file after its first `count` lines, e.g. to drop lines a
+    crashed writer appended after the last commit. The kept lines are not
+    rewritten, so readers of them are not affected.
+
+    Args:
+        path (str): The file.
+        count (int): Number of lines to keep.
+
+    Returns:
+        bool: Whether the file has at least `count` lines.
+    """
+    if not os.path.exists(path):
+        return count == 0
+
+    offset = 0
+    with open(path, "rb") as file:
+        for _ in range(count):
+            line = file.readline()
+            if not line.endswith(b"\n"):
+                return False
+            offset += len(line)
+        if not file.read(1):
+            return True
+
+    with open(path, "r+b") as file:
+        file.truncate(offset)
+    return True
+
+
+def remove_unreferenced(directory: str, referenced: set, legacy: tuple = ()) -> list:
+    """Removes the versioned files (see `versioned_name`) and temporary files of a
+    directory that are not referenced. Must hold the `WriterLock`.
+
+    Args:
+        directory (str): The directory.
+        referenced (set): Names of the files to keep, e.g. of the last two
+            commits, so readers that just loaded the previous one can open them.
+        legacy (tuple, optional): Unversioned names to remove as well once they
+            are no longer referenced. Defaults to ().
+
+    Returns:
+        list: The removed names.
+    """
+    removed = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name in referenced or not os.path.isfile(path):
+            continue
+        if _VERSIONED.fullmatch(name) or name.endswith(".tmp") or name in legacy:
+            os.remove(path)
+            removed.append(name)
+    return removed
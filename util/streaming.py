@@ -0,0 +1,64 @@
+import queue
+import threading
+from collections.abc import Iterable, Iterator
+
+_DONE = object()
+
+# seconds a blocked producer waits before checking whether to stop
+_STOP_INTERVAL = 0.1
+
+
+def prefetch(iterable: Iterable, maxsize: int) -> Iterator:
+    """Consumes an iterable in a background thread, buffering at most `maxsize`
+    items. The producer blocks while the buffer is full, so a slow consumer applies
+    backpressure instead of letting the buffer grow. Exceptions raised by the
+    producer are re-raised in the consumer.
+
+    Closing the returned generator, e.g. because the consumer failed, stops the
+    producer after its current item and closes the iterable.
+
+    Args:
+        iterable (Iterable): The producing stage.
+        maxsize (int): Maximum number of buffered items.
+
+    Yields:
+        The items of `iterable` in order.
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    error = []
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=_STOP_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put(item):
+                    break
+        except BaseException as e:
+            error.append(e)
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+            put(_DONE)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    try:
+        while (item := buffer.get()) is not _DONE:
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+    if error:
+        raise error[0]
@@ -0,0 +1,276 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from collections.abc import Iterator
+
+logger = logging.getLogger(__name__)
+
+# inotify(7) event bits
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# struct inotify_event without the trailing name: wd, mask, cookie, len
+_EVENT = struct.Struct("iIII")
+
+# seconds between checks whether watching should stop
+_STOP_INTERVAL = 0.5
+
+
+def _load_libc() -> ctypes.CDLL:
+    if not sys.platform.startswith("linux"):
+        raise OSError("inotify is only available on Linux")
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError("The C library doesn't support inotify")
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+class InotifyWatcher:
+    """Gets the changes below a directory from the kernel (Linux inotify), so
+    they are seen at once and watching costs nothing while nothing changes.
+    Subdirectories are watched too, including ones created later.
+
+    Files are reported once they are closed after writing, moved or deleted.
+    Created, moved or deleted directories are reported as a whole, as is the
+    watched directory if the kernel dropped events because too many queued up.
+    """
+
+    mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): The directory to watch.
+
+        Raises:
+            OSError: inotify is not available or the directory can't be watched.
+        """
+        self.path = path
+        self._libc = _load_libc()
+
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, f"inotify_init1 failed: {os.strerror(code)}")
+
+        # watch descriptor -> watched directory
+        self._dirs = {}
+        self._add_tree(path)
+
+    def _add_tree(self, path: str) -> None:
+        for root, _, _ in os.walk(path):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(root), self.mask)
+            if wd >= 0:
+                self._dirs[wd] = root
+                continue
+
+            code = ctypes.get_errno()
+            if code not in (errno.ENOENT, errno.ENOTDIR):  # unless removed meanwhile
+                # e.g. ENOSPC: fs.inotify.max_user_watches is exceeded
+                raise OSError(code, f"Cannot watch {root}: {os.strerror(code)}")
+
+    def _remove_tree(self, path: str) -> None:
+        prefix = os.path.join(path, "")
+        for wd, directory in list(self._dirs.items()):
+            if directory == path or directory.startswith(prefix):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._dirs[wd]
+
+    def changes(self, timeout: float | None = None) -> set:
+        """Waits for changes.
+
+        Args:
+            timeout (float | None, optional): Seconds to wait at most. Defaults to
+                None (until something changes).
+
+        Returns:
+            set: Paths of the changed files and directories; empty on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = (
+                None if deadline is None else max(deadline - time.monotonic(), 0.0)
+            )
+            ready, _, _ = select.select([self._fd], [], [], remaining)
+            if not ready:
+                return set()
+            # events may all be ignored ones, e.g. files being created
+            if changed := self._read():
+                return changed
+
+    def _read(self) -> set:
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                changed.add(self.path)
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+
+            directory = self._dirs.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(path)
+                elif mask & IN_MOVED_FROM:
+                    # the watches would follow the directory out of the tree
+                    self._remove_tree(path)
+                changed.add(path)
+            elif not mask & IN_CREATE:
+                # a created file is reported once it is written and closed
+                changed.add(path)
+
+        return changed
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Finds the changes below a directory by comparing the size and mtime of all
+    files between two scans, every `interval` seconds. Works on every platform and
+    file system, but each scan costs one stat call per file."""
+
+    def __init__(self, path: str, interval: float = 2.0) -> None:
+        """
+        Args:
+            path (str): The directory to watch.
+            interval (float, optional): Seconds between scans. Defaults to 2.0.
+        """
+        self.path = path
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self) -> dict:
+        snapshot = {}
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def changes(self, timeout: float | None = None) -> set:
+        """Waits for changes, see `InotifyWatcher.changes`. Changes are only seen
+        by the scans, so a timeout shorter than the interval may pass without
+        one."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if deadline is not None and deadline < self._next_scan:
+                time.sleep(max(deadline - time.monotonic(), 0.0))
+                return set()
+            time.sleep(max(self._next_scan - time.monotonic(), 0.0))
+            self._next_scan = time.monotonic() + self.interval
+
+            snapshot = self._scan()
+            changed = {
+                path
+                for path in snapshot.keys() | self._snapshot.keys()
+                if snapshot.get(path) != self._snapshot.get(path)
+            }
+            self._snapshot = snapshot
+            if changed:
+                return changed
+
+    def close(self) -> None:
+        pass
+
+
+def create_watcher(
+    path: str, polling: bool = False, interval: float = 2.0
+) -> InotifyWatcher | PollingWatcher:
+    """Watches a directory with inotify, or by polling where it isn't available.
+
+    Args:
+        path (str): The directory to watch.
+        polling (bool, optional): Always poll, e.g. on network file systems that
+            don't report changes. Defaults to False.
+        interval (float, optional): Seconds between polling scans. Defaults to 2.0.
+
+    Returns:
+        InotifyWatcher | PollingWatcher: The watcher.
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(path)
+        except OSError as e:
+            logger.warning(
+                "Cannot use inotify (%s), polling every %ss instead", e, interval
+            )
+    return PollingWatcher(path, interval)
+
+
+def debounce(
+    watcher: InotifyWatcher | PollingWatcher,
+    quiet: float,
+    max_delay: float,
+    stop: threading.Event | None = None,
+) -> Iterator[set]:
+    """Groups the changes of a watcher into bursts, so e.g. copying a folder of
+    files is handled once instead of file by file.
+
+    Args:
+        watcher (InotifyWatcher | PollingWatcher): The watcher.
+        quiet (float): Seconds without a change that end a burst.
+        max_delay (float): Seconds after which a burst ends anyway, so a steady
+            stream of changes is handled regularly.
+        stop (threading.Event | None, optional): Ends watching once set; the
+            burst being collected is dropped. Defaults to None (never).
+
+    Yields:
+        set: The paths changed within a burst.
+    """
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        pending = watcher.changes(timeout=_STOP_INTERVAL)
+        if not pending:
+            continue
+
+        start = time.monotonic()
+        while not stop.is_set():
+            remaining = max_delay - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+            changed = watcher.changes(timeout=min(quiet, remaining))
+            if not changed:
+                break
+            pending |= changed
+
+        if not stop.is_set():
+            yield pending
@@ -0,0 +1,254 @@
+"""Watches the doc store and indexes documents as they are added, changed or
+deleted, without a restart or a scan of the whole doc store.
+
+Changes are reported by inotify on Linux; elsewhere, or with --polling (config
+`watch_polling`), the doc store is scanned every `watch_poll_interval` seconds.
+A burst of changes, e.g. copying a folder of PDFs, is collected until nothing
+changed for `watch_debounce_seconds`. Then only the affected files are
+converted, chunked and embedded; a large burst in batches of `watch_batch_size`
+documents, each committed on its own, at no more than
+`watch_max_documents_per_second` documents per second.
+
+On startup, the documents that changed while nothing was watching are indexed
+first. With `dir_index`, the batches of a burst are committed to one new index
+generation, which is published once the burst is indexed, so the workers of
+`server.py --workers N` switch to it. A single server process can watch by
+itself with `server.py --watch`.
+
+Usage:
+    python watch.py
+    python watch.py --polling
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator
+from itertools import chain
+from rag_pipeline.naiverag import NaiveRAG
+from rag_pipeline.generational import GenerationalRAG
+from util.generations import IndexGenerations
+from util.load_config import load_config
+from util.manifest import DocumentManifest
+from util.process_docs import pdf_to_txt, iter_documents
+from util.watcher import create_watcher, debounce
+
+
+def _load_manifest(config: dict) -> DocumentManifest:
+    """Loads the manifest of the index as it is on disk now, i.e. of the current
+    generation with `dir_index`."""
+    dir_text_chunks = config["dir_text_chunks"]
+    if config.get("dir_index"):
+        generations = IndexGenerations(config["dir_index"])
+        current = generations.current()
+        if current is not None:
+            dir_text_chunks = generations.config(config, current)["dir_text_chunks"]
+
+    manifest = DocumentManifest(os.path.join(dir_text_chunks, "manifest.json"))
+    manifest.load()
+    return manifest
+
+
+def affected_documents(paths: set, config: dict) -> tuple[list, list]:
+    """Converts the changed PDFs among the given paths and finds the documents
+    that have to be (re-)indexed or removed.
+
+    Args:
+        paths (set): Changed files and directories within the doc store; a
+            directory stands for everything below it.
+        config (dict): The config.
+
+    Returns:
+        tuple[list, list]: Paths of new or changed documents and paths of
+            indexed documents that were deleted.
+    """
+    manifest = _load_manifest(config)
+
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.update(os.path.join(root, name) for name in names)
+        elif os.path.isfile(path):
+            files.add(path)
+        # indexed documents at or below a path may have been deleted with it
+        prefix = os.path.join(path, "")
+        files.update(p for p in manifest.documents if p == path or p.startswith(prefix))
+
+    pdfs = sorted(p for p in files if p.endswith(".pdf") and os.path.isfile(p))
+    if pdfs:
+        extraction = pdf_to_txt(
+            config["dir_doc_store"],
+            max_workers=config.get("pdf_max_workers"),
+            paths=pdfs,
+        )
+        if extraction["converted"]:
+            print(
+                f"Converted {extraction['converted']} PDFs ({extraction['pages']} pages, "
+                f"{extraction['pages_per_second']:.1f} pages/s)"
+            )
+        if extraction["failed"]:
+            print(f"{extraction['failed']} PDFs could not be converted")
+
+    documents = {p for p in files if p.endswith(".txt")}
+    documents.update(os.path.splitext(p)[0] + ".txt" for p in pdfs)
+    return manifest.changes(sorted(documents))
+
+
+def index_changes(
+    paths: set,
+    config: dict,
+    ingest: Callable[[Iterator[list], list], object],
+    stop: threading.Event | None = None,
+) -> dict:
+    """Indexes the documents affected by changed paths in rate limited batches.
+
+    Args:
+        paths (set): Changed files and directories within the doc store.
+        config (dict): The config.
+        ingest (Callable[[Iterator[list], list], object]): Indexes the batches of
+            documents of a burst and removes documents by source, e.g.
+            `RAGServer.ingest_batches`.
+        stop (threading.Event | None, optional): Stops after the current batch
+            once set; the remaining documents are indexed on the next start.
+            Defaults to None.
+
+    Returns:
+        dict: Number of "changed" and "removed" documents that were indexed.
+    """
+    changed, removed = affected_documents(paths, config)
+    batch_size = max(config.get("watch_batch_size", 256), 1)
+    rate = config.get("watch_max_documents_per_second", 0)
+    stop = stop or threading.Event()
+
+    batches = [
+        changed[offset : offset + batch_size]
+        for offset in range(0, len(changed), batch_size)
+    ]
+    if removed and not batches:
+        batches = [[]]
+
+    stats = {"changed": 0, "removed": 0}
+    if not batches or stop.is_set():
+        return stats
+
+    def documents() -> Iterator[list]:
+        start = time.monotonic()
+        for batch in batches:
+            if rate:
+                # a batch starts once the documents before it are within the rate
+                delay = start + stats["changed"] / rate - time.monotonic()
+                stop.wait(max(delay, 0.0))
+            if stop.is_set():
+                return
+            yield list(iter_documents(paths=batch))
+            stats["changed"] += len(batch)
+            stats["removed"] = len(removed)
+
+    ingest(documents(), removed)
+    return stats
+
+
+def watch(
+    config: dict,
+    ingest: Callable[[list, list], object],
+    stop: threading.Event | None = None,
+    polling: bool = False,
+) -> None:
+    """Indexes the changes of the doc store until `stop` is set, see the module
+    docstring.
+
+    Args:
+        config (dict): The config.
+        ingest (Callable[[Iterator[list], list], object]): Indexes the batches of
+            documents of a burst and removes documents by source.
+        stop (threading.Event | None, optional): Ends watching once set.
+            Defaults to None (never).
+        polling (bool, optional): Poll even if inotify is available. Defaults to
+            False.
+    """
+    dir_docs = config["dir_doc_store"]
+    os.makedirs(dir_docs, exist_ok=True)
+    stop = stop or threading.Event()
+
+    # watch before catching up, so no change is missed in between
+    watcher = create_watcher(
+        dir_docs,
+        polling=polling or config.get("watch_polling", False),
+        interval=config.get("watch_poll_interval", 2.0),
+    )
+    try:
+        bursts = debounce(
+            watcher,
+            quiet=config.get("watch_debounce_seconds", 2.0),
+            max_delay=config.get("watch_max_delay_seconds", 30.0),
+            stop=stop,
+        )
+        for paths in chain([{dir_docs}], bursts):
+            try:
+                stats = index_changes(paths, config, ingest, stop)
+            except Exception as e:
+                # the files are indexed with their next change or on the next start
+                print(f"Indexing {len(paths)} changed paths failed: {e}")
+                continue
+            if stats["changed"] or stats["removed"]:
+                print(
+                    f"Indexed {stats['changed']} changed and removed "
+                    f"{stats['removed']} deleted documents"
+                )
+    finally:
+        watcher.close()
+
+
+def apply_batches(naiverag: NaiveRAG, batches: Iterator[list], removed: list) -> None:
+    """Indexes batches of documents, committing each; the removed documents are
+    removed with the first one."""
+    for i, documents in enumerate(batches):
+        naiverag.update_db(documents=documents, removed=[] if i else removed)
+
+
+def local_ingest(
+    rag: NaiveRAG | GenerationalRAG,
+) -> Callable[[Iterator[list], list], object]:
+    """Returns an `ingest` function that updates a NaiveRAG in place or publishes
+    one new generation of a GenerationalRAG per burst."""
+    if isinstance(rag, GenerationalRAG):
+
+        def ingest(batches: Iterator[list], removed: list) -> None:
+            with rag.build() as naiverag:
+                apply_batches(naiverag, batches, removed)
+
+        return ingest
+    return lambda batches, removed: apply_batches(rag, batches, removed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="./config.yaml")
+    parser.add_argument("--polling", action="store_true")
+    args = parser.parse_args()
+    # e.g. the fallback to polling is reported by the modules' loggers
+    logging.basicConfig(format="%(message)s")
+
+    config = load_config(args.config)
+
+    if config.get("dir_index"):
+        rag = GenerationalRAG(config)
+    else:
+        rag = NaiveRAG(config)
+        if os.path.exists(rag.text_db_storage_file):
+            rag.load_db()
+
+    print(f"Watching {config['dir_doc_store']}")
+    try:
+        watch(config, local_ingest(rag), polling=args.polling)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        rag.close()
+
+
+if __name__ == "__main__":
+    main()